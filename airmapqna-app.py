@@ -1,30 +1,15 @@
-import os
+import itertools
 import streamlit as st
-from dotenv import load_dotenv
 from datetime import datetime
 
-# OpenAI 및 Azure 라이브러리 임포트
-from openai import AzureOpenAI
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-
-# .env 파일에서 환경 변수 로드
-load_dotenv()
-
-# Azure OpenAI (RAG 및 임베딩용)
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_EMBBEDING_MODEL_NAME = os.getenv("AZURE_OPENAI_EMBBEDING_MODEL_NAME")
-AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME")
-AZURE_OPENAI_EMBBEDING_API_VERSION = os.getenv("AZURE_OPENAI_EMBBEDING_API_VERSION")
-AZURE_OPENAI_CHAT_MODEL_NAME = os.getenv("AZURE_OPENAI_CHAT_MODEL_NAME")
-AZURE_OPENAI_CHAT_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
-
-# Azure AI Search (RAG 검색용)
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
-AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY")
-AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
+# 공통 로직(클라이언트, 질문 분류, RAG/일반 답변)은 qna_core.py에 있고, 이 파일은 화면만 담당
+from answer_cache import get_default_answer_cache
+from chat_history import ChatHistory, split_for_display
+from conversation_memory import ConversationMemory
+from qna_backend import get_default_backend
+from qna_core import format_startup_metrics, load_clients, start_warm_up
+from resilient_calls import caller_stats
+import tracing
 
 # Streamlit 페이지 설정
 st.set_page_config(
@@ -68,144 +53,72 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-@st.cache_resource
-def load_clients():
-    """
-    Azure 및 OpenAI 클라이언트를 초기화하고 캐시합니다.
-    """
-    try:
-        # 1. Azure OpenAI 클라이언트 (RAG용)
-        azure_openai_client = AzureOpenAI(
-            api_version=AZURE_OPENAI_EMBBEDING_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_API_KEY,
-        )
-        
-        # 2. Azure AI Search 클라이언트 (RAG 검색용)
-        search_client = SearchClient(
-            endpoint=AZURE_SEARCH_ENDPOINT,
-            index_name=AZURE_SEARCH_INDEX_NAME,
-            credential=AzureKeyCredential(AZURE_SEARCH_KEY)
-        )
-
-        # 3. Azure OpenAI 클라이언트 (외부검색용)
-        openai_client = AzureOpenAI(
-            api_version=AZURE_OPENAI_EMBBEDING_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_API_KEY,
-        )
-        
-        return azure_openai_client, search_client, openai_client
-    except (ValueError, TypeError, KeyError, Exception) as e:
-        st.error(f"클라이언트 초기화 실패: {e}")
-        return None, None, None
-
-def route_question(query):
-    """
-    질문의 종류를 판단하여 처리 경로를 반환합니다.
-    """
-    query_lower = query.lower()
-
-    if "리눅스" in query_lower or "linux" in query_lower:
-        return "linux"
-    elif "포스트그레" in query_lower or "포스트그레스" in query_lower or "postgres" in query_lower or "postgresql" in query_lower:
-        return "postgres"
-    else:
-        return "wiki"
-
-def get_rag_response(query, azure_openai_client, search_client):
-    """
-    Azure AI Search와 Azure OpenAI를 사용해 RAG 답변을 생성합니다.
-    """
-    try:
-        # 1. 사용자 질문을 임베딩으로 변환 (벡터 검색용)
-        embedding_response = azure_openai_client.embeddings.create(
-            input=[query],
-            model=AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME
-        ).data[0].embedding
-        
-        vector_query = VectorizedQuery(vector=embedding_response, k_nearest_neighbors=3, fields="text_vector")
-
-        # 2. Azure AI Search에서 하이브리드 검색 (텍스트 + 벡터)
-        results = search_client.search(
-            search_text=query,
-            vector_queries=[vector_query],
-            select=["title", "chunk"],
-            top=10
-        )
-
-        # 3. 검색 결과를 컨텍스트로 구성
-        formatted_results = []
-        for result in results:            
-            title = result.get("title", "제목 없음")
-            chunk = result.get("chunk", "")
-            score = result.get('@search.rerank_score', result.get('@search.score', 0.0))
-            if chunk:
-                formatted_results.append(
-                    f"[문서 정보]\n"
-                    f"제목: {title}\n"
-                    f"관련성 점수: {score:.4f}\n\n"
-                    f"[내용]\n{chunk}...\n"
-                )
-        context = "\n\n---\n\n".join(formatted_results)
-        
-        if not context:
-            return "관련된 위키 정보를 찾을 수 없습니다."
-
-        # 4. LLM에 전달할 프롬프트 구성
-        system_message = """
-        당신은 사내 위키 전문가 챗봇입니다.
-        아래에 제공된 위키 문서 내용을 바탕으로 사용자의 질문에 대해 정확하고 상세하게 한국어로 답변해 주세요.
-        문서에 없는 내용은 답변하지 말고, "정보를 찾을 수 없습니다"라고 답변하세요.
-        """
-        
-        response = azure_openai_client.chat.completions.create(
-            model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"## 위키 문서:\n{context}\n\n## 질문:\n{query}"}
-            ],
-            temperature=0.1
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"죄송합니다, RAG 정보를 조회하는 데 문제가 발생했습니다.: {e}"
-
-def get_external_response(query, topic, openai_client):
-    """
-    Azure OpenAI API를 사용해 특정 주제에 대한 일반 답변을 생성합니다.
-    """
-    topic_map = {
-        "linux": "당신은 리눅스 명령어와 쉘 스크립트 전문가입니다.",
-        "postgres": "당신은 PostgreSQL 데이터베이스 성능 튜닝 및 SQL 전문가입니다."
-    }
-    system_message = topic_map.get(topic, "당신은 유용한 AI 어시스턴트입니다.")
-    system_message += " 사용자의 질문에 대해 전문가 수준의 정확한 정보를 한국어로 제공해 주세요. 필요한 경우 코드 예시를 포함해 주세요."
-    system_message += " 당신의 전문분야 외의 정보는 전혀 모릅니다."
-
-    try:
-        response = openai_client.chat.completions.create(
-            model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"죄송합니다, 정보를 조회하는 데 문제가 발생했습니다.: {e}"
-
-def generate_response(query, clients):
-    """응답 생성 함수"""
-    aoai_client, search_client, openai_client = clients
+STAGE_LABELS = {
+    "total": "전체",
+    "retrieve": "검색 (전체)",
+    "embed": "임베딩",
+    "search": "하이브리드 검색",
+    "search_text": "텍스트 검색",
+    "search_vector": "벡터 검색",
+    "context_build": "컨텍스트 구성",
+    "chat": "답변 생성",
+}
+
+def show_latency_panel():
+    """최근 질문들의 단계별 p50/p95 지연과 토큰 사용량 표시"""
+    percentiles = tracing.stage_percentiles("qna")
+    if not percentiles:
+        st.caption("아직 처리한 질문이 없습니다.")
+        return
+    rows = []
+    for stage, label in STAGE_LABELS.items():
+        if stage in percentiles:
+            stats = percentiles[stage]
+            rows.append({"단계": label, "p50": f"{stats['p50'] * 1000:.0f}ms", "p95": f"{stats['p95'] * 1000:.0f}ms", "건수": stats["count"]})
+    st.dataframe(rows, hide_index=True, use_container_width=True)
     
-    topic = route_question(query)
+    usage = tracing.token_usage("qna")
+    col1, col2 = st.columns(2)
+    col1.metric("입력 토큰", f"{usage['prompt_tokens']:,}")
+    col2.metric("출력 토큰", f"{usage['completion_tokens']:,}")
+    st.caption(f"최근 {usage['requests']}건 기준 (임베딩 {usage['embedding_tokens']:,}토큰)"
+               + (", 일부는 추정치" if usage["estimated"] else ""))
+
+    # 외부 API 호출의 재시도·차단·헤지 현황 (재시도나 차단이 있었던 호출만)
+    rows = [
+        {"호출": name, "재시도": stats["retries"], "실패": stats["failures"], "차단": stats["rejected"],
+         "헤지": stats["hedged"], "상태": stats["circuit"]}
+        for name, stats in caller_stats().items()
+        if stats["retries"] or stats["failures"] or stats["rejected"] or stats["hedged"]
+    ]
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+def render_message(message):
+    """메시지 하나 표시 (긴 답변은 앞부분만 보여주고 나머지는 펼쳐서 보기)"""
+    with st.chat_message(message["role"]):
+        head, tail = split_for_display(message["content"])
+        st.markdown(head)
+        if tail:
+            with st.expander("나머지 내용 보기"):
+                st.markdown(tail)
+
+def render_history(history):
+    """보관된 이전 대화는 요청한 페이지만 불러오고, 최근 대화는 메모리에서 바로 표시"""
+    pages = st.session_state.history_pages
+    older = history.load_older(pages)
+    if history.archived_count > len(older):
+        if st.button(f"이전 대화 더 보기 ({history.archived_count - len(older)}개)"):
+            st.session_state.history_pages += 1
+            st.rerun()
+    elif pages and st.button("이전 대화 접기"):
+        st.session_state.history_pages = 0
+        st.rerun()
     
-    if topic == "wiki":
-        return get_rag_response(query, aoai_client, search_client)
-    else:
-        return get_external_response(query, topic, openai_client)
+    for message in older:
+        render_message(message)
+    for message in history.recent:
+        render_message(message)
 
 def main():
     # 헤더
@@ -223,40 +136,67 @@ def main():
         
         st.header("⚙️설정")
         if st.button("대화 기록 초기화"):
-            st.session_state.messages = []
+            if "history" in st.session_state:
+                st.session_state.history.clear()
+            if "memory" in st.session_state:
+                st.session_state.memory.clear()
+            st.session_state.history_pages = 0
             st.rerun()
+        if "history" in st.session_state:
+            history = st.session_state.history
+            st.caption(f"대화 기록: 최근 {len(history.recent)}개 표시 중 / 전체 {len(history)}개")
+        
+        st.header("📊 답변 캐시")
+        cache_stats = get_default_answer_cache().stats()
+        col1, col2 = st.columns(2)
+        col1.metric("적중률", f"{cache_stats['hit_rate']:.0%}", f"{cache_stats['hits']}/{cache_stats['lookups']}건", delta_color="off")
+        col2.metric("절약한 시간", f"{cache_stats['latency_saved_seconds']:.1f}초")
+        
+        st.header("🧵 답변 실행기")
+        backend_stats = get_default_backend().stats()
+        col1, col2 = st.columns(2)
+        col1.metric("실행 / 대기", f"{backend_stats['running']} / {backend_stats['queued']}",
+                    f"최대 {backend_stats['max_pending']}건", delta_color="off")
+        col2.metric("같은 질문 합류", f"{backend_stats['coalesced']}건", f"거절 {backend_stats['rejected']}건", delta_color="off")
+        
+        st.header("⏱️ 시작 성능")
+        st.caption(format_startup_metrics())
+        
+        st.header("📈 단계별 지연")
+        show_latency_panel()
         
         st.header("🔎 사용 팁")
-        st.write("✓&nbsp;&nbsp;리눅스 관련 질문시 'linux' 또는 '리눅스' 포함")
-        st.write("✓&nbsp;&nbsp;PostgreSQL 관련 질문시 'postgres' 또는 'postgresql' 포함")
-        st.write("✓&nbsp;&nbsp;그외 키워드에 대한 질문은 위키에서만 검색되고, 다른 정보 검색은 불가능합니다.")
+        st.write("✓&nbsp;&nbsp;질문은 의미로 자동 분류됩니다. 키워드 없이 '디스크 사용량 확인 명령어', 'vacuum 주기 설정'처럼 물어봐도 리눅스/PostgreSQL 답변으로 연결됩니다.")
+        st.write("✓&nbsp;&nbsp;분류가 애매한 짧은 질문은 '리눅스', 'PostgreSQL'을 함께 적으면 더 정확합니다.")
+        st.write("✓&nbsp;&nbsp;리눅스/PostgreSQL이 아닌 질문은 위키에서만 검색되고, 다른 정보 검색은 불가능합니다.")
 
-    # 클라이언트 로드
-    clients = load_clients()
-    if not all(clients):
+    # 클라이언트 로드 (프로세스에서 한 번만 생성되고, 연결은 백그라운드에서 미리 열어 둠)
+    if not all(load_clients()):
         st.error("클라이언트 초기화에 실패했습니다. 환경 변수를 확인해주세요.")
         return
-
-    # 세션 상태 초기화
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    start_warm_up()
+
+    # 세션 상태 초기화 (최근 대화만 세션 메모리에 두고, 오래된 대화는 chat_history 저장소로 옮김)
+    if "history" not in st.session_state:
+        st.session_state.history = ChatHistory()
+    if "history_pages" not in st.session_state:
+        st.session_state.history_pages = 0
+    if "memory" not in st.session_state:
+        # 후속 질문을 위한 대화 문맥 (최근 대화 + 오래된 대화의 누적 요약, 토큰 한도 고정)
+        st.session_state.memory = ConversationMemory()
+    history = st.session_state.history
 
     # 초기 메시지 추가 (첫 실행 시에만)
-    if not st.session_state.messages:
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": "안녕하세요! 에어맵 서비스 운영하면서 궁금한 것들을 물어보세요."
-        })
+    if not len(history):
+        history.append("assistant", "안녕하세요! 에어맵 서비스 운영하면서 궁금한 것들을 물어보세요.")
 
     # 채팅 기록 표시
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_history(history)
 
     # 사용자 입력 처리
     if prompt := st.chat_input("질문을 입력하세요..."):
         # 사용자 메시지 추가
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        history.append("user", prompt)
         
         # 사용자 메시지 표시
         with st.chat_message("user"):
@@ -264,12 +204,22 @@ def main():
         
         # 어시스턴트 응답 생성 및 표시
         with st.chat_message("assistant"):
+            metrics = {}
+            # 답변은 프로세스 공용 실행기에서 생성 (동시에 들어온 같은 질문은 하나의 파이프라인 결과를 함께 받음)
+            stream = get_default_backend().submit(prompt, metrics, st.session_state.memory)
+            # 첫 토큰이 올 때까지만 스피너를 보여주고, 이후에는 도착하는 대로 출력
             with st.spinner("답변을 생성하고 있습니다..."):
-                response = generate_response(prompt, clients)
-                st.markdown(response)
+                first_piece = next(stream, "")
+            response = st.write_stream(itertools.chain([first_piece], stream))
+            timing = f"첫 토큰 {metrics.get('ttft', 0.0):.2f}초 · 전체 {metrics.get('total', 0.0):.2f}초"
+            if metrics.get("coalesced"):
+                timing += " · 진행 중이던 같은 질문의 답변 공유"
+            if "context_tokens_saved" in metrics:
+                timing += f" · 컨텍스트 {metrics['context_tokens']}토큰 ({metrics['context_tokens_saved']}토큰 절약)"
+            st.caption(timing)
         
         # 어시스턴트 메시지 저장
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        history.append("assistant", response)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,163 +1,157 @@
+# 공통 로직(클라이언트, 질문 분류, RAG/일반 답변)은 qna_core.py에 있고, 이 파일은 콘솔 입출력만 담당
+import argparse
+import json
 import os
-from dotenv import load_dotenv
-
-# OpenAI 및 Azure 라이브러리 임포트
-from openai import AzureOpenAI
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-
-# .env 파일에서 환경 변수 로드
-load_dotenv()
-# Azure OpenAI (RAG 및 임베딩용)
-AZURE_OPENAI_API_KEY=os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT=os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_EMBBEDING_MODEL_NAME=os.getenv("AZURE_OPENAI_EMBBEDING_MODEL_NAME")
-AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME=os.getenv("AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME")
-AZURE_OPENAI_EMBBEDING_API_VERSION=os.getenv("AZURE_OPENAI_EMBBEDING_API_VERSION")
-AZURE_OPENAI_CHAT_MODEL_NAME=os.getenv("AZURE_OPENAI_CHAT_MODEL_NAME")
-AZURE_OPENAI_CHAT_DEPLOYMENT_NAME=os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
-AZURE_OPENAI_CHAT_API_VERSION=os.getenv("AZURE_OPENAI_CHAT_API_VERSION")
-
-# Azure AI Search (RAG 검색용)
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
-AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY") # 검색용 쿼리 키
-AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
-
-def load_clients():
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from answer_cache import get_default_answer_cache
+from conversation_memory import ConversationMemory
+from qna_core import format_startup_metrics, generate_answer, load_clients, start_warm_up
+from rate_limiter import TokenBucketLimiter
+from resilient_calls import format_caller_stats
+import tracing
+
+def print_cache_stats():
+    """답변 캐시 적중률과 절약한 시간 출력"""
+    stats = get_default_answer_cache().stats()
+    print(f"답변 캐시: {stats['hits']}/{stats['lookups']}건 적중 ({stats['hit_rate']:.0%}), "
+          f"절약한 시간 {stats['latency_saved_seconds']:.1f}초")
+
+def print_latency_stats():
+    """이번 실행에서 처리한 질문들의 단계별 p50/p95 지연과 토큰 사용량 출력"""
+    percentiles = tracing.stage_percentiles("qna")
+    if not percentiles:
+        return
+    print("단계별 지연 (p50 / p95):")
+    for stage, stats in percentiles.items():
+        print(f"  - {stage}: {stats['p50'] * 1000:.0f}ms / {stats['p95'] * 1000:.0f}ms ({stats['count']}건)")
+    usage = tracing.token_usage("qna")
+    print(f"토큰 사용량: 입력 {usage['prompt_tokens']:,}, 출력 {usage['completion_tokens']:,}, "
+          f"임베딩 {usage['embedding_tokens']:,}" + (" (일부 추정치)" if usage["estimated"] else ""))
+    resilience = format_caller_stats()
+    if resilience:
+        print(f"재시도/차단:\n{resilience}")
+
+def load_batch_questions(input_path):
     """
-    Azure 및 OpenAI 클라이언트를 초기화하고 캐시합니다.
+    질문 JSONL 읽기. 한 줄에 {"id": ..., "question": ...} 하나 ("question" 대신 "query"도 가능).
+    id가 없으면 줄 번호를 id로 사용합니다.
     """
+    questions = []
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = item.get("question") or item.get("query")
+            if not question:
+                print(f"{line_number}번째 줄에 질문이 없어 건너뜀")
+                continue
+            questions.append({"id": str(item.get("id", line_number)), "question": question})
+    return questions
+
+def load_completed_ids(output_path):
+    """이전 실행의 결과 파일에서 오류 없이 끝난 질문 id 목록 (중단된 배치를 이어서 실행할 때 사용)"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 중단되면서 마지막 줄이 잘린 경우
+            if not result.get("error"):
+                completed.add(result["id"])
+    return completed
+
+def answer_batch_question(item, limiter):
+    """질문 하나에 답하고 결과 레코드 반환 (질문마다 대화 문맥 없이 독립적으로 처리)"""
+    limiter.acquire()
+    metrics = {}
+    started_at = time.perf_counter()
     try:
-        # 1. Azure OpenAI 클라이언트 (RAG용)
-        azure_openai_client = AzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_version=AZURE_OPENAI_EMBBEDING_API_VERSION,
-        )
-        
-        # 2. Azure AI Sear클라이언트ch  (RAG 검색용)
-        search_client = SearchClient(
-            credential=AzureKeyCredential(AZURE_SEARCH_KEY),
-            endpoint=AZURE_SEARCH_ENDPOINT,
-            index_name=AZURE_SEARCH_INDEX_NAME,
-        )
-
-        # 3. Azure OpenAI 클라이언트 (외부검색용)
-        openai_client = AzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_version=AZURE_OPENAI_CHAT_API_VERSION,
-        )
-        
-        return azure_openai_client, search_client, openai_client
-    except (ValueError, TypeError, KeyError, Exception) as e:
-        print(f"클라이언트 초기화 실패: {e}")
-        return None, None, None
-
-# --- 핵심 로직 함수들 ---
-def route_question(query):
-    """
-    질문의 종류를 판단하여 처리 경로를 반환합니다.
-    """
-    query_lower = query.lower()
-
-    if "리눅스" in query_lower or "linux" in query_lower:
-        return "linux"
-    elif "포스트그레" in query_lower or "포스트그레스" in query_lower or "postgres" in query_lower or "postgresql" in query_lower:
-        return "postgres"
-    else:
-        return "wiki"
-
-def get_rag_response(query, azure_openai_client, search_client):
-    """
-    Azure AI Search와 Azure OpenAI를 사용해 RAG 답변을 생성합니다.
-    """
-    try:
-        # 1. 사용자 질문을 임베딩으로 변환 (벡터 검색용)
-        embeddingresponse  = azure_openai_client.embeddings.create(
-            input=[query],
-            model=AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME
-        ).data[0].embedding
-        
-        vector_query = VectorizedQuery(vector=embeddingresponse, k_nearest_neighbors=3, fields="text_vector")
-
-        # 2. Azure AI Search에서 하이브리드 검색 (텍스트 + 벡터)
-        results = search_client.search(
-            search_text=query,
-            vector_queries=[vector_query],
-            select=["title", "chunk"], # 반환받고 싶은 필드 지정 (실제 필드명으로 수정)
-            top=10 # 검색 결과의 상위 10개 문서만 가져오기
-        )
-
-        # 3. 검색 결과를 컨텍스트로 구성
-        formatted_results = []
-        for result in results:            
-            title = result.get("title", "제목 없음")
-            chunk = result.get("chunk", "")
-            score = result.get('@search.rerv_score', result.get('@search.score', 0.0))
-            if chunk:
-                formatted_results.append(
-                    f"[문서 정보]\n"
-                    f"제목: {title}\n"
-                    f"관련성 점수: {score:.4f}\n\n"
-                    f"[내용]\n{chunk}...\n"
-                )
-        context = "\n\n---\n\n".join(formatted_results)
-        
-        if not context:
-            return "관련된 위키 정보를 찾을 수 없습니다."
-
-        # 4. LLM에 전달할 프롬프트 구성hi
-        system_message = """
-        당신은 사내 위키 전문가 챗봇입니다.
-        아래에 제공된 위키 문서 내용을 바탕으로 사용자의 질문에 대해 정확하고 상세하게 한국어로 답변해 주세요.
-        문서에 없는 내용은 답변하지 말고, "정보를 찾을 수 없습니다"라고 답변하세요.
-        """
-        
-        response = azure_openai_client.chat.completions.create(
-            model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"## 위키 문서:\n{context}\n\n## 질문:\n{query}"}
-            ],
-            temperature=0.1
-        )
-        return response.choices[0].message.content
+        answer = "".join(generate_answer(item["question"], metrics))
+        error = metrics.get("error")
     except Exception as e:
-        return f"죄송합니다, RAG 정보를 조회하는 데 문제가 발생했습니다.: {e}"
+        answer, error = "", f"{type(e).__name__}: {e}"
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": answer,
+        "route": metrics.get("route", "wiki"),
+        "cache_hit": metrics.get("cache_hit", False),
+        "latency_seconds": round(time.perf_counter() - started_at, 3),
+        "ttft_seconds": round(metrics.get("ttft", 0.0), 3),
+        "prompt_tokens": metrics.get("prompt_tokens", 0),
+        "completion_tokens": metrics.get("completion_tokens", 0),
+        "tokens_estimated": metrics.get("tokens_estimated", False),
+        "context_tokens": metrics.get("context_tokens", 0),
+        "context_tokens_saved": metrics.get("context_tokens_saved", 0),
+        "error": error,
+    }
 
-def get_external_response(query, topic, openai_client):
+def run_batch(input_path, output_path, concurrency=4, rpm=60, resume=True):
     """
-    Azure OpenAI API를 사용해 특정 주제에 대한 일반 답변을 생성합니다.
+    질문 JSONL을 동시에 concurrency개씩, 분당 rpm개 이하로 처리하고 끝나는 대로 결과 JSONL에 한 줄씩 추가합니다.
+    resume=True이면 결과 파일에 이미 성공한 질문은 건너뛰므로 중단된 배치를 그대로 다시 실행하면 됩니다.
     """
-    topic_map = {
-        "linux": "당신은 리눅스 명령어와 쉘 스크립트 전문가입니다.",
-        "postgres": "당신은 PostgreSQL 데이터베이스 성능 튜닝 및 SQL 전문가입니다."
-    }
-    system_message = topic_map.get(topic, "당신은 유용한 AI 어시스턴트입니다.")
-    system_message += " 사용자의 질문에 대해 전문가 수준의 정확한 정보를 한국어로 제공해 주세요. 필요한 경우 코드 예시를 포함해 주세요."
-    system_message += " 당신의 전문분야 외의 정보는 전혀 모릅니다."
-
+    if not all(load_clients()):
+        return
+    start_warm_up()
+
+    questions = load_batch_questions(input_path)
+    completed = load_completed_ids(output_path) if resume else set()
+    pending = [item for item in questions if item["id"] not in completed]
+    print(f"질문 {len(questions)}개 중 {len(pending)}개 처리 (이미 완료 {len(questions) - len(pending)}개), "
+          f"동시 실행 {concurrency}개, 분당 {rpm}개")
+    if not pending:
+        return
+
+    limiter = TokenBucketLimiter(rpm=rpm)
+    results = []
+    started_at = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="qna-batch")
     try:
-        response = openai_client.chat.completions.create(
-            model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME, # Azure의 배포된 모델 사용
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.3
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"죄송합니다, 정보를 조회하는 데 문제가 발생했습니다.: {e}"
-
-def main():
-    """콘솔에서 챗봇을 실행하는 메인 함수입니다."""
-    aoai_client, search_client, openchat_client = load_clients()
-    if not all([aoai_client, search_client]):
+        with open(output_path, "a" if resume else "w", encoding="utf-8") as output:
+            futures = [executor.submit(answer_batch_question, item, limiter) for item in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                # 결과는 이 스레드에서만 쓰고, 중단돼도 남도록 한 줄씩 바로 flush
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                results.append(result)
+                status = f"오류: {result['error']}" if result["error"] else f"{result['route']}, {result['latency_seconds']:.2f}초"
+                print(f"[{len(results)}/{len(pending)}] {result['id']} ({status})")
+    except KeyboardInterrupt:
+        print("\n중단되었습니다. 같은 명령으로 다시 실행하면 남은 질문부터 이어서 처리합니다.")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started_at
+    latencies = [result["latency_seconds"] for result in results]
+    failed = sum(1 for result in results if result["error"])
+    print("=" * 40)
+    print(f"처리 {len(results)}개 (실패 {failed}개), {elapsed:.1f}초")
+    if latencies:
+        print(f"지연 시간 p50 {tracing.percentile(latencies, 50):.2f}초, p95 {tracing.percentile(latencies, 95):.2f}초")
+        print(f"토큰 사용량: 입력 {sum(r['prompt_tokens'] for r in results):,}, 출력 {sum(r['completion_tokens'] for r in results):,}, "
+              f"컨텍스트 압축으로 절약 {sum(r['context_tokens_saved'] for r in results):,}")
+    print_cache_stats()
+    resilience = format_caller_stats()
+    if resilience:
+        print(f"재시도/차단:\n{resilience}")
+
+def run_console():
+    """콘솔에서 질문을 하나씩 입력받아 답변합니다."""
+    if not all(load_clients()):
         return # 클라이언트 로드 실패 시 종료
+    start_warm_up()  # 질문을 입력하는 동안 연결과 캐시를 미리 준비
     
+    memory = ConversationMemory()  # 후속 질문을 위한 대화 문맥
+
     print("=" * 40)
     print("  통합 정보 검색 콘솔 챗봇")
     print("  (종료하려면 'exit' 또는 '종료'를 입력하세요)")
@@ -168,20 +162,47 @@ def main():
             # 사용자 입력 받기
             query = input("질문을 입력하세요: ").strip()
             if query.lower() in ["exit", "종료"]:
+                print_cache_stats()
+                print_latency_stats()
+                print(f"시작 성능: {format_startup_metrics()}")
                 print("챗봇을 종료합니다. 감사합니다!")
                 break
 
-            topic = route_question(query)
-            if topic == "wiki":
-                response = get_rag_response(query, aoai_client, search_client)
-            else:
-                response = get_external_response(query, topic, openchat_client)
-
-            print(f"답변: {response}\n")
+            metrics = {}
+            response = generate_answer(query, metrics, memory)
+
+            # 토큰이 도착하는 대로 바로 출력
+            print("답변: ", end="", flush=True)
+            for piece in response:
+                print(piece, end="", flush=True)
+            timing = f"첫 토큰 {metrics.get('ttft', 0.0):.2f}초, 전체 {metrics.get('total', 0.0):.2f}초"
+            if "context_tokens_saved" in metrics:
+                timing += f", 컨텍스트 {metrics['context_tokens']}토큰 ({metrics['context_tokens_saved']}토큰 절약)"
+            print(f"\n({timing})\n")
         except (KeyboardInterrupt, EOFError):
-            print("\n챗봇을 종료합니다. 감사합니다!")
+            print()
+            print_cache_stats()
+            print_latency_stats()
+            print(f"시작 성능: {format_startup_metrics()}")
+            print("챗봇을 종료합니다. 감사합니다!")
             break
-        
+
+
+def main():
+    """콘솔 챗봇 실행. --batch를 주면 질문 파일을 일괄 처리합니다."""
+    parser = argparse.ArgumentParser(description="에어맵 운영 Q&A 콘솔 챗봇")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL", help="질문 JSONL 파일을 일괄 처리")
+    parser.add_argument("--output", default="answers.jsonl", help="일괄 처리 결과 JSONL 경로 (기본값: answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 처리할 질문 수")
+    parser.add_argument("--rpm", type=int, default=60, help="분당 최대 질문 수")
+    parser.add_argument("--no-resume", action="store_true", help="기존 결과 파일을 무시하고 처음부터 처리")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.concurrency, args.rpm, resume=not args.no_resume)
+    else:
+        run_console()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
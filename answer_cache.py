@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite3"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # 이 코사인 유사도 이상이면 같은 질문으로 취급
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+INDEX_VERSION_BLOB_NAME = "_index_version.json"  # parse_pdf_storage_pages.py가 수집할 때마다 갱신
+INDEX_VERSION_REFRESH_SECONDS = 300
+
+
+class SemanticAnswerCache:
+    """
+    질문 임베딩의 코사인 유사도로 이전에 답변한 비슷한 질문을 찾아 답변을 재사용합니다.
+    항목은 위키 인덱스 버전별로 저장되고, 버전이 바뀌면 이전 버전 항목은 모두 버립니다.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_hours=ANSWER_CACHE_TTL_HOURS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = []  # (id, 답변, 원래 소요 시간, 저장 시각)
+        self._vectors = []
+        self._matrix = None  # 정규화된 질문 벡터 행렬 (조회 시 한 번의 행렬 곱으로 비교)
+        self._stats = {"lookups": 0, "hits": 0, "latency_saved_seconds": 0.0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT, query TEXT, vector BLOB,"
+            " answer TEXT, latency REAL, created_at REAL)"
+        )
+        self._db.commit()
+
+    def _use_version(self, version):
+        # 인덱스 버전이 바뀌면 이전 버전 답변을 버리고 현재 버전 항목만 메모리에 적재
+        if version == self._version:
+            return
+        self._db.execute("DELETE FROM answers WHERE version != ? OR created_at < ?",
+                         (version, time.time() - self.ttl_seconds))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT id, vector, answer, latency, created_at FROM answers WHERE version = ? ORDER BY id",
+            (version,),
+        ).fetchall()
+        self._version = version
+        self._entries = [(row[0], row[2], row[3], row[4]) for row in rows]
+        self._vectors = [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+        self._matrix = None
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector, version):
+        """비슷한 질문의 답변이 있으면 (답변, 유사도), 없으면 None 반환"""
+        started_at = time.perf_counter()
+        query = self._normalize(vector)
+        with self._lock:
+            self._use_version(version)
+            self._stats["lookups"] += 1
+            if not self._vectors:
+                return None
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            _, answer, latency, created_at = self._entries[best]
+            if similarity < self.threshold or created_at < time.time() - self.ttl_seconds:
+                return None
+
+            self._stats["hits"] += 1
+            self._stats["latency_saved_seconds"] += max(0.0, latency - (time.perf_counter() - started_at))
+            return answer, similarity
+
+    def store(self, query_text, vector, answer, version, latency):
+        """답변을 인덱스 버전과 함께 저장 (latency는 캐시 없이 답변을 만드는 데 걸린 시간)"""
+        normalized = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._use_version(version)
+            cursor = self._db.execute(
+                "INSERT INTO answers (version, query, vector, answer, latency, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (version, query_text, normalized.tobytes(), answer, latency, now),
+            )
+            self._entries.append((cursor.lastrowid, answer, latency, now))
+            self._vectors.append(normalized)
+            self._matrix = None
+
+            # 한도를 넘으면 가장 오래된 항목부터 삭제
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                removed = [(entry[0],) for entry in self._entries[:overflow]]
+                self._db.executemany("DELETE FROM answers WHERE id = ?", removed)
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+            self._db.commit()
+
+    def stats(self):
+        """조회 수, 적중 수, 적중률, 절약한 응답 시간(초) 반환"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+_index_version = {"value": None, "checked_at": 0.0}
+
+
+def get_default_answer_cache():
+    """프로세스 전체에서 공유하는 답변 캐시"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SemanticAnswerCache()
+        return _default_cache
+
+
+def get_index_version():
+    """
+    현재 위키 인덱스 버전을 반환합니다.
+    WIKI_INDEX_VERSION 환경 변수가 있으면 그 값을, 없으면 수집 스크립트가 Storage에 기록한
+    _index_version.json을 몇 분 간격으로 다시 읽어서 사용합니다.
+    """
+    if os.getenv("WIKI_INDEX_VERSION"):
+        return os.getenv("WIKI_INDEX_VERSION")
+
+    now = time.time()
+    if now - _index_version["checked_at"] < INDEX_VERSION_REFRESH_SECONDS:
+        return _index_version["value"] or "unversioned"
+    _index_version["checked_at"] = now
+
+    connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not connection_string:
+        return _index_version["value"] or "unversioned"
+    try:
+        from azure.storage.blob import BlobClient
+
+        blob_client = BlobClient.from_connection_string(
+            connection_string,
+            container_name=os.getenv("AZURE_STORAGE_CONTAINER_NAME", "documents"),
+            blob_name=INDEX_VERSION_BLOB_NAME,
+        )
+        _index_version["value"] = json.loads(blob_client.download_blob().readall())["version"]
+    except Exception as e:
+        print(f"인덱스 버전 조회 실패: {e}")
+    return _index_version["value"] or "unversioned"
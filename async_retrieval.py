@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import hashlib
+import os
+import threading
+
+from dotenv import load_dotenv
+
+import tracing
+from embedding_cache import get_default_cache, get_query_embedding
+from local_lexical_index import get_default_lexical_index
+from local_vector_index import LocalSearchClient
+from resilient_calls import get_caller
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RAG_RETRIEVAL_TIMEOUT_SECONDS", "15"))  # 검색 전체를 기다리는 최대 시간
+RRF_K = 60  # reciprocal rank fusion 상수 (순위 1과 2의 점수 차이를 완만하게)
+SEARCH_TOP = 10
+VECTOR_K = 3
+SELECT_FIELDS = ["title", "chunk"]
+VECTOR_FIELD = "text_vector"
+
+_loop = None
+_loop_lock = threading.Lock()
+_default_retriever = None
+_default_retriever_lock = threading.Lock()
+
+
+def _get_loop():
+    """
+    비동기 클라이언트를 계속 재사용할 수 있도록 백그라운드 스레드에서 하나의 이벤트 루프를 돌립니다.
+    (Streamlit은 스크립트를 매번 다른 스레드에서 실행하므로 asyncio.run을 매번 호출하면 연결을 재사용할 수 없음)
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-async-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(coro, timeout=None):
+    """
+    백그라운드 이벤트 루프에서 코루틴을 실행하고 결과를 동기적으로 반환.
+    timeout초가 지나면 루프 안에서 코루틴을 취소하고 TimeoutError를 발생시킵니다. (루프에 작업이 남지 않음)
+    """
+    context = contextvars.copy_context()
+
+    async def run_in_caller_context():
+        # 호출한 스레드의 컨텍스트 변수(진행 중인 추적 span)를 이어받아서 실행
+        for variable, value in context.items():
+            variable.set(value)
+        return await asyncio.wait_for(coro, timeout)
+
+    try:
+        return asyncio.run_coroutine_threadsafe(run_in_caller_context(), _get_loop()).result()
+    except asyncio.TimeoutError as e:
+        # 코루틴이 직접 발생시킨 시간 초과(메시지 있음)는 그대로 전달
+        if timeout is None or e.args:
+            raise
+        raise TimeoutError(f"비동기 작업이 {timeout:g}초 안에 끝나지 않았습니다") from None
+
+
+def select_fields():
+    """
+    검색 결과로 받을 필드 목록.
+    컨텍스트 압축(context_packer)이 청크 간 유사도를 계산할 수 있도록 기본으로 벡터 필드도 받습니다.
+    (인덱스에서 벡터 필드가 retrievable이 아니면 RAG_CONTEXT_USE_VECTORS=false로 설정)
+    """
+    if os.getenv("RAG_CONTEXT_USE_VECTORS", "true").lower() == "false":
+        return SELECT_FIELDS
+    return SELECT_FIELDS + [VECTOR_FIELD]
+
+
+def use_local_lexical():
+    """RAG_LEXICAL_BACKEND=local이면 하이브리드 검색의 키워드 검색을 로컬 BM25 인덱스로 처리"""
+    return os.getenv("RAG_LEXICAL_BACKEND", "azure").lower() == "local"
+
+
+def _result_key(result):
+    # 인덱스 키 필드 이름에 의존하지 않도록 제목 + 본문으로 같은 문서를 판별
+    return hashlib.md5(f"{result.get('title')}\x00{result.get('chunk')}".encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K, top=SEARCH_TOP):
+    """
+    여러 검색 결과 목록을 순위 기반으로 합칩니다 (score = Σ 1 / (k + 순위)).
+    합친 점수는 '@search.score'에 넣어 기존 프롬프트 구성 코드를 그대로 사용할 수 있게 합니다.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = _result_key(result)
+            if key not in fused:
+                fused[key] = {field: value for field, value in result.items() if not field.startswith("@search.")}
+                fused[key]["@search.score"] = 0.0
+            fused[key]["@search.score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda item: item["@search.score"], reverse=True)[:top]
+
+
+class AsyncRetriever:
+    """
+    AsyncAzureOpenAI와 비동기 SearchClient로 검색 단계를 겹쳐서 실행합니다.
+    텍스트 검색은 임베딩이 필요 없으므로 시작하자마자 보내고, 임베딩이 나오면 벡터 검색을 보낸 뒤
+    두 결과를 RRF로 합칩니다.
+    """
+
+    def __init__(self, openai_client, search_client, embedding_deployment):
+        self.openai_client = openai_client
+        self.search_client = search_client
+        self.embedding_deployment = embedding_deployment
+
+    async def _embed(self, query):
+        cache = get_default_cache()
+        with tracing.span("embed", cache_hit=True) as span:
+            vector = cache.get(query, self.embedding_deployment)
+            if vector is None:
+                span.set("cache_hit", False)
+                response = await get_caller("openai.embed").call_async(
+                    self.openai_client.embeddings.create, input=[query], model=self.embedding_deployment, hedge=True
+                )
+                if response.usage:
+                    span.add_tokens("embedding_tokens", response.usage.prompt_tokens)
+                vector = response.data[0].embedding
+                cache.put(query, self.embedding_deployment, vector)
+            return vector
+
+    async def _search(self, **kwargs):
+        # 검색 요청은 결과를 읽기 시작할 때 전송되므로 결과를 모두 읽는 데까지를 한 번의 호출로 재시도
+        results = await self.search_client.search(**kwargs)
+        return [result async for result in results]
+
+    async def _text_search(self, query):
+        if use_local_lexical():
+            with tracing.span("search_text", backend="local"):
+                return get_default_lexical_index().search(query, SEARCH_TOP)
+        with tracing.span("search_text", backend="azure"):
+            return await get_caller("search.text").call_async(
+                self._search, search_text=query, select=select_fields(), top=SEARCH_TOP, hedge=True
+            )
+
+    async def _vector_search(self, vector):
+        from azure.search.documents.models import VectorizedQuery
+
+        with tracing.span("search_vector"):
+            vector_query = VectorizedQuery(vector=vector, k_nearest_neighbors=VECTOR_K, fields=VECTOR_FIELD)
+            return await get_caller("search.vector").call_async(
+                self._search, search_text=None, vector_queries=[vector_query], select=select_fields(), top=VECTOR_K,
+                hedge=True
+            )
+
+    async def _embed_and_search(self, query, stop_if, text_task):
+        vector = await self._embed(query)
+        if stop_if and stop_if(vector):
+            text_task.cancel()
+            return vector, None
+        return vector, await self._vector_search(vector)
+
+    @staticmethod
+    async def _wait_text(text_task, loop, deadline):
+        if deadline is None:
+            return await text_task
+        try:
+            return await asyncio.wait_for(text_task, max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise TimeoutError("검색이 제한 시간 안에 끝나지 않았습니다 (RAG_RETRIEVAL_TIMEOUT_SECONDS)") from None
+
+    async def retrieve(self, query, stop_if=None, timeout=None):
+        """
+        (질문 임베딩, RRF로 합친 검색 결과)를 반환합니다.
+        stop_if(vector)가 참이면 (예: 답변 캐시 적중) 진행 중인 텍스트 검색을 취소하고 빈 결과를 반환합니다.
+        임베딩·벡터 검색이 timeout초 안에 끝나지 않으면 그쪽만 취소하고 텍스트 검색 결과를 반환합니다. (임베딩은 None)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        text_task = asyncio.create_task(self._text_search(query))
+        vector_task = asyncio.create_task(self._embed_and_search(query, stop_if, text_task))
+        try:
+            done, _ = await asyncio.wait({vector_task}, timeout=timeout)
+            if not done:
+                vector_task.cancel()
+                tracing.current_span().set("vector_timeout", True)
+                return None, await self._wait_text(text_task, loop, deadline)
+            vector, vector_results = vector_task.result()
+            if vector_results is None:
+                return vector, []
+            text_results = await self._wait_text(text_task, loop, deadline)
+        except BaseException:
+            text_task.cancel()
+            vector_task.cancel()
+            raise
+        return vector, reciprocal_rank_fusion([text_results, vector_results])
+
+    async def warm_up(self):
+        """가벼운 요청으로 OpenAI와 Search의 keep-alive 연결을 미리 열어 둠 (응답 오류는 무시)"""
+        await asyncio.gather(
+            self.openai_client.models.list(),
+            self.search_client.get_document_count(),
+            return_exceptions=True,
+        )
+
+    async def close(self):
+        await self.search_client.close()
+        await self.openai_client.close()
+
+
+def get_default_retriever():
+    """환경 변수 설정으로 만든 프로세스 공용 비동기 검색기"""
+    global _default_retriever
+    with _default_retriever_lock:
+        if _default_retriever is None:
+            from openai import AsyncAzureOpenAI
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents.aio import SearchClient
+
+            # 재시도는 resilient_calls에서 처리하므로 SDK 자체 재시도는 끔
+            openai_client = AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                api_version=os.getenv("AZURE_OPENAI_EMBBEDING_API_VERSION"),
+                max_retries=0,
+            )
+            search_client = SearchClient(
+                credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY")),
+                endpoint=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
+                index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
+                retry_total=0,
+            )
+            _default_retriever = AsyncRetriever(
+                openai_client, search_client, os.getenv("AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME")
+            )
+        return _default_retriever
+
+
+def _search(search_client, **kwargs):
+    return list(search_client.search(**kwargs))
+
+
+def retrieve_documents(query, openai_client, search_client, embedding_deployment, stop_if=None):
+    """
+    질문 임베딩과 검색 결과를 반환하는 동기 함수.
+    RAG_ASYNC_RETRIEVAL=false이거나 로컬 인덱스를 사용할 때는 임베딩 → 검색을 순서대로 실행합니다.
+    비동기 검색에서 임베딩·벡터 검색이 RAG_RETRIEVAL_TIMEOUT_SECONDS를 넘기면 임베딩은 None, 결과는 텍스트 검색 결과입니다.
+    """
+    use_async = os.getenv("RAG_ASYNC_RETRIEVAL", "true").lower() != "false"
+    if use_async and not isinstance(search_client, LocalSearchClient):
+        # retrieve가 제한 시간 안에 텍스트 결과로 대신하므로 run_async의 제한 시간은 그보다 약간 길게
+        return run_async(
+            get_default_retriever().retrieve(query, stop_if, timeout=RETRIEVAL_TIMEOUT_SECONDS),
+            timeout=RETRIEVAL_TIMEOUT_SECONDS + 1,
+        )
+
+    from azure.search.documents.models import VectorizedQuery
+
+    vector = get_query_embedding(openai_client, query, embedding_deployment)
+    if stop_if and stop_if(vector):
+        return vector, []
+    vector_query = VectorizedQuery(vector=vector, k_nearest_neighbors=VECTOR_K, fields=VECTOR_FIELD)
+    if use_local_lexical():
+        # 키워드 검색은 로컬 BM25로, 벡터 검색만 검색 클라이언트로 보내고 RRF로 합침
+        with tracing.span("search_vector"):
+            vector_results = get_caller("search.vector").call(
+                _search, search_client, search_text=None, vector_queries=[vector_query], select=select_fields(),
+                top=VECTOR_K, hedge=True
+            )
+        with tracing.span("search_text", backend="local"):
+            text_results = get_default_lexical_index().search(query, SEARCH_TOP)
+        return vector, reciprocal_rank_fusion([text_results, vector_results])
+    with tracing.span("search"):
+        results = get_caller("search.hybrid").call(
+            _search, search_client,
+            search_text=query,
+            vector_queries=[vector_query],
+            select=select_fields(),
+            top=SEARCH_TOP,
+            hedge=True
+        )
+        return vector, results
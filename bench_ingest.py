@@ -0,0 +1,450 @@
+"""
+parse_pdf_storage_pages.py 수집 처리량 벤치마크.
+
+합성 PDF를 만들어 로컬 Blob Storage 대역(메모리)과 로컬 chat completions 대역(HTTP 서버)을 대상으로
+process_pdf_blob을 실행하고, 단계별 소요 시간·페이지/초·업로드 MB/s·PDF당 LLM 호출 수·최대 RSS를
+JSON으로 저장합니다. 실제 Azure 할당량은 사용하지 않습니다.
+
+    python bench_ingest.py --pdfs 3 --pages 20 --images-per-page 1 --tables-per-page 1 --output bench.json
+    python bench_ingest.py --pdfs 3 --pages 20 --output after.json --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+from token_counter import count_tokens
+
+KOREAN_WORDS = ["인터페이스", "요청", "응답", "필드", "설명", "필수", "여부", "데이터", "관측소", "측정값",
+                "배포", "서버", "조회", "등록", "코드", "형식", "기본값", "오류", "처리", "항목"]
+API_WORDS = ["stationCode", "pm10Value", "pm25Value", "dataTime", "resultCode", "GET", "POST",
+             "/api/v1/air", "String", "Number", "JSON", "Y", "N"]
+
+
+# --- 합성 PDF ---
+def _random_image(rng, size):
+    pixels = (rng.random((size, size, 3)) * 255).astype(np.uint8)
+    import fitz
+
+    return fitz.Pixmap(fitz.csRGB, size, size, pixels.tobytes(), False)
+
+
+def make_synthetic_pdf(pages, images_per_page=1.0, tables_per_page=0.5, unique_image_ratio=0.5, seed=0):
+    """
+    인터페이스 정의서 형태의 합성 PDF를 만듭니다.
+    images_per_page·tables_per_page는 페이지당 평균 개수(소수 가능)이고,
+    unique_image_ratio 비율만 새 이미지이며 나머지는 로고처럼 반복되는 이미지입니다.
+    """
+    import fitz
+
+    rng = np.random.default_rng(seed)
+    randomizer = random.Random(seed)
+    shared_images = [_random_image(rng, 64) for _ in range(3)]
+    doc = fitz.open()
+    for page_index in range(pages):
+        page = doc.new_page()
+        y = 50
+        page.insert_text((50, y), f"{page_index + 1}. {randomizer.choice(KOREAN_WORDS)} 정의", fontname="korea", fontsize=14)
+        y += 30
+        for _ in range(4):
+            words = [randomizer.choice(KOREAN_WORDS + API_WORDS) for _ in range(40)]
+            rect = fitz.Rect(50, y, 545, y + 70)
+            page.insert_textbox(rect, " ".join(words), fontname="korea", fontsize=9)
+            y += 75
+
+        table_count = int(tables_per_page) + (1 if randomizer.random() < tables_per_page % 1 else 0)
+        for _ in range(table_count):
+            if y > 700:
+                break
+            rows, cols, cell_w, cell_h = 5, 4, 120, 16
+            for row in range(rows):
+                for col in range(cols):
+                    cell = fitz.Rect(50 + col * cell_w, y + row * cell_h, 50 + (col + 1) * cell_w, y + (row + 1) * cell_h)
+                    page.draw_rect(cell, color=(0, 0, 0), width=0.5)
+                    page.insert_text((cell.x0 + 3, cell.y1 - 4), randomizer.choice(API_WORDS + KOREAN_WORDS),
+                                     fontname="korea", fontsize=7)
+            y += rows * cell_h + 15
+
+        image_count = int(images_per_page) + (1 if randomizer.random() < images_per_page % 1 else 0)
+        for image_index in range(image_count):
+            if randomizer.random() < unique_image_ratio:
+                pixmap = _random_image(rng, 96)
+            else:
+                pixmap = randomizer.choice(shared_images)
+            x = 50 + image_index * 110
+            page.insert_image(fitz.Rect(x, 720, x + 100, 820), pixmap=pixmap)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# --- Blob Storage 대역 ---
+class FakeBlobStore:
+    """메모리 Blob Storage. 요청마다 latency_ms + 크기/대역폭만큼 지연하고, error_rate 확률로 429를 발생시킴"""
+
+    def __init__(self, latency_ms=20.0, mb_per_second=50.0, error_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.bytes_per_second = mb_per_second * 1024 * 1024
+        self.error_rate = error_rate
+        self.blobs = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0}
+
+    def request(self, size=0):
+        from azure.core.exceptions import HttpResponseError
+
+        with self.lock:
+            self.stats["requests"] += 1
+            throttled = self.random.random() < self.error_rate
+            if throttled:
+                self.stats["throttled"] += 1
+        time.sleep(self.latency + size / self.bytes_per_second)
+        if throttled:
+            error = HttpResponseError(message="벤치마크 429 주입")
+            error.status_code = 429
+            raise error
+
+
+class _FakeDownloader:
+    def __init__(self, data):
+        self.data = data
+
+    def readall(self):
+        return self.data
+
+
+class FakeBlobClient:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def _get(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if self.name not in self.store.blobs:
+            raise ResourceNotFoundError(message=f"{self.name} 없음")
+        return self.store.blobs[self.name]
+
+    def upload_blob(self, data, overwrite=True, content_type=None, **kwargs):
+        self.store.request(len(data))
+        with self.store.lock:
+            self.store.blobs[self.name] = {"data": bytes(data), "etag": f'"{time.time_ns():x}"',
+                                           "last_modified": datetime.now(timezone.utc)}
+
+    def download_blob(self):
+        blob = self._get()
+        self.store.request(len(blob["data"]))
+        return _FakeDownloader(blob["data"])
+
+    def get_blob_properties(self):
+        self.store.request()
+        blob = self._get()
+        return SimpleNamespace(etag=blob["etag"], last_modified=blob["last_modified"], size=len(blob["data"]))
+
+
+class FakeContainerClient:
+    """parse_pdf_storage_pages.py와 BulkBlobUploader가 사용하는 ContainerClient 메서드만 구현"""
+
+    url = "https://bench.blob.core.windows.net/documents"
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self.store, name)
+
+    def download_blob(self, name):
+        return self.get_blob_client(name).download_blob()
+
+    def list_blobs(self, name_starts_with=None):
+        self.store.request()
+        with self.store.lock:
+            names = sorted(self.store.blobs)
+        return [SimpleNamespace(name=name) for name in names if not name_starts_with or name.startswith(name_starts_with)]
+
+
+# --- chat completions 대역 ---
+class FakeChatServer:
+    """
+    Azure OpenAI chat completions API 모양의 로컬 HTTP 서버.
+    응답 지연은 latency_ms + 출력 토큰 × ms_per_token이고, error_rate 확률로 retry-after-ms 헤더와 함께 429를 반환합니다.
+    출력이 max_tokens를 넘으면 잘라서 finish_reason="length"로 응답합니다.
+    """
+
+    def __init__(self, latency_ms=300.0, ms_per_token=0.5, error_rate=0.0, retry_after_ms=200, seed=0):
+        self.latency = latency_ms / 1000
+        self.seconds_per_token = ms_per_token / 1000
+        self.error_rate = error_rate
+        self.retry_after_ms = retry_after_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "prompt_tokens": 0, "completion_tokens": 0, "length_stops": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-chat", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _handler(self):
+        bench = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with bench.lock:
+                    bench.stats["requests"] += 1
+                    throttled = bench.random.random() < bench.error_rate
+                    if throttled:
+                        bench.stats["throttled"] += 1
+                if throttled:
+                    time.sleep(0.005)
+                    self._send(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                               {"retry-after-ms": str(bench.retry_after_ms), "retry-after": "1"})
+                    return
+
+                prompt = request["messages"][-1]["content"]
+                source = prompt.split("원본 내용:", 1)[-1].strip()
+                content = "## 변환 결과\n\n" + "\n\n".join(line for line in source.splitlines() if line.strip())
+                completion_tokens = count_tokens(content)
+                finish_reason = "stop"
+                max_tokens = request.get("max_tokens") or completion_tokens
+                if completion_tokens > max_tokens:
+                    # 토큰 한도에 맞게 대략적으로 자름
+                    content = content[:int(len(content) * max_tokens / completion_tokens)]
+                    completion_tokens = max_tokens
+                    finish_reason = "length"
+                prompt_tokens = count_tokens(prompt)
+                with bench.lock:
+                    bench.stats["prompt_tokens"] += prompt_tokens
+                    bench.stats["completion_tokens"] += completion_tokens
+                    bench.stats["length_stops"] += finish_reason == "length"
+                time.sleep(bench.latency + completion_tokens * bench.seconds_per_token)
+                self._send(200, {
+                    "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": "bench",
+                    "choices": [{"index": 0, "finish_reason": finish_reason,
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+
+        return Handler
+
+
+# --- 실행 ---
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # macOS는 바이트, Linux는 KB
+
+
+def _delta(after, before):
+    return {key: after[key] - before.get(key, 0) for key in after if isinstance(after[key], (int, float))}
+
+
+def run_benchmark(args):
+    chat = FakeChatServer(args.chat_latency_ms, args.chat_ms_per_token, args.chat_429_rate, seed=args.seed).start()
+    work_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+
+    # parse_pdf_storage_pages는 임포트할 때 설정을 읽고 클라이언트를 만들므로 환경 변수를 먼저 설정
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": chat.endpoint,
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_CHAT_API_VERSION": "2024-06-01",
+        "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME": "bench",
+        "AZURE_STORAGE_CONNECTION_STRING": "DefaultEndpointsProtocol=https;AccountName=bench;"
+                                           "AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net",
+        "AZURE_OPENAI_CHAT_RPM": str(args.chat_rpm),
+        "AZURE_OPENAI_CHAT_TPM": str(args.chat_tpm),
+        "MARKDOWN_LOCAL_FASTPATH": "true" if args.local_fastpath else "false",
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical_index"),
+        # 개발자 .env에 설정이 있어도 실제 검색 인덱스에 넣거나 운영 추적 파일에 기록하지 않도록 고정
+        "DIRECT_INDEX_PUSH": "false",
+        "SEARCH_EMBEDDING_CACHE_PATH": os.path.join(work_dir, "chunk_embeddings.sqlite3"),
+        "TRACE_PATH": os.path.join(work_dir, "traces", "spans.jsonl"),
+    })
+    import parse_pdf_storage_pages as ingest
+    from blob_uploader import BulkBlobUploader
+
+    store = FakeBlobStore(args.blob_latency_ms, args.blob_mbps, args.blob_429_rate, seed=args.seed)
+    ingest.container_client = FakeContainerClient(store)
+    ingest.uploader = BulkBlobUploader(ingest.container_client, workers=ingest.upload_workers,
+                                       backoff_seconds=args.blob_backoff_seconds)
+
+    pdf_names = []
+    for index in range(args.pdfs):
+        data = make_synthetic_pdf(args.pages, args.images_per_page, args.tables_per_page,
+                                  args.unique_image_ratio, seed=args.seed + index)
+        name = f"bench_{index + 1:03d}.pdf"
+        store.blobs[name] = {"data": data, "etag": f'"{index}"', "last_modified": datetime.now(timezone.utc)}
+        pdf_names.append(name)
+
+    per_pdf = []
+    run_started_at = time.perf_counter()
+    stage_before_run = dict(ingest.stage_timings)
+    upload_before_run = ingest.uploader.stats()
+    calls_before_run = dict(ingest.markdown_call_stats)
+    for name in pdf_names:
+        stage_before = dict(ingest.stage_timings)
+        calls_before = dict(ingest.markdown_call_stats)
+        upload_before = ingest.uploader.stats()
+        started_at = time.perf_counter()
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+                ok = ingest.process_pdf_blob(name, force=True)
+            error = None
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        per_pdf.append({
+            "pdf": name,
+            "ok": bool(ok),
+            "error": error,
+            "seconds": time.perf_counter() - started_at,
+            "stages": _delta(ingest.stage_timings, stage_before),
+            "markdown_calls": _delta(ingest.markdown_call_stats, calls_before),
+            "upload": _delta(ingest.uploader.stats(), upload_before),
+        })
+        print(f"{name}: {'성공' if ok else '실패'} {per_pdf[-1]['seconds']:.2f}초" + (f" ({error})" if error else ""))
+    wall_seconds = time.perf_counter() - run_started_at
+    chat.stop()
+
+    upload = _delta(ingest.uploader.stats(), upload_before_run)
+    calls = _delta(ingest.markdown_call_stats, calls_before_run)
+    total_pages = args.pdfs * args.pages
+    stages = _delta(ingest.stage_timings, stage_before_run)
+    stages["upload_busy"] = upload["busy_seconds"]
+    return {
+        "config": vars(args),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "totals": {
+            "pdfs": args.pdfs,
+            "pages": total_pages,
+            "failed_pdfs": sum(1 for result in per_pdf if not result["ok"]),
+            "wall_seconds": wall_seconds,
+            "pages_per_second": total_pages / wall_seconds if wall_seconds else 0.0,
+            "llm_calls": calls["calls"],
+            "llm_calls_per_pdf": calls["calls"] / args.pdfs if args.pdfs else 0.0,
+            "llm_retries": calls["retries"],
+            "local_pages": calls["local_pages"],
+            "chat_requests": chat.stats["requests"],
+            "chat_throttled": chat.stats["throttled"],
+            "chat_length_stops": chat.stats["length_stops"],
+            "upload_count": upload["uploaded"],
+            "upload_failed": upload["failed"],
+            "upload_retries": upload["retries"],
+            "upload_mb": upload["bytes"] / 1024 / 1024,
+            "upload_mb_per_second": upload["bytes"] / 1024 / 1024 / upload["busy_seconds"] if upload["busy_seconds"] else 0.0,
+            "blob_throttled": store.stats["throttled"],
+            "peak_rss_mb": peak_rss_mb(),
+        },
+        "stages": stages,
+        "per_pdf": per_pdf,
+    }
+
+
+COMPARE_KEYS = [
+    ("totals", "wall_seconds", "낮을수록 좋음"),
+    ("totals", "pages_per_second", "높을수록 좋음"),
+    ("totals", "llm_calls_per_pdf", "낮을수록 좋음"),
+    ("totals", "upload_mb_per_second", "높을수록 좋음"),
+    ("totals", "peak_rss_mb", "낮을수록 좋음"),
+]
+
+
+def print_report(result):
+    totals = result["totals"]
+    print("\n" + "=" * 60)
+    print(f"PDF {totals['pdfs']}개 / {totals['pages']}페이지: {totals['wall_seconds']:.2f}초, "
+          f"{totals['pages_per_second']:.2f} 페이지/초 (실패 {totals['failed_pdfs']}개)")
+    print(f"LLM 호출 {totals['llm_calls']}회 (PDF당 {totals['llm_calls_per_pdf']:.1f}회, 재변환 {totals['llm_retries']}회), "
+          f"429 주입 {totals['chat_throttled']}회")
+    print(f"업로드 {totals['upload_count']}건 {totals['upload_mb']:.2f} MB, {totals['upload_mb_per_second']:.2f} MB/s "
+          f"(재시도 {totals['upload_retries']}회, 실패 {totals['upload_failed']}건)")
+    print(f"최대 RSS {totals['peak_rss_mb']:.1f} MB")
+    print("단계별 누적 시간 (변환·업로드는 동시 실행 스레드 시간의 합):")
+    for stage, seconds in sorted(result["stages"].items()):
+        print(f"  - {stage}: {seconds:.3f}초")
+
+
+def print_comparison(result, baseline):
+    print("\n" + "=" * 60)
+    print(f"기준 결과와 비교 ({baseline.get('started_at')})")
+    rows = [(section, key, note) for section, key, note in COMPARE_KEYS]
+    rows += [("stages", stage, "낮을수록 좋음") for stage in sorted(set(result["stages"]) | set(baseline["stages"]))]
+    for section, key, note in rows:
+        before = baseline[section].get(key, 0.0)
+        after = result[section].get(key, 0.0)
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {key:24s} {before:10.3f} → {after:10.3f} ({change:+.1f}%, {note})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PDF 수집 처리량 벤치마크 (로컬 Blob/Chat 대역 사용)")
+    parser.add_argument("--pdfs", type=int, default=3, help="합성 PDF 수")
+    parser.add_argument("--pages", type=int, default=20, help="PDF당 페이지 수")
+    parser.add_argument("--images-per-page", type=float, default=1.0, help="페이지당 평균 이미지 수")
+    parser.add_argument("--tables-per-page", type=float, default=0.5, help="페이지당 평균 표 수")
+    parser.add_argument("--unique-image-ratio", type=float, default=0.5, help="반복되지 않는 이미지 비율")
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0, help="chat 호출 기본 지연")
+    parser.add_argument("--chat-ms-per-token", type=float, default=0.5, help="출력 토큰당 추가 지연")
+    parser.add_argument("--chat-429-rate", type=float, default=0.0, help="chat 429 주입 확률")
+    parser.add_argument("--chat-rpm", type=int, default=100000, help="수집 스크립트의 분당 요청 한도 설정")
+    parser.add_argument("--chat-tpm", type=int, default=100000000, help="수집 스크립트의 분당 토큰 한도 설정")
+    parser.add_argument("--blob-latency-ms", type=float, default=20.0, help="blob 요청 기본 지연")
+    parser.add_argument("--blob-mbps", type=float, default=50.0, help="blob 전송 대역폭 (MB/s)")
+    parser.add_argument("--blob-429-rate", type=float, default=0.0, help="blob 429 주입 확률")
+    parser.add_argument("--blob-backoff-seconds", type=float, default=0.05, help="업로드 재시도 기본 대기 시간")
+    parser.add_argument("--local-fastpath", action="store_true", help="MARKDOWN_LOCAL_FASTPATH 사용")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="결과 JSON 저장 경로")
+    parser.add_argument("--compare", help="비교할 기준 결과 JSON 경로")
+    parser.add_argument("--verbose", action="store_true", help="수집 스크립트 출력 표시")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_benchmark(args)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n결과 저장: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from azure.core.exceptions import AzureError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+import tracing
+from resilient_calls import CircuitOpenError, ResilientCaller
+
+
+def create_pooled_blob_service_client(connection_string, pool_size=8):
+    """
+    keep-alive 연결을 pool_size개까지 재사용하는 BlobServiceClient를 생성합니다.
+    재시도는 BulkBlobUploader(resilient_calls)에서 처리하므로 SDK 자체 재시도는 끕니다.
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    return BlobServiceClient.from_connection_string(connection_string, transport=transport, retry_total=0)
+
+
+class BulkBlobUploader:
+    """
+    (경로, 데이터, content type) 업로드 작업을 제한된 워커 풀에서 병렬로 처리합니다.
+    일시적인 AzureError는 Retry-After 헤더나 지수 백오프에 따라 재시도하고, 처리량 통계를 집계합니다.
+    """
+
+    def __init__(self, container_client, workers=8, max_retries=3, backoff_seconds=1.0, max_pending=None):
+        self.container_client = container_client
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        # 업로드는 대기가 길어져도 되므로 Retry-After를 최대 60초까지 따르고 차단이 풀릴 때까지 기다림
+        self._caller = ResilientCaller("blob.upload", max_attempts=max_retries + 1, base_delay=backoff_seconds,
+                                       max_delay=60, wait_for_circuit=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blob-upload")
+        # 대기열이 무한정 쌓이지 않도록 제출 가능한 작업 수 제한
+        self._pending = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_since = None
+        self._stats = {"uploaded": 0, "failed": 0, "retries": 0, "bytes": 0, "busy_seconds": 0.0}
+
+    def get_blob_url(self, blob_name):
+        """blob 이름으로 접근 URL 생성"""
+        return f"{self.container_client.url}/{blob_name}"
+
+    def submit(self, blob_name, data, content_type="application/octet-stream"):
+        """업로드 작업을 대기열에 넣고 URL(실패 시 None)을 돌려줄 Future 반환"""
+        self._pending.acquire()
+        try:
+            # 업로드 span이 제출한 쪽(PDF 처리)의 하위 span이 되도록 컨텍스트를 함께 넘김
+            future = self._executor.submit(tracing.bind_context(self._upload), blob_name, data, content_type)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def upload(self, blob_name, data, content_type="application/octet-stream"):
+        """업로드 작업을 워커 풀에서 실행하고 완료될 때까지 대기"""
+        return self.submit(blob_name, data, content_type).result()
+
+    def upload_many(self, items):
+        """(경로, 데이터, content type) 목록을 병렬로 업로드하고 순서대로 URL 반환"""
+        futures = [self.submit(blob_name, data, content_type) for blob_name, data, content_type in items]
+        return [future.result() for future in futures]
+
+    def _upload(self, blob_name, data, content_type):
+        with tracing.span("upload", blob=blob_name, bytes=len(data)) as span:
+            url = self._upload_with_retry(blob_name, data, content_type)
+            span.set("ok", url is not None)
+            return url
+
+    def _upload_with_retry(self, blob_name, data, content_type):
+        self._mark_active(1)
+        try:
+            blob_client = self.container_client.get_blob_client(blob_name)
+            try:
+                self._caller.call(blob_client.upload_blob, data, overwrite=True, content_type=content_type,
+                                  on_retry=self._count_retry)
+            except (AzureError, CircuitOpenError) as e:
+                print(f"Blob 업로드 오류 ({blob_name}): {e}")
+                with self._lock:
+                    self._stats["failed"] += 1
+                return None
+            with self._lock:
+                self._stats["uploaded"] += 1
+                self._stats["bytes"] += len(data)
+            return self.get_blob_url(blob_name)
+        finally:
+            self._mark_active(-1)
+
+    def _count_retry(self, attempt, delay, error):
+        with self._lock:
+            self._stats["retries"] += 1
+
+    def _mark_active(self, delta):
+        # 업로드가 하나라도 진행 중인 구간의 실제 경과 시간만 처리량 계산에 사용
+        with self._lock:
+            if self._active == 0 and delta > 0:
+                self._active_since = time.monotonic()
+            self._active += delta
+            if self._active == 0:
+                self._stats["busy_seconds"] += time.monotonic() - self._active_since
+
+    def stats(self):
+        """누적 업로드 통계 반환 (건수, 바이트, MB/s 등)"""
+        with self._lock:
+            stats = dict(self._stats)
+            if self._active:
+                stats["busy_seconds"] += time.monotonic() - self._active_since
+        stats["mb_per_second"] = stats["bytes"] / 1024 / 1024 / stats["busy_seconds"] if stats["busy_seconds"] else 0.0
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def format_upload_stats(stats, since=None):
+    """업로드 통계를 한 줄 문자열로 변환 (since를 주면 그 이후 변화량만 표시)"""
+    if since:
+        stats = {key: stats[key] - since.get(key, 0) for key in ("uploaded", "failed", "retries", "bytes", "busy_seconds")}
+        stats["mb_per_second"] = stats["bytes"] / 1024 / 1024 / stats["busy_seconds"] if stats["busy_seconds"] else 0.0
+    return (f"업로드 {stats['uploaded']}건 (실패 {stats['failed']}건, 재시도 {stats['retries']}회), "
+            f"{stats['bytes'] / 1024 / 1024:.2f} MB, {stats['mb_per_second']:.2f} MB/s")
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+CHAT_HISTORY_PATH = os.getenv("CHAT_HISTORY_PATH", os.path.join(".cache", "chat_history.sqlite3"))
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))  # 세션 메모리에 두고 매번 그리는 최근 메시지 수
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "10"))  # '이전 대화 더 보기' 한 번에 불러올 메시지 수
+CHAT_HISTORY_TTL_DAYS = float(os.getenv("CHAT_HISTORY_TTL_DAYS", "7"))  # 보관한 메시지를 지우기까지의 기간
+CHAT_RENDER_PREVIEW_CHARS = int(os.getenv("CHAT_RENDER_PREVIEW_CHARS", "3000"))  # 이보다 긴 메시지는 앞부분만 바로 표시
+CHAT_RENDER_CACHE_ITEMS = 1024
+
+
+class ChatHistoryStore:
+    """세션 메모리에서 밀려난 메시지를 보관하는 SQLite 저장소 (모든 세션이 공유)"""
+
+    def __init__(self, path=CHAT_HISTORY_PATH, ttl_days=CHAT_HISTORY_TTL_DAYS):
+        self.ttl_seconds = ttl_days * 86400
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session_id TEXT, seq INTEGER, role TEXT, content TEXT, created_at REAL,"
+            " PRIMARY KEY (session_id, seq))"
+        )
+        # 오래된 세션의 메시지 정리
+        self._db.execute("DELETE FROM messages WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._db.commit()
+
+    def archive(self, session_id, messages):
+        """메시지 목록 [{"id", "role", "content"}, ...]을 저장"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, message["id"], message["role"], message["content"], now) for message in messages],
+            )
+            self._db.commit()
+
+    def load(self, session_id, before_seq, limit):
+        """before_seq 바로 앞의 메시지 limit개를 오래된 순서로 반환"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq, limit),
+            ).fetchall()
+        return [{"id": seq, "role": role, "content": content} for seq, role, content in reversed(rows)]
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """프로세스 전체에서 공유하는 대화 기록 저장소"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChatHistoryStore()
+        return _default_store
+
+
+class ChatHistory:
+    """
+    세션 하나의 대화 기록.
+    최근 window개 메시지만 메모리에 두고, 밀려난 메시지는 SQLite로 옮겨서
+    대화가 길어져도 세션 메모리와 화면을 그리는 시간이 일정하게 유지되도록 합니다.
+    """
+
+    def __init__(self, session_id=None, window=CHAT_HISTORY_WINDOW, store=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.window = window
+        self.recent = deque()
+        self.archived_count = 0
+        self._next_seq = 0
+        self._store = store
+
+    @property
+    def store(self):
+        return self._store or get_default_store()
+
+    def __len__(self):
+        return self.archived_count + len(self.recent)
+
+    def append(self, role, content):
+        message = {"id": self._next_seq, "role": role, "content": content}
+        self._next_seq += 1
+        self.recent.append(message)
+        if len(self.recent) > self.window:
+            evicted = [self.recent.popleft() for _ in range(len(self.recent) - self.window)]
+            self.store.archive(self.session_id, evicted)
+            self.archived_count += len(evicted)
+        return message
+
+    def load_older(self, pages, page_size=CHAT_HISTORY_PAGE_SIZE):
+        """메모리 창 바로 앞의 보관된 메시지를 pages 페이지만큼 오래된 순서로 반환"""
+        limit = min(self.archived_count, pages * page_size)
+        if limit <= 0:
+            return []
+        first_seq = self.recent[0]["id"] if self.recent else self._next_seq
+        return self.store.load(self.session_id, first_seq, limit)
+
+    def clear(self):
+        if self.archived_count:
+            self.store.delete_session(self.session_id)
+        self.recent.clear()
+        self.archived_count = 0
+        self._next_seq = 0
+
+
+@lru_cache(maxsize=CHAT_RENDER_CACHE_ITEMS)
+def split_for_display(content, preview_chars=CHAT_RENDER_PREVIEW_CHARS):
+    """
+    긴 메시지를 (바로 보여줄 앞부분, 접어 둘 나머지)로 나눕니다. 나눌 필요가 없으면 나머지는 빈 문자열.
+    코드 블록 중간에서 자르지 않도록 코드 블록 밖의 문단 경계에서만 나눕니다.
+    같은 메시지는 다시 그릴 때마다 계산하지 않도록 결과를 캐시합니다.
+    """
+    if len(content) <= preview_chars:
+        return content, ""
+
+    split_at = 0
+    in_code = False
+    position = 0
+    for line in content.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        position += len(line)
+        if position > preview_chars:
+            break
+        if not in_code and not line.strip():
+            split_at = position
+    if split_at == 0:
+        return content, ""
+    return content[:split_at].rstrip(), content[split_at:].lstrip("\n")
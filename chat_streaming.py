@@ -0,0 +1,30 @@
+import time
+
+
+def iter_chat_stream(stream, started_at, metrics=None, usage=None):
+    """
+    chat.completions 스트림(stream=True)에서 텍스트 조각을 순서대로 생성합니다.
+    metrics를 주면 첫 토큰까지의 시간(ttft)과 전체 소요 시간(total)을 초 단위로 기록합니다.
+    usage(dict)를 주면 마지막 청크의 토큰 사용량(stream_options={"include_usage": True}일 때)을 기록합니다.
+    """
+    for chunk in stream:
+        if usage is not None and getattr(chunk, "usage", None):
+            usage["prompt_tokens"] = chunk.usage.prompt_tokens
+            usage["completion_tokens"] = chunk.usage.completion_tokens
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if metrics is not None and "ttft" not in metrics:
+                metrics["ttft"] = time.perf_counter() - started_at
+            yield delta
+    if metrics is not None:
+        metrics["total"] = time.perf_counter() - started_at
+
+
+def yield_text(text, started_at, metrics=None):
+    """캐시된 답변이나 오류 메시지처럼 이미 완성된 텍스트를 스트림 형태로 반환"""
+    if metrics is not None:
+        metrics.setdefault("ttft", time.perf_counter() - started_at)
+        metrics["total"] = time.perf_counter() - started_at
+    yield text
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+import tracing
+from token_counter import count_tokens
+
+load_dotenv()
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("RAG_CONTEXT_MMR_LAMBDA", "0.7"))  # 1에 가까울수록 관련성, 0에 가까울수록 다양성 우선
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("RAG_CONTEXT_DEDUP_THRESHOLD", "0.95"))  # 벡터 코사인 유사도 기준
+CONTEXT_DEDUP_JACCARD = 0.8  # 벡터가 없을 때 글자 5-gram 자카드 유사도 기준
+SHINGLE_SIZE = 5
+
+
+def _shingles(text):
+    text = "".join((text or "").split())
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _lexical_similarity_matrix(chunks):
+    shingles = [_shingles(chunk) for chunk in chunks]
+    size = len(chunks)
+    similarity = np.eye(size, dtype=np.float32)
+    for i in range(size):
+        for j in range(i + 1, size):
+            union = len(shingles[i] | shingles[j])
+            similarity[i, j] = similarity[j, i] = len(shingles[i] & shingles[j]) / union if union else 0.0
+    return similarity
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def pack_context(results, query_vector=None, token_budget=CONTEXT_TOKEN_BUDGET,
+                 mmr_lambda=CONTEXT_MMR_LAMBDA, metrics=None):
+    """
+    검색 결과에서 프롬프트에 넣을 청크를 고릅니다.
+    1) 거의 같은 청크(겹치는 Markdown 조각)를 제거하고
+    2) 질문 관련성과 이미 고른 청크와의 차이를 함께 고려하는 MMR 순서로
+    3) 토큰 예산을 넘지 않을 때까지 담습니다.
+    결과마다 text_vector가 있으면 벡터 유사도를, 없으면 글자 n-gram 유사도를 사용합니다.
+    압축 결과(청크 수, 토큰 수, 절약한 토큰)는 현재 추적 span과 metrics에 기록합니다.
+    """
+    results = [result for result in results if result.get("chunk")]
+    if not results:
+        return []
+
+    chunks = [result["chunk"] for result in results]
+    tokens = [count_tokens(chunk) for chunk in chunks]
+    vectors = [result.get("text_vector") for result in results]
+    use_vectors = query_vector is not None and all(vector is not None for vector in vectors)
+
+    if use_vectors:
+        matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        similarity = matrix @ matrix.T
+        query = np.asarray(query_vector, dtype=np.float32)
+        relevance = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        duplicate_threshold = CONTEXT_DEDUP_THRESHOLD
+    else:
+        similarity = _lexical_similarity_matrix(chunks)
+        # 벡터가 없으면 검색 순위를 관련성으로 사용 (1위 = 1.0)
+        relevance = np.linspace(1.0, 0.5, num=len(results), dtype=np.float32)
+        duplicate_threshold = CONTEXT_DEDUP_JACCARD
+
+    # 1. 검색 순위가 높은 쪽을 남기고 거의 같은 청크는 제거
+    candidates = []
+    duplicates = 0
+    for index in range(len(results)):
+        if any(similarity[index, kept] >= duplicate_threshold for kept in candidates):
+            duplicates += 1
+            continue
+        candidates.append(index)
+
+    # 2~3. MMR로 하나씩 고르되 예산을 넘는 청크는 건너뜀
+    selected = []
+    used_tokens = 0
+    while candidates:
+        if selected:
+            redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates), dtype=np.float32)
+        scores = mmr_lambda * relevance[candidates] - (1 - mmr_lambda) * redundancy
+        best = candidates.pop(int(np.argmax(scores)))
+        if used_tokens + tokens[best] > token_budget and selected:
+            continue
+        selected.append(best)
+        used_tokens += tokens[best]
+
+    total_tokens = sum(tokens)
+    saved_tokens = total_tokens - used_tokens
+    span = tracing.current_span()
+    span.set("candidates", len(results))
+    span.set("duplicates", duplicates)
+    span.set("context_tokens", used_tokens)
+    span.set("context_tokens_saved", saved_tokens)
+    if metrics is not None:
+        metrics["context_tokens"] = used_tokens
+        metrics["context_tokens_saved"] = saved_tokens
+    return [results[index] for index in selected]
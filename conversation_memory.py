@@ -0,0 +1,187 @@
+import os
+import re
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+import tracing
+from resilient_calls import get_caller
+from token_counter import count_tokens, truncate_tokens
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "3"))  # 그대로 전달할 최근 질문/답변 쌍 수
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))  # 요청마다 프롬프트에 넣는 대화 기록(요약 포함)의 최대 토큰
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "400"))  # 누적 요약의 최대 토큰
+MEMORY_SUMMARY_INPUT_TOKENS = 800  # 요약할 때 메시지 하나에서 읽는 최대 토큰 (긴 답변의 요약 비용 제한)
+MEMORY_SEARCH_CONTEXT_TOKENS = 64  # 후속 질문 검색어에 붙이는 이전 검색어의 최대 토큰
+
+# 앞 대화를 가리키는 지시어·접속어 (단어 전체 또는 조사가 붙은 형태로 나오면 후속 질문)
+FOLLOWUP_WORDS = {"그", "이", "저", "위", "앞", "또", "it", "its", "they", "them", "those"}
+FOLLOWUP_PREFIXES = ("그거", "그것", "그건", "그게", "그걸", "이거", "이것", "이건", "이게", "저거", "저것", "거기", "여기",
+                     "그때", "그분", "아까", "방금", "그럼", "그러면", "그리고", "그래서", "위에서", "앞에서")
+FOLLOWUP_PHRASES = ("what about", "how about")
+FOLLOWUP_FRAGMENT_TOKENS = 3  # 이보다 짧은 조각("왜?", "언제?")은 앞 질문이 생략된 후속 질문으로 봄
+# "담당자는?", "배포일은?"처럼 주제어 하나만 남은 질문 (앞 질문의 나머지가 생략됨)
+_ELLIPSIS_PATTERN = re.compile(r"[0-9a-z_가-힣]+[은는][?？.\s]*")
+_WORD_PATTERN = re.compile(r"[가-힣]+|[a-z]+")
+
+SUMMARY_PROMPT = """다음은 사용자와 사내 운영 Q&A 챗봇의 이전 대화 요약과 그 뒤에 이어진 대화입니다.
+이후 질문을 이해하는 데 필요한 정보(언급된 시스템, 문서, 날짜, 담당자, 결정 사항)를 중심으로
+{max_tokens}토큰 이내의 한국어 요약으로 갱신해 주세요. 요약만 출력하세요.
+
+## 이전 요약
+{summary}
+
+## 이어진 대화
+{dialogue}"""
+
+
+class ConversationMemory:
+    """
+    대화 하나의 멀티턴 문맥.
+    최근 MEMORY_RECENT_TURNS개 질문/답변은 그대로 두고, 그보다 오래된 대화는 누적 요약에 합칩니다.
+    요청마다 프롬프트에 넣는 대화 기록은 MEMORY_TOKEN_BUDGET 토큰을 넘지 않으므로
+    대화가 길어져도 요청 크기와 지연 시간이 늘어나지 않습니다.
+    """
+
+    def __init__(self, recent_turns=MEMORY_RECENT_TURNS, token_budget=MEMORY_TOKEN_BUDGET,
+                 summary_tokens=MEMORY_SUMMARY_TOKENS):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.messages = deque()  # 아직 요약에 합치지 않은 {"role", "content"}
+        self._lock = threading.Lock()
+        self._folding = False
+        self._generation = 0  # clear()할 때마다 증가 (진행 중이던 요약 결과를 버리기 위해)
+
+    def __bool__(self):
+        return bool(self.summary or self.messages)
+
+    def last_search_query(self):
+        with self._lock:
+            for message in reversed(self.messages):
+                if message["role"] == "user":
+                    return message["search_query"]
+        return None
+
+    def is_followup(self, query):
+        """
+        앞 대화에 기대는 질문인지 판단합니다.
+        "그럼 그 배포는 누가 했어?"처럼 지시어·접속어가 있거나 "담당자는?"처럼 주제어만 남은 질문만 후속 질문으로 보고,
+        "Redis 포트?"처럼 짧아도 완결된 질문은 독립된 질문으로 처리해서 답변 캐시와 같은 질문 합치기를 그대로 사용합니다.
+        """
+        if not self:
+            return False
+        text = query.strip().lower()
+        if count_tokens(text) < FOLLOWUP_FRAGMENT_TOKENS or _ELLIPSIS_PATTERN.fullmatch(text) \
+                or text.startswith(FOLLOWUP_PHRASES):
+            return True
+        for word in _WORD_PATTERN.findall(text):
+            if word in FOLLOWUP_WORDS or word.startswith(FOLLOWUP_PREFIXES):
+                return True
+        return False
+
+    def search_query(self, query):
+        """
+        검색과 질문 분류에 쓸 질문.
+        후속 질문은 이전 질문의 검색어를 앞에 붙여서 검색합니다. (후속 질문이 아니면 질문을 그대로 반환)
+        """
+        previous = self.last_search_query()
+        if previous and self.is_followup(query):
+            return f"{truncate_tokens(previous, MEMORY_SEARCH_CONTEXT_TOKENS)} {query}"
+        return query
+
+    def history_messages(self):
+        """
+        chat.completions에 넣을 대화 기록 메시지 목록 (요약 + 최근 대화).
+        토큰 예산을 넘으면 오래된 메시지부터 빼고, 마지막으로 들어가는 메시지는 예산에 맞게 자릅니다.
+        """
+        with self._lock:
+            summary = self.summary
+            messages = list(self.messages)
+
+        budget = self.token_budget
+        history = []
+        if summary:
+            summary = "이전 대화 요약:\n" + truncate_tokens(summary, min(self.summary_tokens, budget // 2))
+            budget -= count_tokens(summary)
+        for message in reversed(messages):
+            content = message["content"]
+            tokens = count_tokens(content)
+            if tokens > budget:
+                content = truncate_tokens(content, budget - count_tokens(" …")) + " …"
+                tokens = count_tokens(content)
+                if tokens > budget:
+                    break
+            history.append({"role": message["role"], "content": content})
+            budget -= tokens
+            if budget <= 0:
+                break
+        history.reverse()
+        if summary:
+            history.insert(0, {"role": "system", "content": summary})
+        return history
+
+    def add_turn(self, query, answer):
+        search_query = self.search_query(query)
+        with self._lock:
+            self.messages.append({"role": "user", "content": query, "search_query": search_query})
+            self.messages.append({"role": "assistant", "content": answer})
+
+    def _take_overflow(self):
+        with self._lock:
+            overflow = len(self.messages) - self.recent_turns * 2
+            if overflow <= 0 or self._folding:
+                return None, []
+            self._folding = True
+            return self._generation, [self.messages[i] for i in range(overflow)]
+
+    def fold(self, client, deployment):
+        """최근 대화 수를 넘은 오래된 메시지를 누적 요약에 합침 (요약 호출 한 번)"""
+        generation, folded = self._take_overflow()
+        if not folded:
+            return
+        summary = self.summary
+        try:
+            dialogue = "\n".join(
+                f"{'사용자' if message['role'] == 'user' else '챗봇'}: "
+                f"{truncate_tokens(message['content'], MEMORY_SUMMARY_INPUT_TOKENS)}"
+                for message in folded
+            )
+            prompt = SUMMARY_PROMPT.format(max_tokens=self.summary_tokens, summary=summary or "(없음)", dialogue=dialogue)
+            with tracing.span("memory_summary", messages=len(folded)) as span:
+                response = get_caller("openai.chat").call(
+                    client.chat.completions.create,
+                    model=deployment,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.0,
+                    max_tokens=self.summary_tokens,
+                )
+                summary = response.choices[0].message.content or summary
+                tracing.set_token_usage(span, response.usage, prompt, summary)
+        except Exception as e:
+            # 요약에 실패해도 대화 기록이 계속 늘어나지 않도록 오래된 메시지는 버림
+            print(f"대화 요약 실패 (이전 요약 유지): {e}")
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    for _ in folded:
+                        self.messages.popleft()
+                    self.summary = summary
+                self._folding = False
+
+    def fold_in_background(self, client, deployment):
+        """답변 응답 시간에 영향이 없도록 요약은 백그라운드 스레드에서 갱신"""
+        if len(self.messages) <= self.recent_turns * 2:
+            return
+        threading.Thread(target=self.fold, args=(client, deployment), name="memory-summary", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.messages.clear()
+            self._generation += 1
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import tracing
+from resilient_calls import get_caller
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "1024"))
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text):
+    """캐시 키용으로 질문을 정규화 (유니코드 NFKC, 소문자, 공백 정리)"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    (정규화된 텍스트, 임베딩 배포 이름) 기준 임베딩 캐시.
+    프로세스 메모리의 LRU와 SQLite 파일(float32 blob) 2단계로 저장하고,
+    디스크 용량이 한도를 넘으면 가장 오래 사용하지 않은 항목부터 삭제합니다.
+    namespace를 주면 질문 캐시와 키가 겹치지 않는 별도 공간에 원문 텍스트 그대로를 키로 저장합니다.
+    (문서 청크처럼 공백·대소문자 차이도 다른 내용인 텍스트용)
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+                 max_disk_mb=EMBEDDING_CACHE_MAX_MB, namespace=None):
+        self.path = path
+        self.namespace = namespace
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # 콘솔 챗봇과 Streamlit 앱이 같은 파일을 동시에 써도 되도록 WAL 모드 사용
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, deployment TEXT, vector BLOB, size INTEGER, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def make_key(self, text, deployment):
+        if self.namespace:
+            return hashlib.sha256(f"{self.namespace}\x00{deployment}\x00{text}".encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{deployment}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text, deployment):
+        """캐시된 임베딩을 반환하고, 없으면 None"""
+        key = self.make_key(text, deployment)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key]
+
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            vector = array("f")
+            vector.frombytes(row[0])
+            vector = vector.tolist()
+            self._remember(key, vector)
+            self._stats["disk_hits"] += 1
+            return vector
+
+    def put(self, text, deployment, vector):
+        key = self.make_key(text, deployment)
+        blob = array("f", vector).tobytes()
+        with self._lock:
+            self._remember(key, list(vector))
+            previous = self._db.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, deployment, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, deployment, blob, len(blob), time.time()),
+            )
+            self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+            self._evict()
+            self._db.commit()
+
+    def get_or_create(self, text, deployment, create):
+        """캐시에 없으면 create(text)로 임베딩을 만들어 저장한 뒤 반환"""
+        vector = self.get(text, deployment)
+        if vector is None:
+            vector = create(text)
+            self.put(text, deployment, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # 한도를 넘으면 오래 사용하지 않은 항목부터 한도의 90%까지 삭제
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._db.execute("SELECT key, size FROM embeddings ORDER BY last_used").fetchall()
+        removed = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            removed.append((key,))
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["disk_mb"] = self._disk_bytes / 1024 / 1024
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """프로세스 전체에서 공유하는 임베딩 캐시 (Streamlit 재실행에도 유지됨)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+def get_query_embedding(client, query, deployment):
+    """캐시를 거쳐 질문 임베딩을 반환 (캐시 적중 시 임베딩 API를 호출하지 않음)"""
+    with tracing.span("embed", cache_hit=True) as span:
+        def create(text):
+            span.set("cache_hit", False)
+            response = get_caller("openai.embed").call(client.embeddings.create, input=[text], model=deployment,
+                                                       hedge=True)
+            if response.usage:
+                span.add_tokens("embedding_tokens", response.usage.prompt_tokens)
+            return response.data[0].embedding
+
+        return get_default_cache().get_or_create(query, deployment, create)
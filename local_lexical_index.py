@@ -0,0 +1,308 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from token_counter import count_tokens
+
+load_dotenv()
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(".cache", "lexical_index"))
+LEXICAL_PASSAGE_TOKENS = int(os.getenv("LEXICAL_PASSAGE_TOKENS", "400"))  # 마크다운을 나눌 단락 크기
+LEXICAL_INDEX_REFRESH_SECONDS = 60  # 수집 스크립트가 세그먼트를 바꿨는지 확인하는 간격
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_PATTERN = re.compile(r"[가-힣]+|[0-9a-z_]+")
+_HANGUL_WORD_PATTERN = re.compile(r"[가-힣]+")
+
+
+def tokenize(text):
+    """
+    공백/기호 기준 단어와, 한글 단어의 글자 바이그램을 함께 토큰으로 사용합니다.
+    "배포일자를"은 [배포일자를, 배포, 포일, 일자, 자를]이 되어 "배포 일자"로 검색해도 찾을 수 있습니다.
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        tokens.append(word)
+        if len(word) > 2 and _HANGUL_WORD_PATTERN.fullmatch(word):
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def split_passages(markdown_text, max_tokens=LEXICAL_PASSAGE_TOKENS):
+    """마크다운을 빈 줄 기준 문단으로 나누고, 토큰 한도까지 이어 붙여 검색 단위 단락을 만듦"""
+    passages = []
+    current = []
+    current_tokens = 0
+    for paragraph in re.split(r"\n\s*\n", markdown_text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            passages.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+# 검색 한 번이 읽는 인덱스 상태. 다시 읽을 때는 새 스냅숏을 통째로 바꿔 끼우므로 검색 중에 섞이지 않음
+_IndexSnapshot = namedtuple("_IndexSnapshot", ["vocabulary", "offsets", "doc_ids", "tfs", "length_norms", "documents"])
+
+
+def _segment_path(name, path):
+    return os.path.join(path, hashlib.md5(name.encode("utf-8")).hexdigest()[:16] + ".npz")
+
+
+def has_segment(name, path=LEXICAL_INDEX_PATH):
+    return os.path.exists(_segment_path(name, path))
+
+
+def write_segment(name, markdown_files, path=LEXICAL_INDEX_PATH):
+    """
+    PDF 하나(name)의 마크다운 파일들 [(파일명, 텍스트), ...]로 세그먼트를 만들어 저장합니다.
+    세그먼트는 PDF마다 파일 하나이므로 여러 수집 워커가 동시에 써도 서로 영향이 없습니다.
+    반환값은 색인한 단락 수입니다.
+    """
+    documents = []
+    for filename, markdown_text in markdown_files:
+        for passage in split_passages(markdown_text):
+            documents.append({"title": filename, "chunk": passage})
+
+    postings = {}
+    doc_lengths = []
+    for doc_id, document in enumerate(documents):
+        counts = Counter(tokenize(document["title"]) + tokenize(document["chunk"]))
+        doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, tf))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    doc_ids = np.fromiter((doc_id for term in terms for doc_id, _ in postings[term]), dtype=np.int32, count=offsets[-1])
+    tfs = np.fromiter((min(tf, 65535) for term in terms for _, tf in postings[term]), dtype=np.uint16, count=offsets[-1])
+
+    os.makedirs(path, exist_ok=True)
+    segment_path = _segment_path(name, path)
+    tmp_path = segment_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            name=np.array(name),
+            terms=np.array(terms, dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids,
+            tfs=tfs,
+            doc_lengths=np.array(doc_lengths, dtype=np.int32),
+            documents=np.array(json.dumps(documents, ensure_ascii=False)),
+        )
+    os.replace(tmp_path, segment_path)
+    return len(documents)
+
+
+def remove_segment(name, path=LEXICAL_INDEX_PATH):
+    if has_segment(name, path):
+        os.remove(_segment_path(name, path))
+
+
+class LocalLexicalIndex:
+    """
+    PDF별 세그먼트를 하나로 합친 BM25 역색인.
+    포스팅은 CSR 형태(용어별 시작 위치 + 문서 번호/빈도 배열)로 메모리에 두고,
+    검색 시 질문 용어의 포스팅만 NumPy로 누적해 점수를 계산합니다.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = self._current_signature()
+        self._checked_at = time.time()
+        self._snapshot = self._load(self._signature)
+
+    def _current_signature(self):
+        if not os.path.isdir(self.path):
+            return ()
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in os.scandir(self.path) if entry.name.endswith(".npz")
+        ))
+
+    def _load(self, signature):
+        """signature의 세그먼트 파일들을 읽어 새 스냅숏을 만듦 (현재 스냅숏은 건드리지 않음)"""
+        segments = []
+        for filename, _ in signature:
+            with np.load(os.path.join(self.path, filename)) as data:
+                segments.append({key: data[key] for key in data.files})
+
+        # 세그먼트별 용어 번호를 전체 용어 번호로 바꾼 뒤 용어 순서로 다시 정렬해 하나의 CSR로 합침
+        terms = np.unique(np.concatenate([segment["terms"] for segment in segments])) if segments else np.array([], dtype=str)
+        term_ids, doc_ids, tfs, doc_lengths, documents = [], [], [], [], []
+        for segment in segments:
+            local_to_global = np.searchsorted(terms, segment["terms"])
+            term_ids.append(np.repeat(local_to_global, np.diff(segment["offsets"])))
+            doc_ids.append(segment["doc_ids"].astype(np.int32) + len(documents))
+            tfs.append(segment["tfs"])
+            doc_lengths.append(segment["doc_lengths"])
+            documents.extend(json.loads(str(segment["documents"])))
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        if segments:
+            term_ids = np.concatenate(term_ids)
+            order = np.argsort(term_ids, kind="stable")
+            doc_ids = np.concatenate(doc_ids)[order]
+            tfs = np.concatenate(tfs)[order].astype(np.float32)
+            offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(terms)))
+            lengths = np.concatenate(doc_lengths).astype(np.float32)
+        else:
+            doc_ids = np.empty(0, dtype=np.int32)
+            tfs = np.empty(0, dtype=np.float32)
+            lengths = np.empty(0, dtype=np.float32)
+
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        return _IndexSnapshot(
+            vocabulary={term: term_id for term_id, term in enumerate(terms.tolist())},
+            offsets=offsets,
+            doc_ids=doc_ids,
+            tfs=tfs,
+            # 문서 길이 정규화 항은 문서마다 고정이므로 미리 계산
+            length_norms=BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length),
+            documents=documents,
+        )
+
+    def refresh(self):
+        """세그먼트 파일이 바뀌었으면 다시 읽음 (LEXICAL_INDEX_REFRESH_SECONDS 간격으로만 확인)"""
+        # 다른 스레드가 다시 읽는 중이면 기다리지 않고 현재 스냅숏으로 검색
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if time.time() - self._checked_at < LEXICAL_INDEX_REFRESH_SECONDS:
+                return
+            self._checked_at = time.time()
+            signature = self._current_signature()
+            if signature != self._signature:
+                try:
+                    snapshot = self._load(signature)
+                except OSError as e:
+                    # 수집 스크립트가 세그먼트를 바꾸는 중이면 현재 스냅숏을 유지하고 다음 확인 때 다시 읽음
+                    print(f"키워드 인덱스 다시 읽기 실패: {e}")
+                    return
+                # 다 만든 뒤 한 번에 바꿔 끼우므로 잠금 없이 검색하는 스레드도 이전/새 스냅숏 중 하나만 봄
+                self._snapshot = snapshot
+                self._signature = signature
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._snapshot.documents)
+
+    def search(self, query, top=10):
+        """BM25 점수 상위 top개 단락을 Azure AI Search 결과와 같은 형태의 dict로 반환"""
+        self.refresh()
+        snapshot = self._snapshot
+        document_count = len(snapshot.documents)
+        if not document_count:
+            return []
+
+        scores = np.zeros(document_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = snapshot.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = snapshot.offsets[term_id], snapshot.offsets[term_id + 1]
+            docs = snapshot.doc_ids[start:end]
+            tf = snapshot.tfs[start:end]
+            idf = math.log(1 + (document_count - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + snapshot.length_norms[docs])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > top:
+            matched = matched[np.argpartition(-scores[matched], top - 1)[:top]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [dict(snapshot.documents[doc_id], **{"@search.score": float(scores[doc_id])}) for doc_id in matched]
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_lexical_index():
+    """프로세스 전체에서 공유하는 로컬 키워드 인덱스"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = LocalLexicalIndex()
+        return _default_index
+
+
+def rebuild_from_storage(container_client, path=LEXICAL_INDEX_PATH):
+    """Storage의 *_metadata.json에 기록된 마크다운으로 모든 세그먼트를 다시 만듦"""
+    started_at = time.time()
+    total = 0
+    for blob in container_client.list_blobs():
+        if not blob.name.endswith("_metadata.json"):
+            continue
+        metadata = json.loads(container_client.download_blob(blob.name).readall())
+        markdown_files = []
+        for entry in metadata.get("chunks", []):
+            markdown = container_client.download_blob(entry["blob_path"]).readall().decode("utf-8")
+            markdown_files.append((entry["filename"], markdown))
+        count = write_segment(metadata["pdf_name"], markdown_files, path)
+        total += count
+        print(f"- {metadata['pdf_name']}: {count}개 단락")
+    print(f"키워드 인덱스 재구성 완료: {total}개 단락 ({time.time() - started_at:.1f}초)")
+
+
+def main():
+    print("로컬 키워드(BM25) 인덱스 도구")
+    print("=" * 50)
+
+    while True:
+        print("\n처리 옵션을 선택하세요:")
+        print("1. Storage의 마크다운으로 전체 재구성")
+        print("2. 검색 테스트")
+        print("3. 종료")
+
+        choice = input("선택 (1-3): ").strip()
+
+        if choice == '1':
+            from azure.storage.blob import BlobServiceClient
+
+            blob_service_client = BlobServiceClient.from_connection_string(os.getenv("AZURE_STORAGE_CONNECTION_STRING"))
+            container_client = blob_service_client.get_container_client(
+                os.getenv("AZURE_STORAGE_CONTAINER_NAME", "documents")
+            )
+            rebuild_from_storage(container_client)
+        elif choice == '2':
+            index = LocalLexicalIndex()
+            query = input("검색어를 입력하세요: ").strip()
+            started_at = time.perf_counter()
+            results = index.search(query)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            print(f"\n{len(index)}개 단락 중 {len(results)}개 결과 ({elapsed_ms:.2f}ms)")
+            for result in results:
+                print(f"  [BM25 점수: {result['@search.score']:.4f}] {result['title']}")
+                print(f"  - 내용: {result['chunk'][:200]}...")
+                print("-" * 20)
+        elif choice == '3':
+            print("프로그램을 종료합니다.")
+            break
+        else:
+            print("잘못된 선택입니다. 다시 선택해주세요.")
+
+if __name__ == "__main__":
+    main()
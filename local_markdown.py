@@ -0,0 +1,149 @@
+import re
+from collections import Counter
+
+# 복잡도 판단 기준
+MAX_DRAWINGS_WITHOUT_TABLE = 40  # 표가 아닌 도형이 이보다 많으면 다이어그램으로 보고 LLM 사용
+MAX_TABLE_COLUMNS = 12  # 열이 너무 많은 표는 로컬 변환 품질이 떨어짐
+HEADING_SIZE_RATIO = 1.15  # 본문 글자 크기 대비 이 비율 이상이면 제목으로 취급
+
+_BULLET_PATTERN = re.compile(r"^\s*[•●○▪■□◦‣∙·\-–]\s+")
+_NUMBERED_PATTERN = re.compile(r"^\s*\d+[.)]\s+")
+_JSON_LINE_PATTERN = re.compile(r'^\s*([{}\[\]],?|"[^"]+"\s*:)')
+_MONOSPACE_FONT_PATTERN = re.compile(r"mono|courier|consol|menlo|code", re.IGNORECASE)
+
+
+def _is_monospace(span):
+    # PyMuPDF span flags: 8 = monospace
+    return bool(span["flags"] & 8) or bool(_MONOSPACE_FONT_PATTERN.search(span["font"]))
+
+
+def _is_bold(span):
+    # PyMuPDF span flags: 16 = bold
+    return bool(span["flags"] & 16) or "bold" in span["font"].lower()
+
+
+def _inside(bbox, rect):
+    x0, y0, x1, y1 = bbox
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    return rect[0] <= cx <= rect[2] and rect[1] <= cy <= rect[3]
+
+
+def analyze_page(page):
+    """페이지의 텍스트 구조와 표를 한 번만 추출해서 분류와 변환에 함께 사용"""
+    text_dict = page.get_text("dict")
+    tables = page.find_tables().tables
+    table_rects = [tuple(table.bbox) for table in tables]
+
+    lines = []
+    for block in text_dict["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans or any(_inside(line["bbox"], rect) for rect in table_rects):
+                continue
+            lines.append({"block": block["number"], "bbox": line["bbox"], "spans": spans})
+
+    return {"lines": lines, "tables": tables, "drawings": len(page.get_drawings())}
+
+
+def classify_page(analysis):
+    """
+    페이지를 로컬 변환으로 충분한지 판단합니다.
+    (로컬 변환 가능 여부, 사유)를 반환합니다.
+    """
+    for table in analysis["tables"]:
+        cells = table.extract()
+        if table.col_count > MAX_TABLE_COLUMNS:
+            return False, "wide_table"
+        # 병합 셀(None)이 있는 표는 구조 복원이 어려움
+        if any(cell is None for row in cells for cell in row):
+            return False, "merged_cells"
+
+    table_drawings = sum(table.row_count * table.col_count for table in analysis["tables"]) * 4
+    if analysis["drawings"] - table_drawings > MAX_DRAWINGS_WITHOUT_TABLE:
+        return False, "diagram"
+
+    # 고정폭 글꼴이 아닌 JSON/코드 샘플은 코드 블록 경계를 LLM이 판단해야 함
+    json_lines = 0
+    for line in analysis["lines"]:
+        text = "".join(span["text"] for span in line["spans"])
+        if _JSON_LINE_PATTERN.match(text) and not all(_is_monospace(span) for span in line["spans"]):
+            json_lines += 1
+    if json_lines >= 3:
+        return False, "unformatted_code"
+
+    return True, "simple"
+
+
+def _body_font_size(lines):
+    sizes = Counter()
+    for line in lines:
+        for span in line["spans"]:
+            sizes[round(span["size"], 1)] += len(span["text"])
+    return sizes.most_common(1)[0][0] if sizes else 0
+
+
+def _table_to_markdown(table):
+    rows = [[(cell or "").replace("\n", " ").replace("|", "\\|").strip() for cell in row] for row in table.extract()]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    markdown = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * width]
+    markdown += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(markdown)
+
+
+def page_to_markdown(page_num, analysis, images=()):
+    """글자 크기로 제목, find_tables 결과로 표를 구분해서 페이지를 마크다운으로 변환"""
+    lines = analysis["lines"]
+    body_size = _body_font_size(lines)
+    # 본문보다 큰 글자 크기를 큰 순서대로 #, ##, ### 에 대응
+    heading_sizes = sorted({round(span["size"], 1) for line in lines for span in line["spans"]
+                            if body_size and span["size"] >= body_size * HEADING_SIZE_RATIO}, reverse=True)[:3]
+
+    # (y, x, 종류, 내용, 블록 번호) 목록을 만들어 위치 순서대로 출력
+    items = [(table.bbox[1], table.bbox[0], "table", _table_to_markdown(table), None) for table in analysis["tables"]]
+    for line in lines:
+        text = "".join(span["text"] for span in line["spans"]).strip()
+        size = max(round(span["size"], 1) for span in line["spans"])
+        if size in heading_sizes:
+            kind = "h" + str(heading_sizes.index(size) + 1)
+        elif all(_is_monospace(span) for span in line["spans"]):
+            kind = "code"
+            text = "".join(span["text"] for span in line["spans"]).rstrip()
+        elif _BULLET_PATTERN.match(text):
+            kind, text = "list", "- " + _BULLET_PATTERN.sub("", text)
+        elif _NUMBERED_PATTERN.match(text):
+            kind = "list"
+        elif all(_is_bold(span) for span in line["spans"]) and len(text) < 80:
+            kind, text = "bold", f"**{text}**"
+        else:
+            kind = "text"
+        items.append((line["bbox"][1], line["bbox"][0], kind, text, line["block"]))
+    items.sort(key=lambda item: (round(item[0]), item[1]))
+
+    output = [f"*— 페이지 {page_num} —*"]
+    previous_kind, previous_block = None, None
+    for _, _, kind, text, block in items:
+        if kind == "code":
+            if previous_kind == "code":
+                output[-1] = output[-1][:-3] + text + "\n```"
+            else:
+                output.append("```\n" + text + "\n```")
+        elif kind == "text" and previous_kind == "text" and block == previous_block:
+            # 같은 블록 안의 줄바꿈은 문단으로 이어 붙임
+            output[-1] += " " + text
+        elif kind == "list" and previous_kind == "list":
+            output[-1] += "\n" + text
+        elif kind.startswith("h"):
+            output.append("#" * int(kind[1]) + " " + text)
+        else:
+            output.append(text)
+        previous_kind, previous_block = kind, block
+
+    for img in images:
+        output.append(f"![{img['filename']}]({img['url']})")
+
+    return "\n\n".join(output)
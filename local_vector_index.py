@@ -0,0 +1,316 @@
+import json
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from local_lexical_index import get_default_lexical_index
+
+load_dotenv()
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join(".cache", "local_index"))
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "auto")  # auto: IVF가 구성되어 있으면 IVF, 없으면 전체 검색
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))  # IVF 검색 시 살펴볼 클러스터 수
+BLOCK_ROWS = 65536  # 전체 검색 시 한 번에 내적을 계산할 행 수 (memmap에서 블록 단위로 읽음)
+VECTOR_FIELD = "text_vector"
+DOCUMENT_FIELDS = ["title", "chunk"]
+DEFAULT_TOP = 50  # top을 주지 않았을 때 반환할 결과 수 (Azure AI Search 기본값과 같음)
+
+MANIFEST_NAME = "index.json"
+VECTORS_NAME = "vectors.f32"
+DOCUMENTS_NAME = "documents.jsonl"
+IVF_CENTROIDS_NAME = "ivf_centroids.npy"
+IVF_ORDER_NAME = "ivf_order.npy"
+IVF_OFFSETS_NAME = "ivf_offsets.npy"
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """점수가 높은 순으로 (위치, 점수) 상위 k개"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    positions = np.argpartition(-scores, k - 1)[:k]
+    positions = positions[np.argsort(-scores[positions])]
+    return positions, scores[positions]
+
+
+def export_search_index(search_client, path=LOCAL_INDEX_PATH, fields=DOCUMENT_FIELDS, vector_field=VECTOR_FIELD):
+    """
+    Azure AI Search 인덱스의 title/chunk/text_vector를 로컬 인덱스로 내보냅니다.
+    벡터는 정규화한 float32 행렬 파일(memmap으로 읽음)로, 문서 필드는 같은 순서의 JSONL로 저장합니다.
+    """
+    os.makedirs(path, exist_ok=True)
+    vectors_tmp = os.path.join(path, VECTORS_NAME + ".tmp")
+    documents_tmp = os.path.join(path, DOCUMENTS_NAME + ".tmp")
+
+    started_at = time.time()
+    count = 0
+    skipped = 0
+    dim = None
+    results = search_client.search(search_text="*", select=list(fields) + [vector_field])
+    with open(vectors_tmp, "wb") as vectors_file, open(documents_tmp, "w", encoding="utf-8") as documents_file:
+        for result in results:
+            vector = result.get(vector_field)
+            if not vector or (dim is not None and len(vector) != dim):
+                skipped += 1
+                continue
+            dim = len(vector)
+            vectors_file.write(_normalize(vector).tobytes())
+            documents_file.write(json.dumps({field: result.get(field) for field in fields}, ensure_ascii=False) + "\n")
+            count += 1
+
+    if count == 0:
+        os.remove(vectors_tmp)
+        os.remove(documents_tmp)
+        print("내보낼 벡터가 없습니다. 인덱스와 벡터 필드 이름을 확인하세요.")
+        return None
+
+    # 이전 IVF 구성은 새 행 순서와 맞지 않으므로 삭제
+    for name in (IVF_CENTROIDS_NAME, IVF_ORDER_NAME, IVF_OFFSETS_NAME):
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    os.replace(vectors_tmp, os.path.join(path, VECTORS_NAME))
+    os.replace(documents_tmp, os.path.join(path, DOCUMENTS_NAME))
+    manifest = {
+        "count": count,
+        "dim": dim,
+        "fields": list(fields),
+        "vector_field": vector_field,
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ivf_lists": 0,
+    }
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"로컬 인덱스 내보내기 완료: {count}개 문서, {dim}차원 ({time.time() - started_at:.1f}초)"
+          + (f", 벡터 없는 문서 {skipped}개 제외" if skipped else ""))
+    return manifest
+
+
+def build_ivf(path=LOCAL_INDEX_PATH, n_lists=None, iterations=10, sample_size=100000, seed=0):
+    """
+    큰 인덱스용 IVF(클러스터) 구성을 만듭니다.
+    정규화된 벡터를 구면 k-means로 n_lists개 클러스터로 나누고, 행 번호를 클러스터 순서로 정렬해 저장합니다.
+    """
+    index = LocalVectorIndex(path, mode="exact")
+    count = index.count
+    n_lists = n_lists or max(1, int(np.sqrt(count)))
+    rng = np.random.default_rng(seed)
+
+    sample_rows = np.sort(rng.choice(count, size=min(count, sample_size), replace=False))
+    sample = np.asarray(index.vectors[sample_rows])
+    centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for list_id in range(len(centroids)):
+            members = sample[assignment == list_id]
+            if len(members):
+                centroids[list_id] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+
+    assignment = np.empty(count, dtype=np.int64)
+    for start in range(0, count, BLOCK_ROWS):
+        block = np.asarray(index.vectors[start:start + BLOCK_ROWS])
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+
+    np.save(os.path.join(path, IVF_CENTROIDS_NAME), centroids)
+    np.save(os.path.join(path, IVF_ORDER_NAME), order)
+    np.save(os.path.join(path, IVF_OFFSETS_NAME), offsets)
+    index.manifest["ivf_lists"] = len(centroids)
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(index.manifest, f, ensure_ascii=False, indent=2)
+    print(f"IVF 구성 완료: {count}개 벡터 → {len(centroids)}개 클러스터")
+    return len(centroids)
+
+
+class LocalVectorIndex:
+    """
+    export_search_index로 만든 로컬 인덱스.
+    벡터 행렬은 memmap으로 열어 필요한 블록만 메모리에 올리고, 정규화된 벡터의 내적(코사인 유사도)으로 검색합니다.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH, mode=LOCAL_INDEX_MODE, nprobe=LOCAL_INDEX_NPROBE):
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.vectors = np.memmap(os.path.join(path, VECTORS_NAME), dtype=np.float32, mode="r",
+                                 shape=(self.count, self.dim))
+        with open(os.path.join(path, DOCUMENTS_NAME), encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f]
+        self.nprobe = nprobe
+
+        self.centroids = None
+        if mode != "exact" and self.manifest.get("ivf_lists"):
+            self.centroids = np.load(os.path.join(path, IVF_CENTROIDS_NAME))
+            self.order = np.load(os.path.join(path, IVF_ORDER_NAME))
+            self.offsets = np.load(os.path.join(path, IVF_OFFSETS_NAME))
+        elif mode == "ivf":
+            raise ValueError("IVF 구성이 없습니다. 먼저 build_ivf를 실행하세요.")
+
+    def search_batch(self, query_vectors, k):
+        """여러 질문 벡터를 한 번에 검색해 질문별 [(행 번호, 점수), ...]를 반환"""
+        queries = _normalize(np.atleast_2d(query_vectors))
+        if self.centroids is not None:
+            return [self._search_ivf(query, k) for query in queries]
+
+        # 전체 검색: 블록마다 (블록 행 수 × 질문 수) 내적을 계산하고 블록별 상위 k개만 남김
+        best_rows = [[] for _ in queries]
+        best_scores = [[] for _ in queries]
+        for start in range(0, self.count, BLOCK_ROWS):
+            scores = np.asarray(self.vectors[start:start + BLOCK_ROWS]) @ queries.T
+            for query_id in range(len(queries)):
+                positions, top_scores = _top_k(scores[:, query_id], k)
+                best_rows[query_id].append(positions + start)
+                best_scores[query_id].append(top_scores)
+
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            rows, scores = np.concatenate(rows), np.concatenate(scores)
+            positions, top_scores = _top_k(scores, k)
+            results.append(list(zip(rows[positions].tolist(), top_scores.tolist())))
+        return results
+
+    def _search_ivf(self, query, k):
+        probe_lists = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        rows = np.sort(np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in probe_lists]))
+        positions, scores = _top_k(np.asarray(self.vectors[rows]) @ query, k)
+        return list(zip(rows[positions].tolist(), scores.tolist()))
+
+    def search(self, query_vector, k):
+        return self.search_batch([query_vector], k)[0]
+
+
+class LocalSearchClient:
+    """
+    azure.search.documents.SearchClient.search와 같은 방식으로 호출할 수 있는 로컬 검색 클라이언트.
+    RAG_SEARCH_BACKEND=local일 때 get_rag_response와 run_vector_search가 Azure AI Search 대신 사용합니다.
+    search_text(키워드 검색)는 로컬 BM25 인덱스(local_lexical_index)로 검색하고,
+    벡터 쿼리와 함께 주면 Azure 하이브리드 검색처럼 두 결과를 RRF로 합칩니다.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH, lexical_index=None, **kwargs):
+        self.index = LocalVectorIndex(path, **kwargs)
+        self._lexical_index = lexical_index
+
+    @property
+    def lexical_index(self):
+        if self._lexical_index is None:
+            self._lexical_index = get_default_lexical_index()
+        return self._lexical_index
+
+    def search(self, search_text=None, vector_queries=None, select=None, top=None, **kwargs):
+        vector_results = self._vector_search(vector_queries, select, top) if vector_queries else []
+        if not search_text:
+            return vector_results
+
+        # 키워드 검색 결과는 로컬 BM25 인덱스에서 (세그먼트가 없으면 빈 결과이므로 벡터 결과만 남음)
+        fields = select or self.index.manifest["fields"]
+        text_results = [
+            {**{field: result[field] for field in fields if field in result}, "@search.score": result["@search.score"]}
+            for result in self.lexical_index.search(search_text, top or DEFAULT_TOP)
+        ]
+        if not vector_queries:
+            return text_results
+        # async_retrieval이 이 모듈을 임포트하므로 순환 임포트를 피해 호출 시점에 임포트
+        from async_retrieval import reciprocal_rank_fusion
+
+        # 두 결과에 모두 있는 문서는 먼저 나온 쪽의 필드를 쓰므로 벡터 필드가 남도록 벡터 결과를 앞에 둠
+        return reciprocal_rank_fusion([vector_results, text_results], top=top or DEFAULT_TOP)
+
+    def _vector_search(self, vector_queries, select, top):
+        best = {}
+        for vector_query in vector_queries or []:
+            for row, score in self.index.search(vector_query.vector, vector_query.k_nearest_neighbors):
+                best[row] = max(score, best.get(row, score))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        if top:
+            ranked = ranked[:top]
+
+        fields = select or self.index.manifest["fields"]
+        results = []
+        for row, score in ranked:
+            document = self.index.documents[row]
+            result = {field: document[field] for field in fields if field in document}
+            if self.index.manifest["vector_field"] in fields:
+                result[self.index.manifest["vector_field"]] = self.index.vectors[row].tolist()
+            result["@search.score"] = score
+            results.append(result)
+        return results
+
+    def close(self):
+        pass
+
+
+def benchmark(path=LOCAL_INDEX_PATH, queries=100, k=10):
+    """저장된 벡터를 질문으로 사용해 전체 검색과 IVF 검색의 속도와 재현율을 비교 (네트워크 불필요)"""
+    exact = LocalVectorIndex(path, mode="exact")
+    rng = np.random.default_rng(0)
+    query_vectors = np.asarray(exact.vectors[np.sort(rng.choice(exact.count, size=min(queries, exact.count), replace=False))])
+
+    started_at = time.perf_counter()
+    exact_results = exact.search_batch(query_vectors, k)
+    exact_seconds = time.perf_counter() - started_at
+    print(f"전체 검색: 질문 {len(query_vectors)}개, 질문당 {exact_seconds / len(query_vectors) * 1000:.2f}ms")
+
+    if not exact.manifest.get("ivf_lists"):
+        print("IVF 구성이 없어 IVF 비교는 건너뜁니다.")
+        return
+    ivf = LocalVectorIndex(path, mode="ivf")
+    started_at = time.perf_counter()
+    ivf_results = ivf.search_batch(query_vectors, k)
+    ivf_seconds = time.perf_counter() - started_at
+    recall = np.mean([
+        len({row for row, _ in a} & {row for row, _ in b}) / max(1, len(a))
+        for a, b in zip(exact_results, ivf_results)
+    ])
+    print(f"IVF 검색 (nprobe={ivf.nprobe}): 질문당 {ivf_seconds / len(query_vectors) * 1000:.2f}ms, "
+          f"recall@{k} {recall:.3f}")
+
+
+def main():
+    print("로컬 벡터 인덱스 도구")
+    print("=" * 50)
+
+    while True:
+        print("\n처리 옵션을 선택하세요:")
+        print("1. Azure AI Search 인덱스 내보내기")
+        print("2. IVF(클러스터) 구성")
+        print("3. 전체 검색 / IVF 검색 비교")
+        print("4. 종료")
+
+        choice = input("선택 (1-4): ").strip()
+
+        if choice == '1':
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents import SearchClient
+
+            search_client = SearchClient(
+                credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_API_KEY")),
+                endpoint=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
+                index_name=os.getenv("AZURE_SEARCH_INDEX_NAME"),
+            )
+            export_search_index(search_client)
+        elif choice == '2':
+            n_lists = input("클러스터 수 (빈 값이면 √문서 수): ").strip()
+            build_ivf(n_lists=int(n_lists) if n_lists else None)
+        elif choice == '3':
+            benchmark()
+        elif choice == '4':
+            print("프로그램을 종료합니다.")
+            break
+        else:
+            print("잘못된 선택입니다. 다시 선택해주세요.")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from openai import AzureOpenAI
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.models import VectorizedQuery
+from local_vector_index import LocalSearchClient
 
 # .env 파일에서 환경 변수를 로드합니다 (권장 방식)
 load_dotenv()
@@ -20,6 +21,7 @@ AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_EMBBEDING_API_VERSION")
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
 AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
 AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY") # 검색용 쿼리 키
+RAG_SEARCH_BACKEND = os.getenv("RAG_SEARCH_BACKEND", "azure")  # local이면 로컬 벡터 인덱스 사용
 
 # Azure 인덱스에 정의된 벡터 필드의 이름
 # 인덱스 생성 시 설정한 이름으로 변경해야 합니다.
@@ -47,12 +49,15 @@ def run_vector_search(query_text: str):
             api_key=AZURE_OPENAI_API_KEY,
         )
         
-        # Azure Search 클라이언트 초기화
-        search_client = SearchClient(
-            endpoint=AZURE_SEARCH_ENDPOINT,
-            index_name=AZURE_SEARCH_INDEX_NAME,
-            credential=AzureKeyCredential(AZURE_SEARCH_KEY)
-        )
+        # Azure Search 클라이언트 초기화 (RAG_SEARCH_BACKEND=local이면 로컬 벡터 인덱스)
+        if RAG_SEARCH_BACKEND == "local":
+            search_client = LocalSearchClient()
+        else:
+            search_client = SearchClient(
+                endpoint=AZURE_SEARCH_ENDPOINT,
+                index_name=AZURE_SEARCH_INDEX_NAME,
+                credential=AzureKeyCredential(AZURE_SEARCH_KEY)
+            )
         
         # 1단계: 사용자 쿼리를 벡터로 변환
         query_vector = generate_embedding(query_text, openai_client)
@@ -7,8 +7,22 @@ import json
 import hashlib
 from PIL import Image
 import io
-from azure.storage.blob import BlobServiceClient
-from azure.core.exceptions import AzureError
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from contextlib import contextmanager
+import multiprocessing
+import queue
+import threading
+import tracing
+from rate_limiter import TokenBucketLimiter
+from token_counter import count_tokens
+from local_markdown import analyze_page, classify_page, page_to_markdown
+from local_lexical_index import has_segment, write_segment
+from answer_cache import INDEX_VERSION_BLOB_NAME
+from resilient_calls import get_caller
+from blob_uploader import BulkBlobUploader, create_pooled_blob_service_client, format_upload_stats
+from search_indexer import DirectIndexer, format_index_stats
 
 # 환경변수 
 load_dotenv()
@@ -23,136 +37,270 @@ azure_deployment_name = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")   # Azure
 storage_connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 storage_container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME", "documents")  # 기본값 설정
 
-# OpenAI 클라이언트 초기화
+# 마크다운 변환 동시성 및 호출 한도 설정
+convert_workers = int(os.getenv("MARKDOWN_CONVERT_WORKERS", "4"))  # 동시에 변환할 청크 수
+chat_rpm = int(os.getenv("AZURE_OPENAI_CHAT_RPM", "60"))  # 배포의 분당 요청 한도
+chat_tpm = int(os.getenv("AZURE_OPENAI_CHAT_TPM", "60000"))  # 배포의 분당 토큰 한도
+markdown_max_tokens = int(os.getenv("MARKDOWN_MAX_TOKENS", "4000"))  # 청크당 최대 출력 토큰
+chunk_input_tokens = int(os.getenv("MARKDOWN_CHUNK_INPUT_TOKENS", "12000"))  # 청크당 입력 토큰 한도
+chunk_output_tokens = int(os.getenv("MARKDOWN_CHUNK_OUTPUT_TOKENS", str(int(markdown_max_tokens * 0.9))))  # 청크당 예상 출력 토큰 한도
+markdown_output_ratio = float(os.getenv("MARKDOWN_OUTPUT_RATIO", "1.3"))  # 입력 대비 마크다운 출력 토큰 비율 추정치
+markdown_retry_max_tokens = int(os.getenv("MARKDOWN_RETRY_MAX_TOKENS", "16000"))  # 한 페이지가 잘렸을 때 재시도할 최대 출력 토큰
+local_fastpath = os.getenv("MARKDOWN_LOCAL_FASTPATH", "false").lower() in ("1", "true", "yes")  # 단순한 페이지는 LLM 없이 로컬 변환
+local_min_run = int(os.getenv("MARKDOWN_LOCAL_MIN_RUN", "2"))  # LLM 페이지 사이에 낀 로컬 페이지가 이보다 적으면 LLM으로 함께 변환
+
+# 여러 PDF 동시 처리 설정 (PyMuPDF 파싱은 CPU 작업이라 프로세스 단위로 분산)
+ingest_workers = int(os.getenv("PDF_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))  # 동시에 처리할 PDF 수
+ingest_timeout = float(os.getenv("PDF_INGEST_TIMEOUT", "1800"))  # PDF당 최대 처리 시간(초)
+upload_workers = int(os.getenv("BLOB_UPLOAD_WORKERS", "8"))  # 동시에 업로드할 blob 수
+lexical_index_build = os.getenv("LEXICAL_INDEX_BUILD", "true").lower() == "true"  # 로컬 키워드 인덱스 세그먼트 갱신 여부
+direct_index_push = os.getenv("DIRECT_INDEX_PUSH", "false").lower() == "true"  # 인덱서 없이 청크·임베딩을 검색 인덱스에 직접 넣을지 여부
+
+# OpenAI 클라이언트 초기화 (재시도는 resilient_calls에서 처리하므로 SDK 자체 재시도는 끔)
 client = AzureOpenAI(
     api_version=azure_api_version,
     azure_endpoint=azure_endpoint,
-    api_key=azure_api_key
+    api_key=azure_api_key,
+    max_retries=0
 )
 
-# Azure Storage 클라이언트 초기화
-blob_service_client = BlobServiceClient.from_connection_string(storage_connection_string)
+# 변환 호출은 응답을 기다려도 되므로 질의 경로보다 오래, 여러 번 재시도하고 차단 중이면 풀릴 때까지 기다림 (페이지 누락 방지)
+markdown_caller = get_caller("openai.markdown", max_attempts=6, max_delay=60, wait_for_circuit=True)
+
+# Azure Storage 클라이언트 초기화 (업로드 워커들이 keep-alive 연결 풀을 공유)
+blob_service_client = create_pooled_blob_service_client(storage_connection_string, pool_size=upload_workers)
 container_client = blob_service_client.get_container_client(storage_container_name)
 
+# 이미지, 마크다운, 메타데이터 업로드를 모두 처리하는 병렬 업로더
+uploader = BulkBlobUploader(container_client, workers=upload_workers)
+
+# 마크다운을 검색 인덱스에 직접 넣는 인덱서 (DIRECT_INDEX_PUSH=true일 때만 사용)
+search_indexer = DirectIndexer(client)
+
+# 모든 변환 스레드가 공유하는 호출 한도 limiter
+chat_rate_limiter = TokenBucketLimiter(rpm=chat_rpm, tpm=chat_tpm)
+
+# 마크다운 변환 LLM 호출 통계 (호출 수, 잘려서 분할/재시도한 횟수, 최종적으로 잘린 청크 수)
+markdown_call_stats = {"calls": 0, "retries": 0, "truncated": 0, "local_pages": 0, "llm_pages": 0}
+markdown_call_stats_lock = threading.Lock()
+
+def count_markdown_call(key, count=1):
+    with markdown_call_stats_lock:
+        markdown_call_stats[key] += count
+
+# 단계별 누적 소요 시간(초). 변환과 업로드는 여러 스레드에서 동시에 실행되므로 스레드 시간의 합입니다.
+stage_timings = {}
+stage_timings_lock = threading.Lock()
+
+@contextmanager
+def timed_stage(name, traced=False):
+    """
+    with 블록의 소요 시간을 stage_timings[name]에 누적 (bench_ingest.py에서 단계별 처리량 측정에 사용).
+    traced=True이면 추적 span으로도 기록합니다 (페이지마다 반복되는 짧은 단계는 누적 시간만 기록).
+    """
+    started_at = time.perf_counter()
+    try:
+        if traced:
+            with tracing.span(name):
+                yield
+        else:
+            yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        with stage_timings_lock:
+            stage_timings[name] = stage_timings.get(name, 0.0) + elapsed
+
 def download_blob_to_memory(blob_name):
     """Azure Storage에서 blob을 메모리로 다운로드"""
     try:
-        blob_client = container_client.get_blob_client(blob_name)
-        blob_data = blob_client.download_blob().readall()
+        with timed_stage("download", traced=True):
+            blob_client = container_client.get_blob_client(blob_name)
+            blob_data = blob_client.download_blob().readall()
         return blob_data
     except AzureError as e:
         print(f"Blob 다운로드 오류 ({blob_name}): {e}")
         return None
 
+def get_blob_url(blob_name):
+    """blob 이름으로 접근 URL 생성"""
+    return uploader.get_blob_url(blob_name)
+
 def upload_blob_from_memory(blob_name, data, content_type="application/octet-stream"):
-    """메모리의 데이터를 Azure Storage에 업로드"""
-    try:
-        blob_client = container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(data, overwrite=True, content_type=content_type)
-        return f"https://{blob_service_client.account_name}.blob.core.windows.net/{storage_container_name}/{blob_name}"
-    except AzureError as e:
-        print(f"Blob 업로드 오류 ({blob_name}): {e}")
-        return None
+    """메모리의 데이터를 Azure Storage에 업로드 (업로더 워커 풀에서 실행하고 완료까지 대기)"""
+    return uploader.upload(blob_name, data, content_type)
 
-def extract_images_from_pdf_blob(pdf_blob_data, pdf_name):
-    """PDF blob에서 이미지를 추출하고 Azure Storage에 저장"""
-    # PDF 데이터를 메모리에서 열기
-    doc = fitz.open(stream=pdf_blob_data, filetype="pdf")
+# 이미지 저장소에 이미 있는 blob 이름 (프로세스당 한 번 목록 조회 후 업로드할 때마다 갱신)
+_stored_image_blobs = None
+_stored_image_blobs_lock = threading.Lock()
+
+def image_blob_exists(img_blob_path):
+    """이미지 저장소에 같은 해시의 이미지가 이미 있는지 확인"""
+    global _stored_image_blobs
+    with _stored_image_blobs_lock:
+        if _stored_image_blobs is None:
+            # 이미지마다 존재 여부를 묻지 않고 images/ 목록을 한 번에 조회
+            try:
+                _stored_image_blobs = {blob.name for blob in container_client.list_blobs(name_starts_with="images/")}
+            except AzureError as e:
+                print(f"이미지 목록 조회 오류: {e}")
+                _stored_image_blobs = set()
+        return img_blob_path in _stored_image_blobs
+
+def mark_image_blob_stored(img_blob_path, stored=True):
+    with _stored_image_blobs_lock:
+        if _stored_image_blobs is not None:
+            if stored:
+                _stored_image_blobs.add(img_blob_path)
+            else:
+                _stored_image_blobs.discard(img_blob_path)
+
+def on_image_uploaded(img_blob_path, future):
+    if future.result():
+        print(f"이미지 업로드 완료: {img_blob_path}")
+    else:
+        # 실패한 이미지는 다음에 다시 업로드되도록 목록에서 제거
+        mark_image_blob_stored(img_blob_path, stored=False)
+
+def store_image(doc, xref, xref_cache, pending_uploads):
+    """xref의 이미지를 해시 기반 경로로 저장하고 (파일명, 경로, URL, 해시) 반환"""
+    # 같은 문서에서 이미 처리한 xref는 다시 추출하지 않음
+    if xref in xref_cache:
+        return xref_cache[xref]
+    
+    # 이미지 데이터 추출
+    base_image = doc.extract_image(xref)
+    image_bytes = base_image["image"]
+    image_ext = base_image["ext"]
+    
+    # 이미지 해시로 파일명 생성 (문서, 페이지와 관계없이 같은 이미지는 한 번만 저장)
+    img_hash = hashlib.md5(image_bytes).hexdigest()
+    img_filename = f"{img_hash}.{image_ext}"
+    img_blob_path = f"images/{img_filename}"
+    
+    if not image_blob_exists(img_blob_path):
+        # 업로드는 기다리지 않고 대기열에 넣음 (URL은 경로로 미리 알 수 있음)
+        future = uploader.submit(img_blob_path, image_bytes, f"image/{image_ext}")
+        mark_image_blob_stored(img_blob_path)
+        future.add_done_callback(lambda f: on_image_uploaded(img_blob_path, f))
+        pending_uploads.append(future)
+    
+    xref_cache[xref] = (img_filename, img_blob_path, get_blob_url(img_blob_path), img_hash)
+    return xref_cache[xref]
+
+def extract_page_images(doc, page, xref_cache, pending_uploads):
+    """페이지의 이미지 참조 정보를 만들고 필요한 이미지만 Azure Storage에 저장"""
+    page_num = page.number + 1
     image_info = []
     
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        image_list = page.get_images()
-        
-        for img_index, img in enumerate(image_list):
-            try:
-                # 이미지 데이터 추출
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # 이미지 해시 생성 (중복 방지)
-                img_hash = hashlib.md5(image_bytes).hexdigest()
-                
-                # 이미지 파일명 생성
-                img_filename = f"{pdf_name}_page{page_num + 1}_img{img_index + 1}_{img_hash}.{image_ext}"
-                img_blob_path = f"images/{img_filename}"
-                
-                # Azure Storage에 이미지 업로드
-                content_type = f"image/{image_ext}"
-                img_url = upload_blob_from_memory(img_blob_path, image_bytes, content_type)
-                
-                if img_url:
-                    # 이미지 정보 저장
-                    image_info.append({
-                        "page_num": page_num + 1,
-                        "img_index": img_index + 1,
-                        "filename": img_filename,
-                        "blob_path": img_blob_path,
-                        "url": img_url,
-                        "hash": img_hash
-                    })
-                    
-                    print(f"이미지 업로드 완료: {img_blob_path}")
-                
-            except Exception as e:
-                print(f"이미지 추출 오류 (페이지 {page_num + 1}, 이미지 {img_index + 1}): {e}")
-    
-    doc.close()
+    for img_index, img in enumerate(page.get_images()):
+        try:
+            img_filename, img_blob_path, img_url, img_hash = store_image(doc, img[0], xref_cache, pending_uploads)
+            # 이미지 정보 저장
+            image_info.append({
+                "page_num": page_num,
+                "img_index": img_index + 1,
+                "filename": img_filename,
+                "blob_path": img_blob_path,
+                "url": img_url,
+                "hash": img_hash
+            })
+            
+        except Exception as e:
+            print(f"이미지 추출 오류 (페이지 {page_num}, 이미지 {img_index + 1}): {e}")
+    
     return image_info
 
-def extract_pdf_text_with_pages_blob(pdf_blob_data):
-    """PDF blob에서 페이지별로 텍스트 추출"""
+def iter_pdf_pages(pdf_blob_data, pending_uploads):
+    """PDF를 한 번만 열어서 페이지별 텍스트와 이미지를 순서대로 생성 (이미지 업로드 Future는 pending_uploads에 추가)"""
     doc = fitz.open(stream=pdf_blob_data, filetype="pdf")
-    pages_text = []
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        page_text = page.get_text()
-        pages_text.append({
-            "page_num": page_num + 1,
-            "text": page_text
-        })
-    
-    doc.close()
-    return pages_text
-
-def create_page_chunks(pages_text, chunk_size=40):
-    """페이지들을 지정된 크기로 청크 분할"""
-    chunks = []
-    total_pages = len(pages_text)
-    
-    for i in range(0, total_pages, chunk_size):
-        chunk_pages = pages_text[i:i + chunk_size]
-        start_page = chunk_pages[0]["page_num"]
-        end_page = chunk_pages[-1]["page_num"]
-        
-        # 청크 텍스트 결합
-        chunk_text = ""
-        for page_data in chunk_pages:
-            chunk_text += f"\n\n--- 페이지 {page_data['page_num']} ---\n"
-            chunk_text += page_data["text"]
-        
-        chunks.append({
-            "start_page": start_page,
-            "end_page": end_page,
-            "text": chunk_text,
-            "chunk_index": len(chunks)
-        })
-    
-    return chunks
+    xref_cache = {}
+    try:
+        for page in doc:
+            with timed_stage("text_extraction"):
+                text = page.get_text()
+            with timed_stage("image_extraction"):
+                images = extract_page_images(doc, page, xref_cache, pending_uploads)
+            page_data = {
+                "page_num": page.number + 1,
+                "text": text,
+                "images": images
+            }
+            if local_fastpath:
+                # 단순한 페이지는 레이아웃 정보로 바로 마크다운 생성
+                with timed_stage("local_markdown"):
+                    analysis = analyze_page(page)
+                    is_simple, page_data["complexity"] = classify_page(analysis)
+                    if is_simple:
+                        page_data["local_markdown"] = page_to_markdown(page_data["page_num"], analysis, page_data["images"])
+            yield page_data
+    finally:
+        doc.close()
 
-def get_images_for_chunk(image_info, start_page, end_page):
-    """특정 페이지 범위에 해당하는 이미지 정보 반환"""
+def build_page_chunk(chunk_pages, chunk_index):
+    """페이지 목록을 하나의 청크로 결합"""
+    # 청크 텍스트 결합
+    chunk_text = ""
     chunk_images = []
-    for img in image_info:
-        if start_page <= img["page_num"] <= end_page:
-            chunk_images.append(img)
-    return chunk_images
+    for page_data in chunk_pages:
+        chunk_text += f"\n\n--- 페이지 {page_data['page_num']} ---\n"
+        chunk_text += page_data["text"]
+        chunk_images.extend(page_data["images"])
+    
+    return {
+        "start_page": chunk_pages[0]["page_num"],
+        "end_page": chunk_pages[-1]["page_num"],
+        "text": chunk_text,
+        "images": chunk_images,
+        "pages": chunk_pages,
+        "chunk_index": chunk_index
+    }
 
-def summarize_to_markdown(text, chunk_info, chunk_images):
-    """텍스트를 마크다운으로 변환 (내용 생략 방지 강화)"""
+def page_tokens(page_data):
+    """페이지 구분선을 포함한 페이지 입력 토큰 수 (한 번만 계산)"""
+    if "tokens" not in page_data:
+        page_data["tokens"] = count_tokens(page_data["text"]) + 10
+    return page_data["tokens"]
+
+def iter_page_chunks(pages, input_budget=None, output_budget=None):
+    """
+    페이지 스트림을 입력/출력 토큰 한도 안에서 최대한 채운 청크로 묶어서 하나씩 생성.
+    페이지 중간에서는 나누지 않으며, 한도를 넘는 페이지는 단독 청크가 됩니다.
+    """
+    input_budget = input_budget or chunk_input_tokens
+    output_budget = output_budget or chunk_output_tokens
+    chunk_pages = []
+    chunk_tokens = 0
+    chunk_index = 0
+    
+    for page_data in pages:
+        tokens = page_tokens(page_data)
+        next_tokens = chunk_tokens + tokens
+        if chunk_pages and (next_tokens > input_budget or next_tokens * markdown_output_ratio > output_budget):
+            yield build_page_chunk(chunk_pages, chunk_index)
+            chunk_pages = []
+            chunk_tokens = 0
+            chunk_index += 1
+        chunk_pages.append(page_data)
+        chunk_tokens += tokens
+    
+    if chunk_pages:
+        yield build_page_chunk(chunk_pages, chunk_index)
+
+def with_last_flag(items):
+    """다음 항목을 하나 미리 읽어서 (항목, 마지막 여부)를 생성"""
+    iterator = iter(items)
+    try:
+        current = next(iterator)
+    except StopIteration:
+        return
+    for following in iterator:
+        yield current, False
+        current = following
+    yield current, True
+
+def summarize_to_markdown(text, chunk_info, chunk_images, max_tokens=None):
+    """텍스트를 마크다운으로 변환 (내용 생략 방지 강화), (마크다운, finish_reason) 반환"""
+    max_tokens = max_tokens or markdown_max_tokens
     try:
         # 이미지 정보 텍스트 생성
         images_text = ""
@@ -176,25 +324,189 @@ def summarize_to_markdown(text, chunk_info, chunk_images):
 원본 내용:
 {text}"""
 
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            model=azure_deployment_name,
-            max_tokens=4000
-        )
-        return response.choices[0].message.content
-    except openai.error.RateLimitError as e:
-        print(f"요청이 너무 많습니다. 잠시 후 다시 시도해주세요. 오류: {e}")
-        time.sleep(60)
-        return summarize_to_markdown(text, chunk_info, chunk_images)
+        # 출력 토큰은 최대치로 예약
+        chat_rate_limiter.acquire(count_tokens(prompt) + max_tokens)
+        count_markdown_call("calls")
+        with tracing.span("chat", max_tokens=max_tokens) as span:
+            response = markdown_caller.call(
+                client.chat.completions.create,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                model=azure_deployment_name,
+                max_tokens=max_tokens
+            )
+            choice = response.choices[0]
+            tracing.set_token_usage(span, response.usage, prompt, choice.message.content)
+            span.set("finish_reason", choice.finish_reason)
+        return choice.message.content, choice.finish_reason
     except Exception as e:
         print(f"마크다운 변환 오류: {e}")
+        return None, None
+
+def convert_chunk_to_markdown(chunk, chunk_images, max_tokens=None):
+    """
+    청크를 마크다운으로 변환하고 (마크다운, 잘림 여부) 반환.
+    출력이 max_tokens에서 잘리면 청크를 페이지 단위로 반으로 나눠서 다시 변환한 뒤 이어 붙입니다.
+    """
+    markdown_text, finish_reason = summarize_to_markdown(chunk["text"], chunk, chunk_images, max_tokens)
+    if not markdown_text or finish_reason != "length":
+        return markdown_text, False
+    
+    pages = chunk["pages"]
+    if len(pages) > 1:
+        # 토큰 수 기준으로 절반이 되는 페이지에서 분할
+        total = sum(page_tokens(page_data) for page_data in pages)
+        split_at, running = 1, 0
+        for i, page_data in enumerate(pages[:-1], 1):
+            running += page_tokens(page_data)
+            split_at = i
+            if running >= total / 2:
+                break
+        print(f"청크 {chunk['chunk_index'] + 1} 출력이 잘려서 분할 후 재변환 (페이지 {chunk['start_page']}-{chunk['end_page']})")
+        count_markdown_call("retries")
+        parts = []
+        truncated = False
+        for part_pages in (pages[:split_at], pages[split_at:]):
+            part = build_page_chunk(part_pages, chunk["chunk_index"])
+            part_images = [img for img in chunk_images if part["start_page"] <= img["page_num"] <= part["end_page"]]
+            part_markdown, part_truncated = convert_chunk_to_markdown(part, part_images, max_tokens)
+            if not part_markdown:
+                return None, False
+            parts.append(part_markdown)
+            truncated = truncated or part_truncated
+        return "\n\n".join(parts), truncated
+    
+    # 한 페이지도 한도를 넘으면 출력 한도를 늘려서 재시도
+    max_tokens = max_tokens or markdown_max_tokens
+    if max_tokens < markdown_retry_max_tokens:
+        print(f"페이지 {chunk['start_page']} 출력이 잘려서 출력 한도를 늘려 재변환")
+        count_markdown_call("retries")
+        return convert_chunk_to_markdown(chunk, chunk_images, min(max_tokens * 2, markdown_retry_max_tokens))
+    
+    print(f"경고: 페이지 {chunk['start_page']} 마크다운이 출력 한도({max_tokens} 토큰)에서 잘렸습니다.")
+    count_markdown_call("truncated")
+    return markdown_text, True
+
+def split_page_runs(pages):
+    """연속된 페이지를 변환 경로(local/llm)별 구간으로 나눔"""
+    runs = []
+    for page_data in pages:
+        path = "local" if page_data.get("local_markdown") else "llm"
+        if runs and runs[-1][0] == path:
+            runs[-1][1].append(page_data)
+        else:
+            runs.append((path, [page_data]))
+    
+    # LLM 구간 사이에 낀 짧은 로컬 구간은 LLM 호출이 잘게 쪼개지지 않도록 LLM 구간에 합침
+    merged = []
+    for i, (path, run_pages) in enumerate(runs):
+        if path == "local" and 0 < i < len(runs) - 1 and len(run_pages) < local_min_run:
+            path = "llm"
+        if merged and merged[-1][0] == path:
+            merged[-1][1].extend(run_pages)
+        else:
+            merged.append((path, list(run_pages)))
+    return merged
+
+def convert_chunk_pages(chunk, chunk_images):
+    """청크의 단순한 페이지는 로컬 변환, 나머지는 LLM으로 변환해서 페이지 순서대로 합침"""
+    runs = split_page_runs(chunk["pages"])
+    parts = []
+    truncated = False
+    for path, run_pages in runs:
+        if path == "local":
+            parts.append("\n\n".join(page_data["local_markdown"] for page_data in run_pages))
+            count_markdown_call("local_pages", len(run_pages))
+            continue
+        
+        run_chunk = chunk if len(runs) == 1 else build_page_chunk(run_pages, chunk["chunk_index"])
+        run_images = [img for img in chunk_images if run_chunk["start_page"] <= img["page_num"] <= run_chunk["end_page"]]
+        markdown_text, run_truncated = convert_chunk_to_markdown(run_chunk, run_images)
+        if not markdown_text:
+            return None, False
+        parts.append(markdown_text)
+        truncated = truncated or run_truncated
+        count_markdown_call("llm_pages", len(run_pages))
+    return "\n\n".join(parts), truncated
+
+def convert_and_upload_chunk(chunk, chunk_images, md_filename, markdown_texts=None):
+    """
+    청크 하나를 마크다운으로 변환해서 업로드하고 청크 정보를 반환.
+    markdown_texts(dict)를 주면 업로드한 마크다운을 파일명별로 남겨서 인덱스 갱신 때 다시 다운로드하지 않습니다.
+    """
+    print(f"청크 {chunk['chunk_index'] + 1} 변환 중 (페이지 {chunk['start_page']}-{chunk['end_page']})")
+    with timed_stage("conversion", traced=True):
+        tracing.current_span().set("pages", f"{chunk['start_page']}-{chunk['end_page']}")
+        markdown_text, truncated = convert_chunk_pages(chunk, chunk_images)
+    
+    if not markdown_text:
+        print(f"청크 {chunk['chunk_index'] + 1} 변환 실패")
+        return None
+    
+    # 청크별 마크다운 파일 Azure Storage에 업로드
+    md_blob_path = f"{md_filename}"
+    md_url = upload_blob_from_memory(
+        md_blob_path, 
+        markdown_text.encode('utf-8'), 
+        "text/markdown"
+    )
+    
+    if not md_url:
+        print(f"마크다운 업로드 실패: {md_filename}")
+        return None
+    
+    print(f"마크다운 업로드 완료: {md_blob_path}")
+    if markdown_texts is not None:
+        markdown_texts[md_filename] = markdown_text
+    return {
+        "chunk_index": chunk['chunk_index'],
+        "start_page": chunk['start_page'],
+        "end_page": chunk['end_page'],
+        "filename": md_filename,
+        "blob_path": md_blob_path,
+        "url": md_url,
+        "images": chunk_images,
+        "truncated": truncated
+    }
+
+def compute_chunk_hash(chunk, chunk_images):
+    """청크 텍스트와 참조 이미지로 변경 여부 판단용 해시 생성"""
+    digest = hashlib.sha256(chunk["text"].encode("utf-8"))
+    # 이미지가 바뀌면 마크다운의 이미지 참조도 바뀌므로 함께 반영
+    for img in chunk_images:
+        digest.update(img["hash"].encode("utf-8"))
+    return digest.hexdigest()
+
+def get_pdf_source_info(pdf_blob_name):
+    """PDF blob의 ETag와 수정 시각 조회"""
+    try:
+        properties = container_client.get_blob_client(pdf_blob_name).get_blob_properties()
+        return {
+            "blob_name": pdf_blob_name,
+            "etag": properties.etag,
+            "last_modified": properties.last_modified.isoformat() if properties.last_modified else None
+        }
+    except AzureError as e:
+        print(f"Blob 속성 조회 오류 ({pdf_blob_name}): {e}")
         return None
 
-def create_metadata_blob(pdf_name, chunks_info, image_info):
+def load_metadata_blob(pdf_name):
+    """이전 처리 때 저장한 메타데이터(수집 매니페스트) 조회, 없으면 None"""
+    try:
+        blob_client = container_client.get_blob_client(f"{pdf_name}_metadata.json")
+        return json.loads(blob_client.download_blob().readall())
+    except ResourceNotFoundError:
+        return None
+    except (AzureError, ValueError) as e:
+        print(f"메타데이터 조회 오류 ({pdf_name}): {e}")
+        return None
+
+def create_metadata_blob(pdf_name, chunks_info, image_info, source=None, status="complete"):
     """메타데이터를 Azure Storage에 저장"""
     metadata = {
         "pdf_name": pdf_name,
+        "status": status,  # complete: 모든 청크 완료, in_progress/partial: 다음 실행 때 이어서 처리
+        "source": source,
         "total_chunks": len(chunks_info),
         "chunks": chunks_info,
         "images": image_info,
@@ -212,6 +524,63 @@ def create_metadata_blob(pdf_name, chunks_info, image_info):
     
     return metadata_url, metadata_blob_path
 
+def load_markdown_files(chunks_info, markdown_texts=None):
+    """
+    청크 마크다운을 [(파일명, 텍스트), ...]로 반환 (실패한 파일은 빠짐).
+    markdown_texts(파일명별 텍스트)에 있는 것은 그대로 쓰고, 없는 것만 다운로드해서 markdown_texts에 채웁니다.
+    """
+    markdown_texts = {} if markdown_texts is None else markdown_texts
+    markdown_files = []
+    for entry in chunks_info:
+        if entry["filename"] not in markdown_texts:
+            markdown_data = download_blob_to_memory(entry["blob_path"])
+            if not markdown_data:
+                continue
+            markdown_texts[entry["filename"]] = markdown_data.decode("utf-8")
+        markdown_files.append((entry["filename"], markdown_texts[entry["filename"]]))
+    return markdown_files
+
+def update_lexical_segment(pdf_name, chunks_info, markdown_texts=None):
+    """이 PDF의 로컬 키워드(BM25) 인덱스 세그먼트를 다시 만듦 (markdown_texts는 load_markdown_files 참고)"""
+    markdown_files = load_markdown_files(chunks_info, markdown_texts)
+    try:
+        passage_count = write_segment(pdf_name, markdown_files)
+        print(f"키워드 인덱스 갱신: {pdf_name} ({passage_count}개 단락)")
+    except OSError as e:
+        print(f"키워드 인덱스 갱신 실패: {e}")
+
+def needs_search_push(chunks_info):
+    return direct_index_push and any("search_keys" not in entry for entry in chunks_info)
+
+def update_search_index(chunks_info, stale_keys=(), markdown_texts=None):
+    """
+    아직 검색 인덱스에 넣지 않은 청크 마크다운(search_keys가 없는 항목)을 인덱스에 직접 넣고,
+    넣은 문서 키를 청크 정보의 search_keys에 기록합니다. stale_keys 중 지금 청크에 없는 문서는 삭제합니다.
+    모든 청크가 인덱스에 들어갔으면 True를 반환합니다. (markdown_texts는 load_markdown_files 참고)
+    """
+    pending = [entry for entry in chunks_info if "search_keys" not in entry]
+    try:
+        if pending:
+            pushed = search_indexer.index_markdown(load_markdown_files(pending, markdown_texts))
+            for entry in pending:
+                if entry["filename"] in pushed:
+                    entry["search_keys"] = pushed[entry["filename"]]
+        current_keys = {key for entry in chunks_info for key in entry.get("search_keys", [])}
+        deleted = search_indexer.delete_documents(set(stale_keys) - current_keys)
+    except Exception as e:
+        print(f"검색 인덱스 갱신 오류: {type(e).__name__}: {e}")
+        return False
+    return deleted and all("search_keys" in entry for entry in chunks_info)
+
+def update_index_version():
+    """위키 내용이 바뀌었음을 Q&A 앱의 답변 캐시에 알리기 위해 인덱스 버전 갱신"""
+    version = {"version": f"{time.time():.0f}-{os.getpid()}", "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return upload_blob_from_memory(
+        INDEX_VERSION_BLOB_NAME,
+        json.dumps(version).encode('utf-8'),
+        "application/json"
+    )
+
 def list_pdf_blobs():
     """Azure Storage에서 PDF 파일 목록 조회"""
     try:
@@ -225,11 +594,48 @@ def list_pdf_blobs():
         print(f"Blob 목록 조회 오류: {e}")
         return []
 
-def process_pdf_blob(pdf_blob_name):
-    """단일 PDF blob 처리"""
+def process_pdf_blob(pdf_blob_name, force=False):
+    """단일 PDF blob 처리 (변경되지 않은 PDF와 청크는 건너뜀)"""
+    # PDF 하나를 루트 span으로 기록 (다운로드·변환·LLM 호출·업로드는 하위 span)
+    with tracing.span("ingest", pdf=pdf_blob_name, force=force) as span:
+        result = _process_pdf_blob(pdf_blob_name, force)
+        span.set("ok", result)
+        return result
+
+def _process_pdf_blob(pdf_blob_name, force=False):
     pdf_name = os.path.splitext(os.path.basename(pdf_blob_name))[0]
     print(f"처리 중: {pdf_blob_name}")
     
+    # 0. 이전 처리 결과와 비교해서 변경 여부 확인
+    source = get_pdf_source_info(pdf_blob_name)
+    previous = None if force else load_metadata_blob(pdf_name)
+    if previous and source and previous.get("status") == "complete" \
+            and (previous.get("source") or {}).get("etag") == source["etag"]:
+        # 두 인덱스를 모두 갱신해야 해도 마크다운은 한 번만 다운로드
+        markdown_texts = {}
+        if lexical_index_build and not has_segment(pdf_name):
+            update_lexical_segment(pdf_name, previous.get("chunks", []), markdown_texts)
+        if needs_search_push(previous.get("chunks", [])):
+            # DIRECT_INDEX_PUSH를 켜기 전에 처리했거나 지난번 인덱스 갱신이 실패한 PDF
+            index_stats_before = search_indexer.stats()
+            update_search_index(previous["chunks"], markdown_texts=markdown_texts)
+            create_metadata_blob(pdf_name, previous["chunks"], previous.get("images", []), source)
+            update_index_version()
+            print(format_index_stats(search_indexer.stats(), since=index_stats_before))
+        print(f"변경 사항 없음, 건너뜀: {pdf_blob_name}\n")
+        return True
+    
+    # 이전에 완료된 청크는 파일명과 해시가 같으면 다시 변환하지 않음
+    previous_chunks = {}
+    if previous:
+        for entry in previous.get("chunks", []):
+            if entry.get("text_hash"):
+                previous_chunks[entry["filename"]] = entry
+    
+    upload_stats_before = uploader.stats()
+    markdown_stats_before = dict(markdown_call_stats)
+    index_stats_before = search_indexer.stats()
+    
     # 1. PDF blob 다운로드
     print("PDF 다운로드 중...")
     pdf_data = download_blob_to_memory(pdf_blob_name)
@@ -237,70 +643,109 @@ def process_pdf_blob(pdf_blob_name):
         print(f"PDF 다운로드 실패: {pdf_blob_name}")
         return False
     
-    # 2. 이미지 추출 및 업로드
-    print("이미지 추출 및 업로드 중...")
-    image_info = extract_images_from_pdf_blob(pdf_data, pdf_name)
-    print(f"추출된 이미지 수: {len(image_info)}")
-    
-    # 3. 페이지별 텍스트 추출
-    print("텍스트 추출 중...")
-    pages_text = extract_pdf_text_with_pages_blob(pdf_data)
-    total_pages = len(pages_text)
-    print(f"총 페이지 수: {total_pages}")
-    
-    # 4. 페이지 청크 분할
-    chunks = create_page_chunks(pages_text, chunk_size=40)
-    print(f"생성된 청크 수: {len(chunks)}")
-    
-    # 5. 각 청크를 마크다운으로 변환 및 업로드
-    chunks_info = []
-    for chunk in chunks:
-        chunk_images = get_images_for_chunk(image_info, chunk["start_page"], chunk["end_page"])
-        
-        print(f"청크 {chunk['chunk_index'] + 1} 변환 중 (페이지 {chunk['start_page']}-{chunk['end_page']})")
-        markdown_text = summarize_to_markdown(chunk["text"], chunk, chunk_images)
-        
-        if markdown_text:
-            # 청크별 마크다운 파일 Azure Storage에 업로드
-            if len(chunks) == 1:
+    # 완료된 청크를 즉시 메타데이터에 기록해서 중단되더라도 이어서 처리 가능하도록 함
+    completed = {}
+    image_info = []
+    progress_lock = threading.Lock()
+    # 이번 실행에서 변환한 마크다운 (인덱스 갱신 때 방금 올린 파일을 다시 다운로드하지 않도록)
+    markdown_texts = {}
+    
+    def record_progress(chunk_entry):
+        with progress_lock:
+            completed[chunk_entry["chunk_index"]] = chunk_entry
+            create_metadata_blob(pdf_name, [completed[i] for i in sorted(completed)], image_info, source, status="in_progress")
+    
+    def convert_chunk_with_progress(chunk, chunk_images, md_filename, text_hash):
+        chunk_entry = convert_and_upload_chunk(chunk, chunk_images, md_filename, markdown_texts)
+        if chunk_entry:
+            chunk_entry["text_hash"] = text_hash
+            record_progress(chunk_entry)
+        return chunk_entry
+    
+    # 2~5. 페이지를 읽는 대로 청크를 만들고, 청크가 완성되면 바로 변환 시작
+    #      (변환 중인 청크 수를 워커 수로 제한해서 메모리에 문서 전체가 쌓이지 않도록 함)
+    print("페이지 파싱 및 마크다운 변환 중...")
+    total_pages = 0
+    chunk_count = 0
+    skipped_count = 0
+    failed_count = 0
+    in_flight = set()
+    image_uploads = []
+    with ThreadPoolExecutor(max_workers=convert_workers) as executor:
+        pages = iter_pdf_pages(pdf_data, image_uploads)
+        for chunk, is_last in with_last_flag(iter_page_chunks(pages)):
+            chunk_count += 1
+            total_pages = chunk["end_page"]
+            chunk_images = chunk.pop("images")
+            with progress_lock:
+                image_info.extend(chunk_images)
+            
+            # 청크별 마크다운 파일명 (청크 순서 기준)
+            if chunk["chunk_index"] == 0 and is_last:
                 md_filename = f"{pdf_name}.md"
             else:
                 md_filename = f"{pdf_name}_part{chunk['chunk_index'] + 1}_pages{chunk['start_page']}-{chunk['end_page']}.md"
             
-            md_blob_path = f"{md_filename}"
-            md_url = upload_blob_from_memory(
-                md_blob_path, 
-                markdown_text.encode('utf-8'), 
-                "text/markdown"
-            )
-            
-            if md_url:
-                chunks_info.append({
-                    "chunk_index": chunk['chunk_index'],
-                    "start_page": chunk['start_page'],
-                    "end_page": chunk['end_page'],
-                    "filename": md_filename,
-                    "blob_path": md_blob_path,
-                    "url": md_url,
-                    "images": chunk_images
-                })
-                
-                print(f"마크다운 업로드 완료: {md_blob_path}")
-            else:
-                print(f"마크다운 업로드 실패: {md_filename}")
+            text_hash = compute_chunk_hash(chunk, chunk_images)
+            previous_entry = previous_chunks.get(md_filename)
+            if previous_entry and previous_entry["text_hash"] == text_hash:
+                # 변경되지 않은 청크는 기존 마크다운 재사용
+                with progress_lock:
+                    completed[chunk["chunk_index"]] = previous_entry
+                skipped_count += 1
+                continue
             
-            # API 호출 간격 조절
-            time.sleep(2)
-        else:
-            print(f"청크 {chunk['chunk_index'] + 1} 변환 실패")
+            if len(in_flight) >= convert_workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                failed_count += sum(1 for future in done if not future.result())
+            in_flight.add(executor.submit(tracing.bind_context(convert_chunk_with_progress),
+                                          chunk, chunk_images, md_filename, text_hash))
+        
+        failed_count += sum(1 for future in in_flight if not future.result())
     
-    # 6. 메타데이터 업로드
-    metadata_url, metadata_blob_path = create_metadata_blob(pdf_name, chunks_info, image_info)
+    # 대기열에 넣어 둔 이미지 업로드 완료 대기
+    failed_images = sum(1 for future in image_uploads if not future.result())
+    if failed_images:
+        print(f"이미지 업로드 실패: {failed_images}개")
+    
+    # 완료 순서와 관계없이 청크 순서대로 정리
+    chunks_info = [completed[i] for i in sorted(completed)]
+    print(f"총 페이지 수: {total_pages}, 추출된 이미지 수: {len(image_info)}, 생성된 청크 수: {chunk_count}")
+    if skipped_count:
+        print(f"변경되지 않아 건너뛴 청크 수: {skipped_count}")
+    markdown_stats = {key: markdown_call_stats[key] - markdown_stats_before[key] for key in markdown_call_stats}
+    tracing.current_span().set("pages", total_pages)
+    tracing.current_span().set("llm_calls", markdown_stats["calls"])
+    print(f"LLM 호출 수: {markdown_stats['calls']} (잘림으로 인한 재변환 {markdown_stats['retries']}회, 잘린 청크 {markdown_stats['truncated']}개)")
+    if local_fastpath:
+        print(f"변환 경로별 페이지 수: 로컬 {markdown_stats['local_pages']}, LLM {markdown_stats['llm_pages']}")
+    
+    # 검색 인덱스 직접 갱신 (모든 청크가 변환됐을 때만 이전 실행에서 넣은 문서 중 없어진 것을 삭제)
+    indexed = True
+    search_pushed = needs_search_push(chunks_info)
+    if direct_index_push:
+        stale_keys = set()
+        if previous and failed_count == 0:
+            stale_keys = {key for entry in previous.get("chunks", []) for key in entry.get("search_keys", [])}
+        indexed = update_search_index(chunks_info, stale_keys, markdown_texts)
+    
+    # 6. 메타데이터 업로드 (실패한 청크가 있거나 인덱스 갱신이 실패하면 다음 실행 때 이어서 처리)
+    status = "complete" if failed_count == 0 and failed_images == 0 and indexed else "partial"
+    metadata_url, metadata_blob_path = create_metadata_blob(pdf_name, chunks_info, image_info, source, status=status)
     if metadata_url:
         print(f"메타데이터 업로드 완료: {metadata_blob_path}")
     else:
         print("메타데이터 업로드 실패")
     
+    # 새로 변환된 청크가 있으면 이전 인덱스 기준으로 캐시된 답변을 무효화
+    if chunk_count > skipped_count or search_pushed:
+        update_index_version()
+    if lexical_index_build and (chunk_count > skipped_count or not has_segment(pdf_name)):
+        update_lexical_segment(pdf_name, chunks_info, markdown_texts)
+    
+    print(format_upload_stats(uploader.stats(), since=upload_stats_before))
+    if direct_index_push:
+        print(format_index_stats(search_indexer.stats(), since=index_stats_before))
     print(f"'{pdf_blob_name}' 처리 완료!\n")
     return True
 
@@ -318,14 +763,134 @@ def process_all_pdf_blobs():
     
     print("\n처리를 시작합니다...\n")
     
-    success_count = 0
-    for pdf_blob in pdf_blobs:
-        if process_pdf_blob(pdf_blob):
-            success_count += 1
+    # 워커가 하나여도 워커 프로세스에서 처리해야 PDF_INGEST_TIMEOUT을 넘긴 PDF를 중단하고 다음 PDF로 넘어갈 수 있음
+    results = run_pdf_worker_pool(pdf_blobs, max(1, ingest_workers), ingest_timeout)
     
-    print(f"처리 완료: {success_count}/{len(pdf_blobs)}개 성공")
+    print_ingest_summary(results)
+    return results
+
+def _ingest_worker(worker_id, worker_count, task_queue, result_queue):
+    """워커 프로세스에서 큐로 받은 PDF를 하나씩 처리하고 결과를 전달 (None을 받으면 종료)"""
+    global chat_rate_limiter
+    # 추적 파일은 워커마다 따로 씀 (여러 프로세스가 같은 파일을 교체하면 기록이 섞이거나 사라짐)
+    tracing.use_separate_trace_file(f"worker{worker_id + 1}")
+    # 호출 한도를 워커 수만큼 나눠서 전체 합계가 배포 한도를 넘지 않도록 함
+    chat_rate_limiter = TokenBucketLimiter(rpm=chat_rpm / worker_count, tpm=chat_tpm / worker_count)
+    while True:
+        pdf_blob_name = task_queue.get()
+        if pdf_blob_name is None:
+            return
+        try:
+            ok = process_pdf_blob(pdf_blob_name)
+            result_queue.put((worker_id, pdf_blob_name, "success" if ok else "failed", None if ok else "처리 실패"))
+        except Exception as e:
+            result_queue.put((worker_id, pdf_blob_name, "failed", f"{type(e).__name__}: {e}"))
+
+def run_pdf_worker_pool(pdf_blobs, workers, timeout):
+    """
+    워커 프로세스 workers개를 띄워 두고 PDF를 하나씩 나눠 주며 처리.
+    워커는 PDF가 끝나도 종료하지 않으므로 인터프리터 시작, SDK 임포트, 클라이언트·연결 풀 생성은 워커마다 한 번만 합니다.
+    시간을 넘기거나 비정상 종료한 워커만 새 프로세스로 바꿉니다.
+    """
+    # 워커마다 새 인터프리터에서 클라이언트를 다시 만들도록 spawn 사용
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue()
+    pending = deque(pdf_blobs)
+    pool = {}  # 워커 번호 -> {"process", "tasks", "pdf", "started_at"}
+    reported = {}  # 워커 번호 -> (pdf 이름, 상태, 오류)
+    results = []
+
+    def start_worker(worker_id):
+        # 워커마다 작업 큐를 따로 둬서 어느 워커가 어떤 PDF를 처리 중인지 부모가 알 수 있게 함
+        tasks = ctx.Queue()
+        process = ctx.Process(target=_ingest_worker, args=(worker_id, workers, tasks, result_queue), daemon=True)
+        process.start()
+        pool[worker_id] = {"process": process, "tasks": tasks, "pdf": None, "started_at": None}
+
+    def drain_queue(wait=0.0):
+        try:
+            while True:
+                worker_id, name, status, error = result_queue.get(timeout=wait)
+                reported[worker_id] = (name, status, error)
+                wait = 0.0
+        except queue.Empty:
+            pass
+
+    def take_report(worker_id, worker):
+        name, status, error = reported.pop(worker_id, (None, None, None))
+        # 시간 초과로 교체한 이전 프로세스가 남긴 결과는 무시
+        return (status, error) if name == worker["pdf"] else None
+
+    def finish(worker, status, error):
+        elapsed = time.monotonic() - worker["started_at"]
+        results.append({"pdf": worker["pdf"], "status": status, "elapsed": elapsed, "error": error})
+        print(f"[{len(results)}/{len(pdf_blobs)}] {worker['pdf']}: {status} ({elapsed:.1f}초)")
+        worker["pdf"] = None
+
+    def replace(worker_id, worker):
+        worker["process"].join()
+        if pending:
+            start_worker(worker_id)
+        else:
+            del pool[worker_id]
+
+    for worker_id in range(min(workers, len(pdf_blobs))):
+        start_worker(worker_id)
+
+    try:
+        while pending or any(worker["pdf"] for worker in pool.values()):
+            for worker in pool.values():
+                if worker["pdf"] is None and pending:
+                    worker["pdf"] = pending.popleft()
+                    worker["started_at"] = time.monotonic()
+                    worker["tasks"].put(worker["pdf"])
+
+            drain_queue(wait=0.5)
+            for worker_id, worker in list(pool.items()):
+                if worker["pdf"] is None:
+                    continue
+                report = take_report(worker_id, worker)
+                if report:
+                    finish(worker, *report)
+                elif not worker["process"].is_alive():
+                    # 종료 직전에 보낸 결과가 아직 큐에 남아 있을 수 있음
+                    drain_queue()
+                    report = take_report(worker_id, worker)
+                    finish(worker, *(report or ("crashed", f"워커 비정상 종료 (exit code {worker['process'].exitcode})")))
+                    replace(worker_id, worker)
+                elif time.monotonic() - worker["started_at"] > timeout:
+                    worker["process"].terminate()
+                    finish(worker, "timeout", f"{timeout:.0f}초 초과")
+                    replace(worker_id, worker)
+    finally:
+        for worker in pool.values():
+            if worker["process"].is_alive():
+                worker["tasks"].put(None)
+        for worker in pool.values():
+            worker["process"].join(timeout=10)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+
+    return results
+
+def print_ingest_summary(results):
+    """PDF별 처리 결과와 소요 시간 요약 출력"""
+    succeeded = [r for r in results if r["status"] == "success"]
+    failed = [r for r in results if r["status"] != "success"]
+    total_elapsed = sum(r["elapsed"] for r in results)
+
+    print("\n" + "=" * 50)
+    print(f"처리 완료: {len(succeeded)}/{len(results)}개 성공, {len(failed)}개 실패")
+    print(f"PDF당 평균 처리 시간: {total_elapsed / max(1, len(results)):.1f}초")
+    print("-" * 50)
+    for r in sorted(results, key=lambda r: r["elapsed"], reverse=True):
+        line = f"{r['status']:<8} {r['elapsed']:>8.1f}초  {r['pdf']}"
+        if r["error"]:
+            line += f"  ({r['error']})"
+        print(line)
+    print("=" * 50)
 
-def process_specific_pdf_blob(pdf_blob_name):
+def process_specific_pdf_blob(pdf_blob_name, force=False):
     """특정 PDF blob 처리"""
     # blob 이름에 .pdf 확장자가 없으면 추가
     if not pdf_blob_name.lower().endswith('.pdf'):
@@ -335,7 +900,7 @@ def process_specific_pdf_blob(pdf_blob_name):
     try:
         blob_client = container_client.get_blob_client(pdf_blob_name)
         blob_client.get_blob_properties()
-        process_pdf_blob(pdf_blob_name)
+        process_pdf_blob(pdf_blob_name, force=force)
     except AzureError as e:
         print(f"PDF 파일을 찾을 수 없습니다: {pdf_blob_name}")
         print(f"오류: {e}")
@@ -358,7 +923,8 @@ def main():
         elif choice == '2':
             pdf_name = input("처리할 PDF 파일명을 입력하세요 (확장자 포함): ").strip()
             if pdf_name:
-                process_specific_pdf_blob(pdf_name)
+                force = input("변경 여부와 관계없이 다시 처리할까요? (y/N): ").strip().lower() == 'y'
+                process_specific_pdf_blob(pdf_name, force=force)
             else:
                 print("파일명을 입력해주세요.")
         elif choice == '3':
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import tracing
+from chat_streaming import yield_text
+from embedding_cache import normalize_query
+from qna_core import generate_answer, uses_conversation
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+QNA_BACKEND_WORKERS = int(os.getenv("QNA_BACKEND_WORKERS", "4"))  # 동시에 실행할 답변 파이프라인 수
+QNA_BACKEND_MAX_PENDING = int(os.getenv("QNA_BACKEND_MAX_PENDING", "16"))  # 실행 중 + 대기 중인 파이프라인 최대 수, 넘으면 거절
+QNA_BACKEND_TIMEOUT = float(os.getenv("QNA_BACKEND_TIMEOUT", "300"))  # 답변 하나를 기다리는 최대 시간(초)
+
+BUSY_MESSAGE = "지금은 질문이 많아 답변을 시작할 수 없습니다. 잠시 후 다시 시도해 주세요."
+
+# 답변이 끝난 뒤 구독자에게도 복사할 파이프라인 측정값
+SHARED_METRIC_KEYS = ("route", "context_tokens", "context_tokens_saved")
+
+
+class _Flight:
+    """
+    진행 중인 답변 파이프라인 하나.
+    생성된 답변 조각을 모두 보관하므로 늦게 합류한 구독자도 처음 조각부터 받습니다.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.pieces = []
+        self.metrics = {}
+        self.done = False
+        self.error = None
+        self.subscribers = 1
+        self._condition = threading.Condition()
+
+    def publish(self, piece):
+        with self._condition:
+            self.pieces.append(piece)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    def iter_pieces(self, timeout):
+        deadline = time.monotonic() + timeout
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.pieces) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"답변 대기 시간 초과 ({timeout:.0f}초)")
+                    self._condition.wait(remaining)
+                pieces = self.pieces[index:]
+                done = self.done
+            index += len(pieces)
+            yield from pieces
+            if done and index >= len(self.pieces):
+                return
+
+
+class QnaBackend:
+    """
+    Streamlit 세션들이 공유하는 답변 실행기.
+    파이프라인(임베딩 → 검색 → 답변 생성)은 제한된 워커 풀에서 실행하고, 대기열이 가득 차면 새 질문을 거절합니다.
+    대화 문맥을 쓰지 않는 같은 질문(정규화 기준)이 동시에 들어오면 진행 중인 파이프라인 하나의 결과를 함께 받습니다.
+    """
+
+    def __init__(self, workers=QNA_BACKEND_WORKERS, max_pending=QNA_BACKEND_MAX_PENDING, timeout=QNA_BACKEND_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qna-backend")
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._queued = 0
+        self._running = 0
+        self._stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def submit(self, query, metrics=None, memory=None):
+        """
+        질문을 제출하고 답변 텍스트 조각을 생성하는 제너레이터를 반환합니다.
+        대화 문맥을 쓰는 후속 질문(qna_core.uses_conversation)은 프롬프트에 이 세션의 대화 기록이 들어가서
+        답변이 세션마다 다르므로 합치지 않고 따로 실행합니다.
+        """
+        metrics = {} if metrics is None else metrics
+        key = normalize_query(query) if not uses_conversation(query, memory) else None
+        with self._lock:
+            flight = self._flights.get(key) if key else None
+            if flight is not None:
+                flight.subscribers += 1
+                self._stats["coalesced"] += 1
+                metrics["coalesced"] = True
+                return self._subscribe(flight, query, metrics, memory)
+
+            if self._queued + self._running >= self.max_pending:
+                self._stats["rejected"] += 1
+                metrics["rejected"] = True
+                return yield_text(BUSY_MESSAGE, time.perf_counter(), metrics)
+
+            flight = _Flight(key)
+            if key:
+                self._flights[key] = flight
+            self._queued += 1
+            self._stats["submitted"] += 1
+        self._executor.submit(tracing.bind_context(self._run), flight, query, memory)
+        # 답변을 만든 파이프라인(generate_answer)이 대화 기록을 남기므로 구독 쪽에서는 기록하지 않음
+        return self._subscribe(flight, query, metrics, None)
+
+    def _run(self, flight, query, memory):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            for piece in generate_answer(query, flight.metrics, memory):
+                flight.publish(piece)
+            flight.finish()
+            succeeded = True
+        except Exception as e:
+            flight.finish(e)
+            succeeded = False
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats["completed" if succeeded else "failed"] += 1
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+
+    def _subscribe(self, flight, query, metrics, memory):
+        started_at = time.perf_counter()
+        pieces = []
+        try:
+            for piece in flight.iter_pieces(self.timeout):
+                if "ttft" not in metrics:
+                    metrics["ttft"] = time.perf_counter() - started_at
+                pieces.append(piece)
+                yield piece
+            if flight.error is not None:
+                yield from yield_text(f"죄송합니다, 답변을 생성하는 데 문제가 발생했습니다.: {flight.error}", started_at, metrics)
+        except TimeoutError as e:
+            yield from yield_text(f"죄송합니다, {e}", started_at, metrics)
+        metrics["total"] = time.perf_counter() - started_at
+        for key in SHARED_METRIC_KEYS:
+            if key in flight.metrics:
+                metrics[key] = flight.metrics[key]
+        if memory is not None:
+            # 다른 세션의 파이프라인에 합류한 경우 이 세션의 대화 기록에도 남김
+            memory.add_turn(query, "".join(pieces))
+
+    def stats(self):
+        """대기열 깊이, 실행 중인 파이프라인 수, 합류/거절 건수"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(queued=self._queued, running=self._running, in_flight=len(self._flights),
+                         workers=self.workers, max_pending=self.max_pending)
+        return stats
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend():
+    """프로세스 전체에서 공유하는 답변 실행기 (Streamlit의 모든 세션이 공유)"""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = QnaBackend()
+        return _default_backend
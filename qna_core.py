@@ -0,0 +1,417 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_import_started_at = time.perf_counter()
+
+from dotenv import load_dotenv
+
+# OpenAI/Azure SDK는 임포트 시간이 길어서 클라이언트를 만들 때 임포트 (시작 시간 단축)
+from async_retrieval import RETRIEVAL_TIMEOUT_SECONDS, get_default_retriever, retrieve_documents, run_async
+from answer_cache import get_default_answer_cache, get_index_version
+from chat_streaming import iter_chat_stream, yield_text
+from context_packer import pack_context
+from question_router import get_default_router
+from resilient_calls import get_caller
+import tracing
+
+# .env 파일에서 환경 변수 로드
+load_dotenv()
+
+# Azure OpenAI (RAG, 임베딩, 일반 답변 공용)
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME")
+AZURE_OPENAI_EMBBEDING_API_VERSION = os.getenv("AZURE_OPENAI_EMBBEDING_API_VERSION")
+AZURE_OPENAI_CHAT_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
+AZURE_OPENAI_CHAT_API_VERSION = os.getenv("AZURE_OPENAI_CHAT_API_VERSION")
+
+# Azure AI Search (RAG 검색용)
+AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
+AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY")
+AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
+RAG_SEARCH_BACKEND = os.getenv("RAG_SEARCH_BACKEND", "azure")  # local이면 로컬 벡터 인덱스(local_vector_index.py) 사용
+
+# 연결 풀 및 사전 연결 설정
+QNA_WARMUP = os.getenv("QNA_WARMUP", "true").lower() == "true"  # 시작 시 백그라운드에서 연결을 미리 열지 여부
+QNA_HTTP_POOL_SIZE = int(os.getenv("QNA_HTTP_POOL_SIZE", "10"))  # 엔드포인트별 keep-alive 연결 수
+QNA_KEEPALIVE_SECONDS = float(os.getenv("QNA_KEEPALIVE_SECONDS", "300"))  # 유휴 연결 유지 시간
+
+# 스트리밍 답변의 마지막 청크로 토큰 사용량을 받을지 여부 (지원하지 않는 API 버전이면 false, 이때는 토큰 수를 추정)
+CHAT_STREAM_USAGE = os.getenv("CHAT_STREAM_USAGE", "true").lower() == "true"
+
+_clients = None
+_clients_lock = threading.Lock()
+_warm_up_started = False
+_ready = threading.Event()
+startup_metrics = {}  # 임포트 → 준비 완료 시간, 첫 질문 응답 시간 (초)
+
+
+def _create_pooled_search_transport():
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    from azure.core.pipeline.transport import RequestsTransport
+
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=QNA_HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def load_clients():
+    """
+    Azure OpenAI와 Azure AI Search 클라이언트를 프로세스에서 한 번만 만들어 공유합니다.
+    OpenAI는 RAG·임베딩·일반 답변이 같은 연결 풀을 쓰도록 클라이언트 하나만 만들므로
+    반환값 (azure_openai_client, search_client, openai_client)의 첫 번째와 세 번째는 같은 객체입니다.
+    """
+    global _clients
+    with _clients_lock:
+        if _clients is not None:
+            return _clients
+
+        started_at = time.perf_counter()
+        try:
+            import httpx
+            from openai import AzureOpenAI, DefaultHttpxClient
+
+            # 1. Azure OpenAI 클라이언트 (keep-alive 연결 풀 공유, 재시도는 resilient_calls에서 처리)
+            openai_client = AzureOpenAI(
+                api_key=AZURE_OPENAI_API_KEY,
+                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+                api_version=AZURE_OPENAI_CHAT_API_VERSION or AZURE_OPENAI_EMBBEDING_API_VERSION,
+                http_client=DefaultHttpxClient(limits=httpx.Limits(
+                    max_connections=QNA_HTTP_POOL_SIZE,
+                    max_keepalive_connections=QNA_HTTP_POOL_SIZE,
+                    keepalive_expiry=QNA_KEEPALIVE_SECONDS,
+                )),
+                max_retries=0,
+            )
+
+            # 2. Azure AI Search 클라이언트 (설정에 따라 오프라인용 로컬 인덱스)
+            if RAG_SEARCH_BACKEND == "local":
+                from local_vector_index import LocalSearchClient
+
+                search_client = LocalSearchClient()
+            else:
+                from azure.core.credentials import AzureKeyCredential
+                from azure.search.documents import SearchClient
+
+                search_client = SearchClient(
+                    endpoint=AZURE_SEARCH_ENDPOINT,
+                    index_name=AZURE_SEARCH_INDEX_NAME,
+                    credential=AzureKeyCredential(AZURE_SEARCH_KEY),
+                    transport=_create_pooled_search_transport(),
+                    retry_total=0,
+                )
+        except (ValueError, TypeError, KeyError, Exception) as e:
+            print(f"클라이언트 초기화 실패: {e}")
+            return None, None, None
+
+        startup_metrics["clients_seconds"] = time.perf_counter() - started_at
+        _clients = (openai_client, search_client, openai_client)
+        return _clients
+
+
+def warm_up():
+    """
+    첫 질문 전에 필요한 것들을 미리 준비합니다.
+    OpenAI·Search 엔드포인트에 가벼운 요청을 보내 TLS 연결을 열어 두고(동기/비동기 클라이언트 모두),
+    질문 분류용 중심 벡터, 답변 캐시, 인덱스 버전을 읽어 둡니다. 각 단계의 실패는 무시합니다.
+    """
+    started_at = time.perf_counter()
+    openai_client, search_client, _ = load_clients()
+    if openai_client is None:
+        return
+
+    tasks = [
+        ("OpenAI 연결", lambda: openai_client.models.list()),
+        ("질문 분류기", lambda: get_default_router().prepare(openai_client, AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME)),
+        ("답변 캐시", lambda: (get_default_answer_cache(), get_index_version())),
+    ]
+    if RAG_SEARCH_BACKEND != "local":
+        tasks.append(("Search 연결", lambda: search_client.get_document_count()))
+        if os.getenv("RAG_ASYNC_RETRIEVAL", "true").lower() != "false":
+            tasks.append(("비동기 검색 연결",
+                          lambda: run_async(get_default_retriever().warm_up(), timeout=RETRIEVAL_TIMEOUT_SECONDS)))
+
+    def run(name, task):
+        try:
+            task()
+        except Exception as e:
+            print(f"사전 준비 실패 ({name}): {e}")
+
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="qna-warmup") as executor:
+        for name, task in tasks:
+            executor.submit(run, name, task)
+
+    startup_metrics["warmup_seconds"] = time.perf_counter() - started_at
+    startup_metrics["ready_seconds"] = time.perf_counter() - _import_started_at
+    _ready.set()
+
+
+def start_warm_up():
+    """QNA_WARMUP=true이면 사전 준비를 백그라운드 스레드에서 한 번만 시작 (false이면 질문 분류기만 준비)"""
+    global _warm_up_started
+    with _clients_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    if QNA_WARMUP:
+        threading.Thread(target=warm_up, name="qna-warmup", daemon=True).start()
+    else:
+        openai_client, _, _ = load_clients()
+        if openai_client is not None:
+            get_default_router().prepare_in_background(openai_client, AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME)
+
+
+def chat_stream_options():
+    """chat.completions.create(stream=True)에 넘길 추가 인자"""
+    return {"stream_options": {"include_usage": True}} if CHAT_STREAM_USAGE else {}
+
+
+def stream_chat_with_usage(response, messages, started_at, metrics, span):
+    """스트림 답변 조각을 생성하고, 끝나면 토큰 사용량(없으면 추정치)을 span과 metrics에 기록"""
+    usage = {}
+    pieces = []
+    for piece in iter_chat_stream(response, started_at, metrics, usage):
+        pieces.append(piece)
+        yield piece
+    prompt = "\n".join(message["content"] for message in messages)
+    recorded = tracing.set_token_usage(span, usage, prompt, "".join(pieces))
+    if metrics is not None:
+        metrics.update(recorded)
+    span.set("ttft_ms", round((metrics or {}).get("ttft", 0.0) * 1000, 1))
+
+
+def format_startup_metrics():
+    """시작 성능 요약 문자열"""
+    parts = [f"모듈 임포트 {startup_metrics['import_seconds']:.2f}초"]
+    if "clients_seconds" in startup_metrics:
+        parts.append(f"클라이언트 생성 {startup_metrics['clients_seconds']:.2f}초")
+    if "ready_seconds" in startup_metrics:
+        parts.append(f"준비 완료까지 {startup_metrics['ready_seconds']:.2f}초")
+    if "first_query_total" in startup_metrics:
+        parts.append(f"첫 질문 첫 토큰 {startup_metrics['first_query_ttft']:.2f}초 / 전체 {startup_metrics['first_query_total']:.2f}초"
+                     + ("" if startup_metrics["first_query_after_warmup"] else " (사전 준비 전)"))
+    return ", ".join(parts)
+
+
+# --- 핵심 로직 함수들 ---
+def route_question(query, query_vector=None):
+    """
+    질문의 종류를 판단하여 처리 경로를 반환합니다.
+    질문 임베딩이 있으면 주제별 중심 벡터와의 유사도로, 없거나 확신이 낮으면 키워드로 판단합니다.
+    """
+    return get_default_router().route(query, query_vector)
+
+
+def get_rag_response(query, azure_openai_client, search_client, stream=False, metrics=None, openai_client=None,
+                     memory=None):
+    """
+    Azure AI Search와 Azure OpenAI를 사용해 RAG 답변을 생성합니다.
+    stream=True이면 답변 텍스트 조각을 생성하는 제너레이터를 반환하고,
+    metrics에는 첫 토큰까지의 시간(ttft)과 전체 소요 시간(total)을 기록합니다.
+    openai_client를 주면 검색용 질문 임베딩으로 주제를 분류해서, 위키 질문이 아니면
+    검색을 중단하고 해당 주제의 일반 답변(get_external_response)으로 전환합니다.
+    memory(ConversationMemory)를 주면 후속 질문(uses_conversation)에 한해 이전 대화 요약과 최근 대화를 프롬프트에 넣고
+    이전 질문과 합쳐서 검색합니다.
+    """
+    pieces = _generate_rag_response(query, azure_openai_client, search_client, metrics, openai_client, memory)
+    return pieces if stream else "".join(pieces)
+
+
+def uses_conversation(query, memory):
+    """
+    이 질문의 답변에 대화 문맥(검색어 보강, 대화 기록)을 쓰는지 여부. 후속 질문일 때만 씁니다.
+    False인 질문은 프롬프트에 세션별 내용이 없으므로 답변 캐시와 세션 간 같은 질문 합치기(qna_backend)에 쓸 수 있습니다.
+    """
+    return bool(memory) and memory.is_followup(query)
+
+
+def conversation_context(query, memory):
+    """(검색어, 후속 질문 여부, 프롬프트에 넣을 대화 기록 메시지) 반환"""
+    if not uses_conversation(query, memory):
+        return query, False, []
+    return memory.search_query(query), True, memory.history_messages()
+
+
+def _generate_rag_response(query, azure_openai_client, search_client, metrics, openai_client=None, memory=None):
+    started_at = time.perf_counter()
+    try:
+        # 후속 질문만 이전 질문을 붙여서 검색하고 대화 기록을 프롬프트에 넣음.
+        # 답변이 대화 문맥에 따라 달라지므로 후속 질문은 답변 캐시를 쓰지 않고, 그 밖의 질문은 대화 기록 없이 답함
+        search_query, followup, history = conversation_context(query, memory)
+        if followup:
+            tracing.current_span().set("followup", True)
+
+        # 같은 인덱스 버전에서 거의 같은 질문에 답한 적이 있으면 그 답변을 재사용
+        answer_cache = get_default_answer_cache()
+        index_version = get_index_version()
+        cached = None
+        topic = "wiki"
+
+        def check_route_and_cache(vector):
+            # 임베딩이 나오면 검색 전에 주제 분류와 답변 캐시 확인 (둘 다 추가 API 호출 없음)
+            nonlocal cached, topic
+            if openai_client is not None:
+                topic = route_question(search_query, vector)
+                if topic != "wiki":
+                    return True
+            if followup:
+                return False
+            cached = answer_cache.lookup(vector, index_version)
+            return cached is not None
+
+        # 1~2. 질문 임베딩(캐시 사용)과 텍스트 검색을 동시에 시작하고, 벡터 검색 결과와 RRF로 합침
+        with tracing.span("retrieve") as span:
+            embedding_response, results = retrieve_documents(
+                search_query, azure_openai_client, search_client, AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME,
+                stop_if=check_route_and_cache
+            )
+            span.set("results", len(results))
+        if topic != "wiki":
+            if metrics is not None:
+                metrics["route"] = topic
+            yield from _generate_external_response(query, topic, openai_client, metrics, started_at, history)
+            return
+        if cached:
+            tracing.current_span().set("cache_hit", True)
+            if metrics is not None:
+                metrics["cache_hit"] = True
+            yield from yield_text(cached[0], started_at, metrics)
+            return
+
+        with tracing.span("context_build") as span:
+            # 중복 청크를 빼고 관련성과 다양성을 고려해 토큰 예산 안에서 컨텍스트 선택
+            results = pack_context(results, embedding_response, metrics=metrics)
+
+            # 3. 검색 결과를 컨텍스트로 구성
+            formatted_results = []
+            for result in results:            
+                title = result.get("title", "제목 없음")
+                chunk = result.get("chunk", "")
+                score = result.get('@search.reranker_score', result.get('@search.score', 0.0))
+                if chunk:
+                    formatted_results.append(
+                        f"[문서 정보]\n"
+                        f"제목: {title}\n"
+                        f"관련성 점수: {score:.4f}\n\n"
+                        f"[내용]\n{chunk}...\n"
+                    )
+            context = "\n\n---\n\n".join(formatted_results)
+            span.set("chunks", len(formatted_results))
+        
+        if not context:
+            yield from yield_text("관련된 위키 정보를 찾을 수 없습니다.", started_at, metrics)
+            return
+
+        # 4. LLM에 전달할 프롬프트 구성
+        system_message = """
+        당신은 사내 위키 전문가 챗봇입니다.
+        아래에 제공된 위키 문서 내용을 바탕으로 사용자의 질문에 대해 정확하고 상세하게 한국어로 답변해 주세요.
+        문서에 없는 내용은 답변하지 말고, "정보를 찾을 수 없습니다"라고 답변하세요.
+        """
+        
+        messages = [
+            {"role": "system", "content": system_message},
+            *history,
+            {"role": "user", "content": f"## 위키 문서:\n{context}\n\n## 질문:\n{query}"}
+        ]
+        with tracing.span("chat", route="wiki") as span:
+            response = get_caller("openai.chat").call(
+                azure_openai_client.chat.completions.create,
+                model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
+                messages=messages,
+                temperature=0.1,
+                stream=True,
+                **chat_stream_options()
+            )
+            pieces = []
+            for piece in stream_chat_with_usage(response, messages, started_at, metrics, span):
+                pieces.append(piece)
+                yield piece
+        answer = "".join(pieces)
+        # 검색 시간 초과로 임베딩 없이 텍스트 결과만으로 답한 경우는 캐시에 넣을 벡터가 없음
+        if not followup and embedding_response is not None:
+            answer_cache.store(query, embedding_response, answer, index_version, time.perf_counter() - started_at)
+    except Exception as e:
+        if metrics is not None:
+            metrics["error"] = f"{type(e).__name__}: {e}"
+        yield from yield_text(f"죄송합니다, RAG 정보를 조회하는 데 문제가 발생했습니다.: {e}", started_at, metrics)
+
+
+def get_external_response(query, topic, openai_client, stream=False, metrics=None, memory=None):
+    """
+    Azure OpenAI API를 사용해 특정 주제에 대한 일반 답변을 생성합니다.
+    stream=True이면 답변 텍스트 조각을 생성하는 제너레이터를 반환합니다.
+    memory(ConversationMemory)를 주면 후속 질문에 한해 이전 대화 요약과 최근 대화를 프롬프트에 넣습니다.
+    """
+    history = conversation_context(query, memory)[2]
+    pieces = _generate_external_response(query, topic, openai_client, metrics, history=history)
+    return pieces if stream else "".join(pieces)
+
+
+def _generate_external_response(query, topic, openai_client, metrics, started_at=None, history=None):
+    started_at = started_at or time.perf_counter()
+    topic_map = {
+        "linux": "당신은 리눅스 명령어와 쉘 스크립트 전문가입니다.",
+        "postgres": "당신은 PostgreSQL 데이터베이스 성능 튜닝 및 SQL 전문가입니다."
+    }
+    system_message = topic_map.get(topic, "당신은 유용한 AI 어시스턴트입니다.")
+    system_message += " 사용자의 질문에 대해 전문가 수준의 정확한 정보를 한국어로 제공해 주세요. 필요한 경우 코드 예시를 포함해 주세요."
+    system_message += " 당신의 전문분야 외의 정보는 전혀 모릅니다."
+
+    messages = [
+        {"role": "system", "content": system_message},
+        *(history or []),
+        {"role": "user", "content": query}
+    ]
+    try:
+        with tracing.span("chat", route=topic) as span:
+            response = get_caller("openai.chat").call(
+                openai_client.chat.completions.create,
+                model=AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
+                messages=messages,
+                temperature=0.3,
+                stream=True,
+                **chat_stream_options()
+            )
+            yield from stream_chat_with_usage(response, messages, started_at, metrics, span)
+    except Exception as e:
+        if metrics is not None:
+            metrics["error"] = f"{type(e).__name__}: {e}"
+        yield from yield_text(f"죄송합니다, 정보를 조회하는 데 문제가 발생했습니다.: {e}", started_at, metrics)
+
+
+def generate_answer(query, metrics=None, memory=None):
+    """
+    질문 하나에 대한 답변 텍스트 조각을 순서대로 생성합니다 (콘솔 챗봇과 Streamlit 앱 공용).
+    질문 분류는 검색용 질문 임베딩으로 RAG 경로 안에서 수행하고, 위키 질문이 아니면 일반 답변으로 전환합니다.
+    memory(ConversationMemory)를 주면 대화 문맥을 사용하고, 답변이 끝나면 이번 질문/답변을 기록합니다.
+    """
+    azure_openai_client, search_client, openai_client = load_clients()
+    metrics = {} if metrics is None else metrics
+    pieces = []
+    # 요청 하나를 루트 span으로 기록 (검색·컨텍스트 구성·답변 생성 단계는 하위 span)
+    with tracing.span("qna", route="wiki") as span:
+        for piece in get_rag_response(query, azure_openai_client, search_client, stream=True, metrics=metrics,
+                                      openai_client=openai_client, memory=memory):
+            pieces.append(piece)
+            yield piece
+        span.set("route", metrics.get("route", "wiki"))
+        span.set("ttft_ms", round(metrics.get("ttft", 0.0) * 1000, 1))
+
+    if memory is not None:
+        # 오래된 대화를 요약에 합치는 작업은 다음 질문 전에 백그라운드에서 처리
+        memory.add_turn(query, "".join(pieces))
+        memory.fold_in_background(openai_client, AZURE_OPENAI_CHAT_DEPLOYMENT_NAME)
+
+    if "first_query_total" not in startup_metrics:
+        startup_metrics["first_query_ttft"] = metrics.get("ttft", 0.0)
+        startup_metrics["first_query_total"] = metrics.get("total", 0.0)
+        startup_metrics["first_query_after_warmup"] = _ready.is_set()
+
+
+startup_metrics["import_seconds"] = time.perf_counter() - _import_started_at
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from resilient_calls import get_caller
+
+load_dotenv()
+
+ROUTER_EXAMPLES_PATH = os.getenv("ROUTER_EXAMPLES_PATH")  # 주제별 예시 질문 JSON ({"linux": [...], ...}), 없으면 기본 예시
+ROUTER_CENTROIDS_PATH = os.getenv("ROUTER_CENTROIDS_PATH", os.path.join(".cache", "router_centroids.npz"))
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.35"))  # 가장 가까운 주제의 최소 코사인 유사도
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.03"))  # 두 번째 주제와의 최소 점수 차이
+
+DEFAULT_EXAMPLES = {
+    "linux": [
+        "리눅스에서 디스크 사용량 확인하는 명령어",
+        "특정 포트를 사용하는 프로세스 찾는 방법",
+        "crontab으로 매일 새벽에 스크립트 실행하기",
+        "쉘 스크립트에서 파일 존재 여부 확인",
+        "systemctl로 서비스 재시작하고 로그 보기",
+        "tar로 디렉터리 압축하고 풀기",
+        "파일 권한과 소유자 변경 chmod chown",
+        "메모리 사용량이 높은 프로세스 확인 top free",
+        "ssh 키 생성하고 서버에 등록하는 방법",
+        "grep과 awk로 로그에서 에러만 추출",
+    ],
+    "postgres": [
+        "vacuum 주기 설정",
+        "autovacuum 파라미터 튜닝 방법",
+        "느린 쿼리 실행 계획 explain analyze 보는 법",
+        "shared_buffers work_mem 권장 설정값",
+        "테이블 인덱스 추가해서 조회 성능 개선",
+        "pg_dump로 데이터베이스 백업하고 복원",
+        "현재 실행 중인 쿼리와 락 확인 pg_stat_activity",
+        "테이블 파티셔닝 하는 방법",
+        "커넥션 수 max_connections 늘리기",
+        "SQL 조인 성능이 느릴 때 확인할 것",
+    ],
+    "wiki": [
+        "CMS 마지막 배포일자를 알려줘",
+        "에어맵 서비스 장애 이력 알려줘",
+        "운영 서버 점검 절차가 어떻게 돼?",
+        "배포 담당자와 배포 절차",
+        "에어맵 API 서버 구성도",
+        "지난달 정기 점검 내용",
+        "관측소 데이터 수집 주기는?",
+        "대기질 예보 서비스 운영 이력",
+        "모니터링 알림 받는 담당자 목록",
+        "에어맵 앱 업데이트 내역",
+    ],
+}
+
+
+def keyword_route(query):
+    """
+    질문에 포함된 키워드로 처리 경로를 판단합니다.
+    (주제 벡터를 쓸 수 없거나 확신이 낮을 때 사용)
+    """
+    query_lower = query.lower()
+
+    if "리눅스" in query_lower or "linux" in query_lower:
+        return "linux"
+    elif "포스트그레" in query_lower or "포스트그레스" in query_lower or "postgres" in query_lower or "postgresql" in query_lower:
+        return "postgres"
+    else:
+        return "wiki"
+
+
+class QuestionRouter:
+    """
+    주제별 예시 질문 임베딩의 평균(중심 벡터)과 질문 임베딩의 코사인 유사도로 처리 경로를 고릅니다.
+    질문 임베딩은 RAG 검색에서 이미 계산한 것을 그대로 받으므로 분류에 추가 API 호출이 없습니다.
+    """
+
+    def __init__(self, examples=None, threshold=ROUTER_THRESHOLD, margin=ROUTER_MARGIN,
+                 centroids_path=ROUTER_CENTROIDS_PATH):
+        if examples is None and ROUTER_EXAMPLES_PATH:
+            with open(ROUTER_EXAMPLES_PATH, encoding="utf-8") as f:
+                examples = json.load(f)
+        self.examples = examples or DEFAULT_EXAMPLES
+        self.threshold = threshold
+        self.margin = margin
+        self.centroids_path = centroids_path
+        self.topics = sorted(self.examples)
+        self.centroids = None  # (주제 수 × 차원), 행마다 정규화됨
+        self._lock = threading.Lock()
+
+    def _examples_key(self, deployment):
+        payload = json.dumps([deployment, {topic: self.examples[topic] for topic in self.topics}], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def prepare(self, client, deployment):
+        """
+        주제별 중심 벡터를 준비합니다.
+        예시 질문과 배포 이름이 같으면 디스크에 저장해 둔 중심 벡터를 사용하고,
+        없으면 예시 질문 전체를 한 번의 임베딩 호출로 계산해 저장합니다.
+        """
+        key = self._examples_key(deployment)
+        with self._lock:
+            if self.centroids is not None:
+                return
+            if os.path.exists(self.centroids_path):
+                with np.load(self.centroids_path) as saved:
+                    if str(saved["key"]) == key:
+                        self.centroids = saved["centroids"]
+                        return
+
+            texts = [text for topic in self.topics for text in self.examples[topic]]
+            response = get_caller("openai.embed").call(client.embeddings.create, input=texts, model=deployment)
+            vectors = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            centroids = []
+            start = 0
+            for topic in self.topics:
+                count = len(self.examples[topic])
+                centroid = vectors[start:start + count].mean(axis=0)
+                centroids.append(centroid / np.linalg.norm(centroid))
+                start += count
+            self.centroids = np.vstack(centroids)
+
+            directory = os.path.dirname(self.centroids_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.centroids_path, "wb") as f:
+                np.savez(f, key=np.array(key), centroids=self.centroids)
+
+    def prepare_in_background(self, client, deployment):
+        """시작 시간을 늘리지 않도록 중심 벡터를 백그라운드에서 준비 (준비 전에는 키워드로 분류)"""
+        def run():
+            try:
+                self.prepare(client, deployment)
+            except Exception as e:
+                print(f"질문 분류기 준비 실패 (키워드 분류 사용): {e}")
+
+        threading.Thread(target=run, name="router-prepare", daemon=True).start()
+
+    def classify(self, query_vector):
+        """(주제, 유사도) 반환. 중심 벡터가 없거나 확신이 낮으면 주제는 None"""
+        centroids = self.centroids
+        if centroids is None or query_vector is None:
+            return None, 0.0
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = centroids @ (query / (np.linalg.norm(query) or 1.0))
+        order = np.argsort(-scores)
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else -1.0
+        if best < self.threshold or best - runner_up < self.margin:
+            return None, best
+        return self.topics[order[0]], best
+
+    def route(self, query, query_vector=None):
+        """질문 임베딩으로 분류하고, 확신이 낮으면 키워드로 처리 경로를 판단"""
+        topic, _ = self.classify(query_vector)
+        return topic or keyword_route(query)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router():
+    """프로세스 전체에서 공유하는 질문 분류기"""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = QuestionRouter()
+        return _default_router
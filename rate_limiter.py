@@ -0,0 +1,53 @@
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """
+    분당 요청 수(RPM)와 분당 토큰 수(TPM) 한도를 함께 지키는 토큰 버킷 limiter.
+    여러 스레드가 하나의 인스턴스를 공유해서 Azure OpenAI 호출 속도를 맞춥니다.
+    """
+
+    def __init__(self, rpm, tpm=None, burst_seconds=10):
+        # Azure OpenAI는 분당 한도를 10초 단위로 나눠서 적용하므로 버스트도 그만큼만 허용
+        self.rpm = rpm
+        self.tpm = tpm
+        self._request_rate = rpm / 60.0
+        self._token_rate = tpm / 60.0 if tpm else None
+        self._request_capacity = max(1.0, self._request_rate * burst_seconds)
+        self._token_capacity = max(1.0, self._token_rate * burst_seconds) if tpm else None
+        self._requests = self._request_capacity
+        self._tokens = self._token_capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self._request_capacity, self._requests + elapsed * self._request_rate)
+        if self._token_rate:
+            self._tokens = min(self._token_capacity, self._tokens + elapsed * self._token_rate)
+
+    def acquire(self, tokens=0):
+        """요청 1건과 토큰 tokens개를 쓸 수 있을 때까지 대기한 뒤 차감합니다."""
+        if self._token_rate:
+            # 버킷 용량보다 큰 요청은 버킷이 가득 찰 때까지 기다린 뒤 통과시킴
+            tokens = min(tokens, self._token_capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+                request_wait = (1 - self._requests) / self._request_rate if self._requests < 1 else 0.0
+                token_wait = 0.0
+                if self._token_rate and self._tokens < tokens:
+                    token_wait = (tokens - self._tokens) / self._token_rate
+
+                if request_wait <= 0 and token_wait <= 0:
+                    self._requests -= 1
+                    if self._token_rate:
+                        self._tokens -= tokens
+                    return
+
+                wait = max(request_wait, token_wait)
+            time.sleep(wait)
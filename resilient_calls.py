@@ -0,0 +1,463 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+import tracing
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))  # 첫 호출을 포함한 최대 시도 횟수
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", "0.5"))  # 지수 백오프의 첫 대기 시간
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "20"))  # 한 번에 기다리는 최대 시간, Retry-After가 더 길면 포기
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))  # 정상 호출 대비 허용하는 재시도 비율
+RETRY_BUDGET_MIN = 10  # 호출이 적을 때도 허용하는 재시도 여유분
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # 연속 실패가 이 횟수에 이르면 차단
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))  # 차단 후 시험 호출을 보내기까지의 시간
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"  # 질의 경로 호출이 p95를 넘으면 같은 요청을 한 번 더 보낼지 여부
+HEDGE_MIN_SAMPLES = 20  # p95를 믿을 수 있을 만큼 쌓인 호출 수
+HEDGE_WORKERS = 16
+LATENCY_WINDOW = 200  # p95 계산에 쓰는 최근 호출 수
+
+# 재시도할 HTTP 상태 코드 (타임아웃, 요청 과다, 일시적인 서버 오류)
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# 재시도할 연결 오류 클래스 이름 (openai, azure-core). SDK 임포트 시간이 길어서 클래스 대신 이름으로 판단
+TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "ServiceRequestError", "ServiceResponseError"}
+
+
+class CircuitOpenError(Exception):
+    """연속 실패로 호출이 차단된 상태"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} 서비스 호출이 잠시 차단되었습니다 ({retry_in:.0f}초 후 다시 시도)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def status_code(error):
+    # openai.APIStatusError와 azure HttpResponseError 모두 status_code 속성을 가짐
+    return getattr(error, "status_code", None)
+
+
+def is_transient_error(error):
+    """다시 시도하면 성공할 수 있는 오류인지 판단 (연결 오류, 타임아웃, 429, 5xx)"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return status_code(error) in TRANSIENT_STATUS_CODES
+
+
+def is_throttled(error):
+    """
+    서버가 Retry-After와 함께 돌려준 429인지 판단.
+    서비스는 정상이고 요청 속도만 조절하라는 뜻이므로 차단기 실패나 재시도 예산으로 세지 않습니다.
+    """
+    return status_code(error) == 429 and retry_after_seconds(error) is not None
+
+
+def retry_after_seconds(error):
+    """오류 응답의 retry-after-ms / Retry-After 헤더 값(초), 없으면 None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP 날짜 형식
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=RETRY_BASE_SECONDS, max_delay=RETRY_MAX_DELAY_SECONDS):
+    """attempt번째 재시도 전 대기 시간 (지수 백오프의 절반은 고정, 절반은 무작위로 분산)"""
+    delay = min(max_delay, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    의존 서비스(OpenAI, Search, Blob) 하나의 차단기.
+    일시적인 오류가 연속으로 failure_threshold번 나면 reset_seconds 동안 호출을 바로 거절하고,
+    그 뒤 시험 호출 하나만 보내서 성공하면 다시 엽니다.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def allow(self):
+        """호출 가능하면 반환하고 차단 중이면 CircuitOpenError. 이 호출이 시험 호출이면 True를 반환"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_seconds and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpenError(self.name, max(0.0, self.reset_seconds - waited))
+
+    def release_probe(self):
+        """결과 없이 끝난(취소된) 시험 호출의 자리를 비워서 다음 호출이 다시 시험할 수 있게 함"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if self._probing else "open"
+
+
+class RetryBudget:
+    """
+    재시도 예산. 호출마다 ratio만큼 쌓이고 재시도마다 1씩 쓰므로,
+    장애가 길어져도 재시도가 정상 호출의 ratio 비율을 넘어 부하를 키우지 않습니다.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.capacity = minimum
+        self._balance = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class LatencyTracker:
+    """최근 성공한 호출의 소요 시간으로 p95를 계산 (헤지 요청을 보낼 시점)"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = list(self._samples)
+        return tracing.percentile(samples, 95)
+
+
+class ResilientCaller:
+    """
+    외부 API 호출 하나(예: "openai.embed")의 재시도·차단·헤지 정책.
+    일시적인 오류는 Retry-After 헤더가 있으면 그만큼, 없으면 지수 백오프로 기다렸다가 재시도하고,
+    같은 의존 서비스(이름의 앞부분)를 쓰는 호출들은 차단기와 재시도 예산을 공유합니다.
+    hedge=True로 호출하면 첫 요청이 최근 p95를 넘길 때 같은 요청을 한 번 더 보내고 먼저 끝난 결과를 씁니다.
+    (헤지는 멱등이고 가벼운 질의 경로 호출(임베딩, 검색)에만 사용)
+    wait_for_circuit=True면 차단 중일 때 바로 실패하지 않고 차단이 풀릴 때까지 기다립니다.
+    (결과를 버리면 안 되는 수집 작업용. 질의 경로는 빨리 실패하는 편이 나음)
+    """
+
+    def __init__(self, name, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_SECONDS,
+                 max_delay=RETRY_MAX_DELAY_SECONDS, breaker=None, budget=None, wait_for_circuit=False):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.wait_for_circuit = wait_for_circuit
+        dependency = name.split(".")[0]
+        self.breaker = breaker or get_breaker(dependency)
+        self.budget = budget or get_retry_budget(dependency)
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "circuit_waits": 0,
+                       "budget_exhausted": 0, "hedged": 0, "hedge_wins": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _retry_delay(self, attempt, error):
+        """재시도 전 대기 시간. 재시도하지 않아야 하면 None"""
+        if not is_transient_error(error) or attempt + 1 >= self.max_attempts:
+            return None
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        elif delay > self.max_delay:
+            return None
+        if is_throttled(error):
+            # 서버가 정해 준 시간만큼 기다리는 재시도는 부하를 키우지 않으므로 예산을 쓰지 않음
+            return delay
+        if not self.budget.withdraw():
+            self._count("budget_exhausted")
+            return None
+        return delay
+
+    def _before_attempt(self):
+        try:
+            return self.breaker.allow()
+        except CircuitOpenError:
+            self._count("circuit_waits" if self.wait_for_circuit else "rejected")
+            raise
+
+    def _circuit_wait(self, error):
+        # 다른 호출이 시험 중이면(retry_in=0) 짧게 기다렸다가 다시 확인
+        return max(error.retry_in, self.base_delay)
+
+    def _after_error(self, error, probe):
+        if is_throttled(error):
+            # 속도 제한은 서비스 장애가 아니므로 연속 실패로 세지 않음
+            if probe:
+                self.breaker.release_probe()
+        elif is_transient_error(error):
+            self.breaker.record_failure()
+        else:
+            # 요청 자체의 문제(400 등)는 서비스가 응답한 것이므로 차단 대상이 아님
+            self.breaker.record_success()
+
+    def _after_success(self, started_at):
+        self.latency.record(time.perf_counter() - started_at)
+        self.breaker.record_success()
+        self.budget.deposit()
+
+    def _record_retry(self, attempt, delay, error, on_retry):
+        self._count("retries")
+        tracing.current_span().set("retries", attempt + 1)
+        if on_retry:
+            on_retry(attempt, delay, error)
+
+    def call(self, func, *args, hedge=False, on_retry=None, **kwargs):
+        """func(*args, **kwargs)를 재시도 정책에 따라 호출. on_retry(attempt, delay, error)는 재시도 직전에 호출"""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            while True:
+                try:
+                    probe = self._before_attempt()
+                    break
+                except CircuitOpenError as e:
+                    if not self.wait_for_circuit:
+                        raise
+                    time.sleep(self._circuit_wait(e))
+            try:
+                return self._call_once(func, args, kwargs, hedge)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # 중단(KeyboardInterrupt 등)된 시험 호출은 성공/실패로 세지 않음
+                    if probe:
+                        self.breaker.release_probe()
+                    raise
+                self._after_error(e, probe)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                self._record_retry(attempt, delay, e, on_retry)
+                time.sleep(delay)
+
+    async def call_async(self, func, *args, hedge=False, on_retry=None, **kwargs):
+        """코루틴 함수 func용 call"""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            while True:
+                try:
+                    probe = self._before_attempt()
+                    break
+                except CircuitOpenError as e:
+                    if not self.wait_for_circuit:
+                        raise
+                    await asyncio.sleep(self._circuit_wait(e))
+            try:
+                return await self._call_once_async(func, args, kwargs, hedge)
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    # 취소된 시험 호출(예: 답변 캐시 적중으로 텍스트 검색 취소)은 성공/실패로 세지 않음
+                    if probe:
+                        self.breaker.release_probe()
+                    raise
+                self._after_error(e, probe)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                self._record_retry(attempt, delay, e, on_retry)
+                await asyncio.sleep(delay)
+
+    def _timed(self, func):
+        # 헤지한 요청도 각자 끝난 시간을 기록해야 p95가 실제 분포를 반영함
+        def run(*args, **kwargs):
+            started_at = time.perf_counter()
+            result = func(*args, **kwargs)
+            self._after_success(started_at)
+            return result
+        return run
+
+    def _call_once(self, func, args, kwargs, hedge):
+        delay = self.latency.p95() if hedge and HEDGE_REQUESTS else None
+        if delay is None:
+            return self._timed(func)(*args, **kwargs)
+
+        executor = _get_hedge_executor()
+        primary = executor.submit(tracing.bind_context(self._timed(func)), *args, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count("hedged")
+        backup = executor.submit(tracing.bind_context(self._timed(func)), *args, **kwargs)
+        done, pending = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = backup if backup in done else primary
+        if first.exception() is not None and pending:
+            # 먼저 끝난 쪽이 실패했으면 나머지 요청의 결과를 기다림
+            first = pending.pop()
+        if first is backup:
+            self._count("hedge_wins")
+        return first.result()
+
+    async def _call_once_async(self, func, args, kwargs, hedge):
+        async def run():
+            started_at = time.perf_counter()
+            result = await func(*args, **kwargs)
+            self._after_success(started_at)
+            return result
+
+        delay = self.latency.p95() if hedge and HEDGE_REQUESTS else None
+        if delay is None:
+            return await run()
+
+        primary = asyncio.ensure_future(run())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            self._count("hedged")
+            backup = asyncio.ensure_future(run())
+            tasks.add(backup)
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            first = backup if backup in done else primary
+            if first.exception() is not None and pending:
+                first = pending.pop()
+                await asyncio.wait({first})
+            if first is backup:
+                self._count("hedge_wins")
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["circuit"] = self.breaker.state
+        stats["p95"] = self.latency.p95()
+        return stats
+
+
+_breakers = {}
+_budgets = {}
+_callers = {}
+_registry_lock = threading.Lock()
+_hedge_executor = None
+
+
+def get_breaker(dependency):
+    """의존 서비스별로 프로세스에서 공유하는 차단기"""
+    with _registry_lock:
+        if dependency not in _breakers:
+            _breakers[dependency] = CircuitBreaker(dependency)
+        return _breakers[dependency]
+
+
+def get_retry_budget(dependency):
+    """의존 서비스별로 프로세스에서 공유하는 재시도 예산"""
+    with _registry_lock:
+        if dependency not in _budgets:
+            _budgets[dependency] = RetryBudget()
+        return _budgets[dependency]
+
+
+def get_caller(name, **options):
+    """
+    이름별로 프로세스에서 공유하는 ResilientCaller ("의존 서비스.작업" 형식, 예: "openai.chat").
+    options(max_attempts, max_delay 등)는 처음 만들 때만 적용됩니다.
+    """
+    with _registry_lock:
+        caller = _callers.get(name)
+    if caller is None:
+        caller = ResilientCaller(name, **options)
+        with _registry_lock:
+            caller = _callers.setdefault(name, caller)
+    return caller
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _registry_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def caller_stats():
+    """호출 이름별 재시도·차단·헤지 통계"""
+    with _registry_lock:
+        callers = dict(_callers)
+    return {name: caller.stats() for name, caller in sorted(callers.items())}
+
+
+def format_caller_stats():
+    """재시도나 차단이 있었던 호출만 한 줄씩 요약 (없으면 빈 문자열)"""
+    lines = []
+    for name, stats in caller_stats().items():
+        if not (stats["retries"] or stats["failures"] or stats["rejected"] or stats["circuit_waits"] or stats["hedged"]):
+            continue
+        line = (f"  - {name}: {stats['calls']}회 호출, 재시도 {stats['retries']}회, 실패 {stats['failures']}회, "
+                f"차단 {stats['rejected']}회 ({stats['circuit']})")
+        if stats["circuit_waits"]:
+            line += f", 차단 해제 대기 {stats['circuit_waits']}회"
+        if stats["hedged"]:
+            line += f", 헤지 {stats['hedged']}회 (헤지 응답이 빠름 {stats['hedge_wins']}회)"
+        lines.append(line)
+    return "\n".join(lines)
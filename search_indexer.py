@@ -0,0 +1,189 @@
+import hashlib
+import os
+import time
+
+from dotenv import load_dotenv
+
+import tracing
+from embedding_cache import EmbeddingCache
+from local_lexical_index import split_passages
+from resilient_calls import backoff_delay, get_caller
+from token_counter import truncate_tokens
+
+# 모듈 임포트 시점에 설정을 읽으므로 .env를 먼저 로드
+load_dotenv()
+
+AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT")
+AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_API_KEY")
+AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME")
+AZURE_SEARCH_KEY_FIELD = os.getenv("AZURE_SEARCH_KEY_FIELD", "chunk_id")  # 인덱스의 키 필드 이름
+AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME")
+
+SEARCH_CHUNK_TOKENS = int(os.getenv("SEARCH_CHUNK_TOKENS", "512"))  # 마크다운을 나눌 검색 문서 크기
+SEARCH_EMBED_BATCH = int(os.getenv("SEARCH_EMBED_BATCH", "64"))  # embeddings.create 한 번에 보낼 청크 수
+SEARCH_UPLOAD_BATCH = int(os.getenv("SEARCH_UPLOAD_BATCH", "100"))  # upload_documents 한 번에 보낼 문서 수 (요청당 16MB 한도)
+SEARCH_EMBEDDING_CACHE_PATH = os.getenv("SEARCH_EMBEDDING_CACHE_PATH", os.path.join(".cache", "chunk_embeddings.sqlite3"))
+EMBEDDING_MAX_INPUT_TOKENS = 8000  # 임베딩 모델의 입력 한도(8191)보다 조금 작게
+UPLOAD_MAX_RETRIES = 3
+RETRYABLE_STATUS_CODES = (409, 422, 429, 503)  # 문서별 결과 중 다시 보내면 성공할 수 있는 상태
+
+VECTOR_FIELD = "text_vector"
+
+
+def make_document_key(filename, position):
+    """
+    마크다운 파일 안의 위치로 검색 문서 키 생성.
+    같은 파일을 다시 변환하면 같은 키를 덮어쓰므로 인덱서 없이도 문서가 중복되지 않습니다.
+    """
+    return hashlib.sha256(f"{filename}\x00{position}".encode("utf-8")).hexdigest()[:32]
+
+
+def create_search_client():
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+
+    return SearchClient(
+        endpoint=AZURE_SEARCH_ENDPOINT,
+        index_name=AZURE_SEARCH_INDEX_NAME,
+        credential=AzureKeyCredential(AZURE_SEARCH_KEY),
+        retry_total=0,  # 재시도는 resilient_calls에서 처리
+    )
+
+
+class DirectIndexer:
+    """
+    Azure AI Search 인덱서 일정을 기다리지 않고 수집 스크립트가 직접 인덱스를 갱신합니다.
+    마크다운을 청크로 나눠 embeddings.create에 여러 개씩 묶어 보내고,
+    title/chunk/text_vector 문서를 upload_documents로 한 번에 SEARCH_UPLOAD_BATCH개씩 올립니다.
+    청크 임베딩은 청크 텍스트 해시 기준으로 캐시해서 바뀌지 않은 청크는 다시 임베딩하지 않습니다.
+    """
+
+    def __init__(self, openai_client, search_client=None, deployment=AZURE_OPENAI_EMBBEDING_DEPLOYMENT_NAME,
+                 key_field=AZURE_SEARCH_KEY_FIELD, embed_batch=SEARCH_EMBED_BATCH, upload_batch=SEARCH_UPLOAD_BATCH,
+                 cache_path=SEARCH_EMBEDDING_CACHE_PATH):
+        self.openai_client = openai_client
+        self.deployment = deployment
+        self.key_field = key_field
+        self.embed_batch = embed_batch
+        self.upload_batch = upload_batch
+        self.cache_path = cache_path
+        self._search_client = search_client
+        self._cache = None
+        # 수집 작업은 질의 경로보다 오래 기다려도 되므로 Retry-After를 최대 60초까지 따르고 차단이 풀릴 때까지 기다림
+        self._embed_caller = get_caller("openai.index_embed", max_delay=60, wait_for_circuit=True)
+        self._index_caller = get_caller("search.index", max_delay=60, wait_for_circuit=True)
+        self._stats = {"documents": 0, "embedded": 0, "embedding_cache_hits": 0, "embedding_calls": 0,
+                       "upload_calls": 0, "failed": 0, "deleted": 0}
+
+    @property
+    def search_client(self):
+        # 인덱스에 직접 넣지 않는 실행에서는 클라이언트를 만들지 않음
+        if self._search_client is None:
+            self._search_client = create_search_client()
+        return self._search_client
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            # 청크는 질문과 달리 정규화하면 다른 내용이 같은 키가 되므로 원문 해시로 별도 공간에 저장
+            self._cache = EmbeddingCache(path=self.cache_path, namespace="chunk")
+        return self._cache
+
+    def embed(self, texts):
+        """텍스트 목록의 임베딩. 캐시에 없는 텍스트만 SEARCH_EMBED_BATCH개씩 묶어서 호출"""
+        vectors = [self.cache.get(text, self.deployment) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        self._stats["embedding_cache_hits"] += len(texts) - len(missing)
+        for start in range(0, len(missing), self.embed_batch):
+            batch = missing[start:start + self.embed_batch]
+            with tracing.span("embed", inputs=len(batch)) as span:
+                response = self._embed_caller.call(
+                    self.openai_client.embeddings.create,
+                    input=[truncate_tokens(texts[i], EMBEDDING_MAX_INPUT_TOKENS) for i in batch],
+                    model=self.deployment,
+                )
+                if response.usage:
+                    span.add_tokens("embedding_tokens", response.usage.prompt_tokens)
+            # 응답 순서는 입력 순서와 같지만 index 필드가 있으면 그것을 기준으로 맞춤
+            for position, item in enumerate(response.data):
+                i = batch[getattr(item, "index", position)]
+                vectors[i] = item.embedding
+                self.cache.put(texts[i], self.deployment, item.embedding)
+            self._stats["embedding_calls"] += 1
+            self._stats["embedded"] += len(batch)
+        return vectors
+
+    def build_documents(self, markdown_files):
+        """
+        마크다운 파일 [(파일명, 텍스트), ...]을 검색 문서로 변환합니다.
+        반환값은 (문서 목록, 파일명별 문서 키 목록)입니다.
+        """
+        documents = []
+        keys_by_file = {}
+        for filename, markdown_text in markdown_files:
+            keys_by_file[filename] = []
+            for position, passage in enumerate(split_passages(markdown_text, SEARCH_CHUNK_TOKENS)):
+                key = make_document_key(filename, position)
+                documents.append({self.key_field: key, "title": filename, "chunk": passage})
+                keys_by_file[filename].append(key)
+
+        vectors = self.embed([document["chunk"] for document in documents])
+        for document, vector in zip(documents, vectors):
+            document[VECTOR_FIELD] = vector
+        return documents, keys_by_file
+
+    def _send(self, action, documents):
+        """upload_documents/delete_documents를 배치로 호출하고 실패한 문서 키 집합 반환"""
+        failed = set()
+        for start in range(0, len(documents), self.upload_batch):
+            pending = documents[start:start + self.upload_batch]
+            for attempt in range(UPLOAD_MAX_RETRIES + 1):
+                self._stats["upload_calls"] += 1
+                results = self._index_caller.call(getattr(self.search_client, action), documents=pending)
+                retry_keys = {result.key for result in results
+                              if not result.succeeded and result.status_code in RETRYABLE_STATUS_CODES}
+                failed.update(result.key for result in results
+                              if not result.succeeded and result.status_code not in RETRYABLE_STATUS_CODES)
+                pending = [document for document in pending if document[self.key_field] in retry_keys]
+                if not pending:
+                    break
+                if attempt == UPLOAD_MAX_RETRIES:
+                    failed.update(retry_keys)
+                    break
+                time.sleep(backoff_delay(attempt, max_delay=60))
+        return failed
+
+    def index_markdown(self, markdown_files):
+        """
+        마크다운 파일들을 인덱스에 넣고 파일명별 문서 키 목록을 반환합니다.
+        문서가 하나라도 실패한 파일은 결과에서 빠지므로 다음 실행 때 다시 넣습니다.
+        """
+        with tracing.span("index_push", files=len(markdown_files)) as span:
+            documents, keys_by_file = self.build_documents(markdown_files)
+            failed = self._send("upload_documents", documents) if documents else set()
+            span.set("documents", len(documents))
+            span.set("failed", len(failed))
+        self._stats["documents"] += len(documents) - len(failed)
+        self._stats["failed"] += len(failed)
+        return {filename: keys for filename, keys in keys_by_file.items() if not failed.intersection(keys)}
+
+    def delete_documents(self, keys):
+        """더 이상 마크다운에 없는 문서 삭제 (PDF가 짧아졌거나 청크 경계가 바뀐 경우)"""
+        keys = sorted(keys)
+        if not keys:
+            return True
+        failed = self._send("delete_documents", [{self.key_field: key} for key in keys])
+        self._stats["deleted"] += len(keys) - len(failed)
+        return not failed
+
+    def stats(self):
+        return dict(self._stats)
+
+
+def format_index_stats(stats, since=None):
+    """인덱스 직접 갱신 통계를 한 줄 문자열로 변환 (since를 주면 그 이후 변화량만 표시)"""
+    if since:
+        stats = {key: value - since.get(key, 0) for key, value in stats.items()}
+    return (f"검색 인덱스: 문서 {stats['documents']}개 업로드 (실패 {stats['failed']}개, 삭제 {stats['deleted']}개), "
+            f"임베딩 {stats['embedded']}개/{stats['embedding_calls']}회 호출 (캐시 적중 {stats['embedding_cache_hits']}개), "
+            f"인덱스 요청 {stats['upload_calls']}회")
@@ -0,0 +1,50 @@
+import unittest
+
+from conversation_memory import ConversationMemory
+
+
+class IsFollowupTest(unittest.TestCase):
+    def setUp(self):
+        self.memory = ConversationMemory()
+        self.memory.add_turn("CMS 배포일자 알려줘", "3월 2일입니다.")
+
+    def test_questions_that_refer_to_the_conversation(self):
+        for query in [
+            "그럼 그 배포는 누가 했어?",
+            "그거 다시 설명해줘",
+            "거기서 에러가 나면 어떻게 해?",
+            "이 서버 재시작 방법은?",
+            "담당자는?",
+            "배포일은?",
+            "왜?",
+            "What about the rollback?",
+            "How do I restart it?",
+        ]:
+            with self.subTest(query=query):
+                self.assertTrue(self.memory.is_followup(query))
+
+    def test_standalone_questions(self):
+        for query in [
+            "vacuum 설정 방법?",
+            "Redis 포트?",
+            "PostgreSQL vacuum 설정 방법 알려줘",
+            "리눅스에서 디스크 사용량 확인하는 명령어",
+            "위키에서 API 인증 방식 찾아줘",
+            "그래프 대시보드 접속 주소 알려줘",
+            "How do I also enable audit logging for Postgres?",
+            "How do I find files that contain this string?",
+            "Then what is the default port of nginx?",
+        ]:
+            with self.subTest(query=query):
+                self.assertFalse(self.memory.is_followup(query))
+
+    def test_first_question_is_never_a_followup(self):
+        self.assertFalse(ConversationMemory().is_followup("그럼 담당자는?"))
+
+    def test_search_query_adds_previous_query_only_for_followups(self):
+        self.assertEqual(self.memory.search_query("담당자는?"), "CMS 배포일자 알려줘 담당자는?")
+        self.assertEqual(self.memory.search_query("Redis 포트?"), "Redis 포트?")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import threading
+import unittest
+from unittest import mock
+
+import qna_backend
+from conversation_memory import ConversationMemory
+from qna_core import conversation_context
+
+
+def make_memory(question, answer):
+    memory = ConversationMemory()
+    memory.add_turn(question, answer)
+    return memory
+
+
+class QnaBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.prompts = []
+        self.prompts_lock = threading.Lock()
+
+    def fake_generate_answer(self, query, metrics=None, memory=None):
+        # qna_core와 같은 방식으로 프롬프트에 넣을 대화 기록을 정하고, 두 세션이 모두 제출될 때까지 답변을 미룸
+        _, _, history = conversation_context(query, memory)
+        with self.prompts_lock:
+            self.prompts.append(history)
+        self.release.wait(5)
+        yield "답변: " + " | ".join(message["content"] for message in history)
+
+    def ask_concurrently(self, query, memories):
+        backend = qna_backend.QnaBackend(workers=2, max_pending=4, timeout=5)
+        answers = [None] * len(memories)
+        with mock.patch.object(qna_backend, "generate_answer", self.fake_generate_answer):
+            streams = [backend.submit(query, memory=memory) for memory in memories]
+
+            def consume(i):
+                answers[i] = "".join(streams[i])
+
+            threads = [threading.Thread(target=consume, args=(i,)) for i in range(len(streams))]
+            for thread in threads:
+                thread.start()
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+        return backend.stats(), answers
+
+    def test_standalone_question_is_coalesced_without_session_history(self):
+        memories = [
+            make_memory("CMS 배포일자 알려줘", "3월 2일입니다."),
+            make_memory("에어맵 장애 이력 알려줘", "지난주 DB 장애가 있었습니다."),
+        ]
+        stats, answers = self.ask_concurrently("운영 서버 점검 절차가 어떻게 돼?", memories)
+
+        self.assertEqual(stats["coalesced"], 1)
+        self.assertEqual(self.prompts, [[]])
+        self.assertEqual(answers[0], answers[1])
+        self.assertNotIn("배포", answers[1])
+
+    def test_followup_questions_from_different_sessions_run_separately(self):
+        memories = [
+            make_memory("CMS 배포일자 알려줘", "3월 2일입니다."),
+            make_memory("에어맵 장애 이력 알려줘", "지난주 DB 장애가 있었습니다."),
+        ]
+        stats, answers = self.ask_concurrently("그럼 담당자는 누구야?", memories)
+
+        self.assertEqual(stats["coalesced"], 0)
+        self.assertEqual(len(self.prompts), 2)
+        self.assertIn("3월 2일", answers[0])
+        self.assertNotIn("3월 2일", answers[1])
+        self.assertIn("DB 장애", answers[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+import unittest
+
+from resilient_calls import CircuitBreaker, CircuitOpenError, ResilientCaller, RetryBudget
+
+
+def _fail():
+    raise ConnectionError("down")
+
+
+class ThrottledError(Exception):
+    """Retry-After 헤더가 있는 429 응답"""
+
+    status_code = 429
+
+    def __init__(self):
+        super().__init__("too many requests")
+        self.response = type("Response", (), {"headers": {"retry-after-ms": "1"}})()
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def make_open_caller(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+        caller = ResilientCaller("test.call", max_attempts=1, breaker=breaker, budget=RetryBudget())
+        with self.assertRaises(ConnectionError):
+            caller.call(_fail)
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.06)
+        return breaker, caller
+
+    def test_cancelled_half_open_probe_releases_slot(self):
+        breaker, caller = self.make_open_caller()
+
+        async def scenario():
+            started = asyncio.Event()
+
+            async def hang():
+                started.set()
+                await asyncio.sleep(10)
+
+            probe = asyncio.ensure_future(caller.call_async(hang))
+            await started.wait()
+            self.assertEqual(breaker.state, "half_open")
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+
+            # 취소된 시험 호출은 실패로 세지 않고, 다음 호출이 다시 시험할 수 있어야 함
+            async def ok():
+                return "ok"
+
+            return await caller.call_async(ok)
+
+        self.assertEqual(asyncio.run(scenario()), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_open_breaker_rejects_until_reset(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=60)
+        caller = ResilientCaller("test.call", max_attempts=1, breaker=breaker, budget=RetryBudget())
+        with self.assertRaises(ConnectionError):
+            caller.call(_fail)
+        with self.assertRaises(CircuitOpenError):
+            caller.call(lambda: "ok")
+
+    def test_throttled_calls_do_not_open_breaker_or_spend_budget(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+        budget = RetryBudget(minimum=0)
+        caller = ResilientCaller("test.call", max_attempts=5, breaker=breaker, budget=budget)
+        responses = iter([ThrottledError(), ThrottledError(), ThrottledError(), "ok"])
+
+        def throttled():
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(caller.call(throttled), "ok")
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(caller.stats()["retries"], 3)
+
+    def test_waiting_caller_retries_after_breaker_resets(self):
+        breaker, _ = self.make_open_caller()
+        breaker.reset_seconds = 0.1
+        breaker.record_failure()
+        caller = ResilientCaller("test.ingest", max_attempts=1, base_delay=0.01, breaker=breaker,
+                                 budget=RetryBudget(), wait_for_circuit=True)
+        self.assertEqual(caller.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.state, "closed")
+        self.assertGreater(caller.stats()["circuit_waits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import re
+
+# tiktoken이 설치되어 있으면 정확한 토큰 수를, 없으면 글자 종류별 근사치를 사용
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+_HANGUL_PATTERN = re.compile(r"[가-힣ㄱ-ㆎ]")
+_ASCII_PATTERN = re.compile(r"[\x00-\x7f]")
+
+
+def count_tokens(text):
+    """
+    텍스트의 토큰 수를 반환합니다.
+    tiktoken이 없을 때는 한글 1글자 ≈ 1토큰, ASCII 4글자 ≈ 1토큰으로 넉넉하게 추정합니다.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+
+    hangul = len(_HANGUL_PATTERN.findall(text))
+    ascii_chars = len(_ASCII_PATTERN.findall(text))
+    others = len(text) - hangul - ascii_chars
+    return hangul + others + (ascii_chars + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    """텍스트를 앞에서부터 max_tokens 토큰 이내로 자름"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    # 근사치 모드에서는 토큰 비율만큼 글자를 남기고, 넘치면 조금씩 더 줄임
+    cut = len(text) * max_tokens // total
+    while cut > 0 and count_tokens(text[:cut]) > max_tokens:
+        cut = cut * 9 // 10
+    return text[:cut]
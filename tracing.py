@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(".cache", "traces", "spans.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))  # 파일 하나의 최대 크기, 넘으면 다음 파일로 교체
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "3"))  # 보관할 이전 파일 수 (spans.jsonl.1 ~ .3)
+TRACE_RECENT = int(os.getenv("TRACE_RECENT", "200"))  # 지연 통계에 사용할 최근 요청 수 (메모리)
+
+TOKEN_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "embedding_tokens")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_recent = deque(maxlen=TRACE_RECENT)
+_recent_lock = threading.Lock()
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Span:
+    """
+    요청 처리 단계 하나의 소요 시간과 속성.
+    루트 span(요청 전체)은 끝날 때까지 하위 span의 단계별 시간과 토큰 수를 모아 최근 요청 통계에 남깁니다.
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self.duration = None
+        self._started_at = time.perf_counter()
+        self._stages = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add_tokens(self, key, count):
+        self.attributes[key] = self.attributes.get(key, 0) + int(count or 0)
+
+    def _collect(self, span):
+        with self._lock:
+            self._stages[span.name] = self._stages.get(span.name, 0.0) + span.duration
+            for key in TOKEN_ATTRIBUTES:
+                if key in span.attributes:
+                    self._tokens[key] = self._tokens.get(key, 0) + span.attributes[key]
+            if span.attributes.get("tokens_estimated"):
+                self._tokens["estimated"] = True
+
+
+class _NoopSpan:
+    """추적을 끄거나 진행 중인 span이 없을 때 사용하는 빈 span"""
+
+    def set(self, key, value):
+        pass
+
+    def add_tokens(self, key, count):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _get_logger():
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            directory = os.path.dirname(TRACE_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = RotatingFileHandler(TRACE_PATH, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger = logging.getLogger("airmap.tracing")
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+            _logger.addHandler(handler)
+        return _logger
+
+
+def use_separate_trace_file(label):
+    """
+    이 프로세스의 span을 TRACE_PATH 대신 이름에 label을 붙인 파일에 기록합니다 (spans.jsonl → spans.worker1.jsonl).
+    RotatingFileHandler는 여러 프로세스가 같은 파일을 교체하면 줄이 섞이거나 사라지므로 수집 워커 프로세스마다 호출합니다.
+    """
+    global TRACE_PATH, _logger
+    root, ext = os.path.splitext(TRACE_PATH)
+    with _logger_lock:
+        TRACE_PATH = f"{root}.{label}{ext}"
+        if _logger is not None:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+                handler.close()
+            _logger = None
+
+
+def _export(span):
+    # OpenTelemetry span과 같은 필드 이름을 쓰는 JSON 한 줄 (수집기로 옮기기 쉽도록)
+    record = {
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_span_id": span.parent.span_id if span.parent else None,
+        "name": span.name,
+        "start_time_unix_nano": int(span.start_time * 1e9),
+        "end_time_unix_nano": int((span.start_time + span.duration) * 1e9),
+        "duration_ms": round(span.duration * 1000, 3),
+        "status": span.status,
+        "attributes": span.attributes,
+    }
+    try:
+        _get_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    except OSError as e:
+        print(f"추적 기록 실패: {e}")
+
+
+def _finish(span):
+    span.duration = time.perf_counter() - span._started_at
+    _export(span)
+    if span.root is not span:
+        span.root._collect(span)
+        return
+
+    stages = dict(span._stages)
+    tokens = dict(span._tokens)
+    for key in TOKEN_ATTRIBUTES:
+        if key in span.attributes:
+            tokens[key] = tokens.get(key, 0) + span.attributes[key]
+    with _recent_lock:
+        _recent.append({
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "start_time": span.start_time,
+            "duration": span.duration,
+            "status": span.status,
+            "stages": stages,
+            "tokens": tokens,
+        })
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    with 블록을 span 하나로 기록합니다. 진행 중인 span이 있으면 그 하위 span이 됩니다.
+    블록에서 예외가 나면 status="error"로 기록하고 예외는 그대로 전달합니다.
+    """
+    if not TRACE_ENABLED:
+        yield _NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except (GeneratorExit, asyncio.CancelledError):
+        # 스트리밍 답변을 끝까지 읽지 않고 닫았거나 (답변 캐시 적중 등으로) 검색 작업이 취소된 경우
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.status = "error"
+        current.set("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # 제너레이터가 만든 span이 다른 컨텍스트에서 닫힌 경우
+            _current_span.set(parent)
+        _finish(current)
+
+
+def current_span():
+    """진행 중인 span (없으면 아무것도 기록하지 않는 빈 span)"""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def bind_context(func):
+    """
+    다른 스레드에서 실행할 함수가 현재 span을 부모로 쓰도록 호출 시점의 컨텍스트를 묶습니다.
+    (ThreadPoolExecutor는 컨텍스트 변수를 작업 스레드로 넘기지 않음)
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return run
+
+
+def set_token_usage(target, usage=None, prompt=None, completion=None):
+    """
+    API 응답의 usage를 target span에 기록하고 기록한 값을 dict로 반환합니다.
+    usage가 없으면 (스트림 usage를 지원하지 않는 API 버전 등) 프롬프트와 답변 텍스트로 토큰 수를 추정합니다.
+    """
+    if usage:
+        recorded = {"prompt_tokens": _usage_value(usage, "prompt_tokens"),
+                    "completion_tokens": _usage_value(usage, "completion_tokens"), "tokens_estimated": False}
+    elif prompt is None and completion is None:
+        return {}
+    else:
+        from token_counter import count_tokens
+
+        recorded = {"prompt_tokens": count_tokens(prompt or ""), "completion_tokens": count_tokens(completion or ""),
+                    "tokens_estimated": True}
+        target.set("tokens_estimated", True)
+    target.add_tokens("prompt_tokens", recorded["prompt_tokens"])
+    target.add_tokens("completion_tokens", recorded["completion_tokens"])
+    return recorded
+
+
+def _usage_value(usage, key):
+    return usage.get(key, 0) if isinstance(usage, dict) else getattr(usage, key, 0)
+
+
+def recent_traces(name=None):
+    """최근 요청(루트 span) 요약 목록, name을 주면 해당 이름의 요청만"""
+    with _recent_lock:
+        traces = list(_recent)
+    return [trace for trace in traces if name is None or trace["name"] == name]
+
+
+def percentile(values, percent):
+    """nearest-rank 방식 백분위수"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def stage_percentiles(name=None):
+    """최근 요청의 단계별 p50/p95 소요 시간(초). 'total'은 요청 전체 시간"""
+    traces = recent_traces(name)
+    if not traces:
+        return {}
+    samples = {"total": [trace["duration"] for trace in traces]}
+    for trace in traces:
+        for stage, seconds in trace["stages"].items():
+            samples.setdefault(stage, []).append(seconds)
+    return {
+        stage: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+        for stage, values in samples.items()
+    }
+
+
+def token_usage(name=None):
+    """최근 요청의 토큰 사용량 합계"""
+    traces = recent_traces(name)
+    usage = {"requests": len(traces), "estimated": False}
+    for key in TOKEN_ATTRIBUTES:
+        usage[key] = sum(trace["tokens"].get(key, 0) for trace in traces)
+    usage["estimated"] = any(trace["tokens"].get("estimated") for trace in traces)
+    return usage